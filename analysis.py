@@ -0,0 +1,72 @@
+import json
+import hashlib
+from datetime import datetime
+
+import db
+
+# 性别、VIP和用户等级的固定分类（保证图表在没有数据时也有完整的坐标）
+GENDERS = ("男", "女", "保密")
+VIP_VALUES = ("是", "否")
+USER_LEVELS = range(0, 7)
+
+# 读取缓存结果的查询
+CACHED_QUERY = "SELECT payload FROM analysis_cache WHERE crawl_id = ? AND kind = ? AND filter_hash = ?"
+
+# 筛选条件和爬取记录版本（comment_filters.count_cache_version）的哈希，作为分析结果缓存的键；
+# 计算期间记录被增量爬取改变时，结果存在旧版本的键下，不会被之后的请求读到
+def filter_hash(where_clause: str, query_params, version=None) -> str:
+    raw = json.dumps([where_clause, list(query_params), version], ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+# 读取已缓存的分析结果，没有时返回None
+def get_cached(conn, crawl_id: int, kind: str, key: str):
+    row = conn.execute(CACHED_QUERY, (crawl_id, kind, key)).fetchone()
+    return json.loads(row["payload"]) if row else None
+
+# 保存分析结果（只对已完成的爬取记录调用，键中包含记录版本，评论追加后不再命中）
+def store_cached(conn, crawl_id: int, kind: str, key: str, payload):
+    with db.transaction(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO analysis_cache (crawl_id, kind, filter_hash, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (crawl_id, kind, key, json.dumps(payload, ensure_ascii=False), datetime.now())
+        )
+
+# 爬取记录的评论发生变化（删除、追加）时清除其分析缓存
+def invalidate_analysis_cache(conn, crawl_id: int):
+    conn.execute("DELETE FROM analysis_cache WHERE crawl_id = ?", (crawl_id,))
+
+# 计算评论的性别、小时、VIP和等级分布，一次扫描按四个维度分组后在内存中汇总
+def compute_comment_stats(conn, from_clause: str, where_clause: str, query_params) -> dict:
+    gender = dict.fromkeys(GENDERS, 0)
+    hours = [0] * 24
+    vip = dict.fromkeys(VIP_VALUES, 0)
+    levels = {str(level): 0 for level in USER_LEVELS}
+    total = 0
+
+    rows = conn.execute(f"""
+    SELECT comments.gender, CAST(substr(comments.comment_time, 12, 2) AS INTEGER) AS hour,
+           comments.is_vip, comments.user_level, COUNT(*) AS count
+    FROM {from_clause}
+    WHERE {where_clause}
+    GROUP BY 1, 2, 3, 4
+    """, query_params)
+    for row in rows:
+        count = row["count"]
+        total += count
+        if row["gender"] in gender:
+            gender[row["gender"]] += count
+        if row["hour"] is not None and 0 <= row["hour"] < 24:
+            hours[row["hour"]] += count
+        if row["is_vip"] in vip:
+            vip[row["is_vip"]] += count
+        if str(row["user_level"]) in levels:
+            levels[str(row["user_level"])] += count
+
+    return {
+        "total": total,
+        "gender": gender,
+        "hours": hours,
+        "vip": vip,
+        "levels": levels,
+    }
+
@@ -1,19 +1,27 @@
-import re
-import requests
 import json
+import time
+import asyncio
 from urllib.parse import quote
 import pandas as pd
-import hashlib
-import urllib
-import time
-import csv
-import sqlite3
 from datetime import datetime
 from typing import Optional, List, Dict, Any
-from fastapi import FastAPI, Query, HTTPException, BackgroundTasks, Depends
+from fastapi import FastAPI, Query, HTTPException, Depends, Request
 from pydantic import BaseModel, Field
 from fastapi.middleware.cors import CORSMiddleware
-from user_api import router as user_router, get_current_user, init_user_db
+from fastapi.responses import StreamingResponse
+import db
+import migrations
+import analysis
+import keywords
+import exporter
+import video_info
+import wbi
+import scheduler
+import progress
+from comment_filters import COMMENTS_SOURCE, COMMENT_COLUMNS, build_comment_filters, comment_order, count_query, page_query, after_cursor, count_comments, count_cache_version, invalidate_count_cache, encode_cursor, decode_cursor
+from cookie_pool import cookie_pool
+from user_api import router as user_router, get_current_user, init_user_db, user_cache_stats, mail_outbox, shutdown_workers as shutdown_user_workers
+from crawler import close_http_client, write_stats, rate_limiter
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -31,309 +39,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 初始化数据库
+# 初始化数据库（执行未完成的结构迁移）
 def init_db():
-    conn = sqlite3.connect('bilibili_CH.db')
-    cursor = conn.cursor()
-    
-    # 创建爬取记录表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS crawl_records (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        bv TEXT NOT NULL,
-        title TEXT NOT NULL,
-        mode INTEGER NOT NULL,
-        is_second BOOLEAN NOT NULL,
-        comment_count INTEGER NOT NULL,
-        start_time TIMESTAMP NOT NULL,
-        end_time TIMESTAMP,
-        status TEXT NOT NULL,
-        user_id INTEGER
-    )
-    ''')
-    
-    # 创建评论表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS comments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        crawl_id INTEGER NOT NULL,
-        comment_index INTEGER NOT NULL,
-        parent_id INTEGER NOT NULL,
-        comment_id INTEGER NOT NULL,
-        user_id INTEGER NOT NULL,
-        username TEXT NOT NULL,
-        user_level INTEGER NOT NULL,
-        gender TEXT NOT NULL,
-        content TEXT NOT NULL,
-        comment_time TIMESTAMP NOT NULL,
-        reply_count INTEGER NOT NULL,
-        like_count INTEGER NOT NULL,
-        signature TEXT,
-        ip_location TEXT,
-        is_vip TEXT,
-        avatar TEXT,
-        FOREIGN KEY (crawl_id) REFERENCES crawl_records (id)
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    migrations.migrate()
 
 # 初始化数据库
 init_db()
 init_user_db()
 
-# 获取B站Header
-def get_Header():
-    try:
-        with open('bili_cookie.txt', 'r') as f:
-            cookie = f.read()
-        header = {
-            "Cookie": cookie,
-            "User-Agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36 Edg/134.0.0.0'
-        }
-    except:
-        header = {
-            "User-Agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36 Edg/134.0.0.0'
-        }
-    return header
-
-# 通过BV号获取视频OID和标题
-def get_information(bv):
-    resp = requests.get(f"https://www.bilibili.com/video/{bv}/?p=14&spm_id_from=pageDriver&vd_source=cd6ee6b033cd2da64359bad72619ca8a", headers=get_Header())
-    # 提取视频oid
-    obj = re.compile(f'"aid":(?P<id>.*?),"bvid":"{bv}"')
-    oid = obj.search(resp.text).group('id')
-
-    # 提取视频的标题
-    obj = re.compile(r'<title data-vue-meta="true">(?P<title>.*?)</title>')
-    try:
-        title = obj.search(resp.text).group('title')
-    except:
-        title = "未识别"
-
-    return oid, title
-
-# MD5加密
-def md5(code):
-    MD5 = hashlib.md5()
-    MD5.update(code.encode('utf-8'))
-    w_rid = MD5.hexdigest()
-    return w_rid
-
-# 爬取评论并存储到数据库
-def crawl_comments(crawl_id, bv, oid, next_pageID, count, is_second, mode, limit_num=300):
-    conn = sqlite3.connect('bilibili_CH.db')
-    cursor = conn.cursor()
-    
-    # 更新爬取状态为进行中
-    cursor.execute("UPDATE crawl_records SET status = ? WHERE id = ?", ("进行中", crawl_id))
-    conn.commit()
-    
-    try:
-        # 参数
-        plat = 1
-        type = 1  
-        sort = mode  # 2是最新评论，3是热门评论
-        ps = 20  # 每页显示的评论数量
-        page_num = 1  # 当前页码，初始为1
-        web_location = 1315875
-        
-        # 爬取评论
-        while True:
-            # 获取当下时间戳
-            wts = int(time.time())
-            
-            # 如果不是第一页或有下一页ID
-            if next_pageID != "":
-                pagination_str = '{"offset":"%s"}' % next_pageID
-                code = f"mode={sort}&oid={oid}&pagination_str={urllib.parse.quote(pagination_str)}&plat={plat}&type={type}&web_location={web_location}&wts={wts}" + 'ea1db124af3c7062474693fa704f4ff8'
-                w_rid = md5(code)
-                url = f"https://api.bilibili.com/x/v2/reply/wbi/main?oid={oid}&type={type}&mode={sort}&pagination_str={urllib.parse.quote(pagination_str, safe=':')}&plat=1&web_location={web_location}&w_rid={w_rid}&wts={wts}"
-            # 如果是第一页
-            else:
-                pagination_str = '{"offset":""}'
-                code = f"mode={sort}&oid={oid}&pagination_str={urllib.parse.quote(pagination_str)}&plat={plat}&seek_rpid=&type={type}&web_location={web_location}&wts={wts}" + 'ea1db124af3c7062474693fa704f4ff8'
-                w_rid = md5(code)
-                url = f"https://api.bilibili.com/x/v2/reply/wbi/main?oid={oid}&type={type}&mode={sort}&pagination_str={urllib.parse.quote(pagination_str, safe=':')}&plat=1&seek_rpid=&web_location={web_location}&w_rid={w_rid}&wts={wts}"
-            
-            # 发送请求
-            comment = requests.get(url=url, headers=get_Header()).content.decode('utf-8')
-            comment = json.loads(comment)
-            
-            # 如果没有评论数据，则退出循环
-            if 'data' not in comment or 'replies' not in comment['data'] or not comment['data']['replies']:
-                break
-            
-            # 遍历评论
-            for reply in comment['data']['replies']:
-                # 评论数量+1
-                count += 1
-                
-                if count > limit_num:
-                    break
-                
-                # 提取评论数据
-                parent = reply["parent"]
-                rpid = reply["rpid"]
-                uid = reply["mid"]
-                name = reply["member"]["uname"]
-                level = reply["member"]["level_info"]["current_level"]
-                sex = reply["member"]["sex"]
-                avatar = reply["member"]["avatar"]
-                
-                # 是否是大会员
-                if reply["member"]["vip"]["vipStatus"] == 0:
-                    vip = "否"
-                else:
-                    vip = "是"
-                    
-                # IP属地
-                try:
-                    IP = reply["reply_control"]['location'][5:]
-                except:
-                    IP = "未知"
-                    
-                # 内容
-                context = reply["content"]["message"]
-                
-                # 评论时间
-                reply_time = datetime.fromtimestamp(reply["ctime"])
-                
-                # 相关回复数
-                try:
-                    rereply = reply["reply_control"]["sub_reply_entry_text"]
-                    rereply = int(re.findall(r'\d+', rereply)[0])
-                except:
-                    rereply = 0
-                    
-                # 点赞数
-                like = reply['like']
-                
-                # 个性签名
-                try:
-                    sign = reply['member']['sign']
-                except:
-                    sign = ''
-                
-                # 存储评论到数据库
-                cursor.execute("""
-                INSERT INTO comments (crawl_id, comment_index, parent_id, comment_id, user_id, username, user_level, gender, content, comment_time, reply_count, like_count, signature, ip_location, is_vip, avatar)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (crawl_id, count, parent, rpid, uid, name, level, sex, context, reply_time, rereply, like, sign, IP, vip, avatar))
-                
-                # 二级评论(如果开启了二级评论爬取，且该评论回复数不为0，则爬取该评论的二级评论)
-                if is_second and rereply != 0 and count < limit_num:
-                    for page in range(1, rereply//10+2):
-                        second_url = f"https://api.bilibili.com/x/v2/reply/reply?oid={oid}&type=1&root={rpid}&ps=10&pn={page}&web_location=333.788"
-                        second_comment = requests.get(url=second_url, headers=get_Header()).content.decode('utf-8')
-                        second_comment = json.loads(second_comment)
-                        
-                        if 'data' not in second_comment or 'replies' not in second_comment['data'] or not second_comment['data']['replies']:
-                            break
-                            
-                        for second in second_comment['data']['replies']:
-                            # 评论数量+1
-                            count += 1
-                            
-                            if count > limit_num:
-                                break
-                                
-                            # 提取二级评论数据
-                            parent = second["parent"]
-                            second_rpid = second["rpid"]
-                            uid = second["mid"]
-                            name = second["member"]["uname"]
-                            level = second["member"]["level_info"]["current_level"]
-                            sex = second["member"]["sex"]
-                            avatar = second["member"]["avatar"]
-                            
-                            # 是否是大会员
-                            if second["member"]["vip"]["vipStatus"] == 0:
-                                vip = "否"
-                            else:
-                                vip = "是"
-                                
-                            # IP属地
-                            try:
-                                IP = second["reply_control"]['location'][5:]
-                            except:
-                                IP = "未知"
-                                
-                            # 内容
-                            context = second["content"]["message"]
-                            
-                            # 评论时间
-                            reply_time = datetime.fromtimestamp(second["ctime"])
-                            
-                            # 相关回复数
-                            try:
-                                rereply = second["reply_control"]["sub_reply_entry_text"]
-                                rereply = int(re.findall(r'\d+', rereply)[0])
-                            except:
-                                rereply = 0
-                                
-                            # 点赞数
-                            like = second['like']
-                            
-                            # 个性签名
-                            try:
-                                sign = second['member']['sign']
-                            except:
-                                sign = ''
-                            
-                            # 存储二级评论到数据库
-                            cursor.execute("""
-                            INSERT INTO comments (crawl_id, comment_index, parent_id, comment_id, user_id, username, user_level, gender, content, comment_time, reply_count, like_count, signature, ip_location, is_vip, avatar)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """, (crawl_id, count, parent, second_rpid, uid, name, level, sex, context, reply_time, rereply, like, sign, IP, vip, avatar))
-                            
-                            conn.commit()
-                            
-                            if count >= limit_num:
-                                break
-                        
-                        if count >= limit_num:
-                            break
-                
-                conn.commit()
-                
-                if count >= limit_num:
-                    break
-            
-            # 下一页的pageID
-            try:
-                next_pageID = comment['data']['cursor']['pagination_reply']['next_offset']
-            except:
-                next_pageID = 0
-            
-            # 增加页码
-            page_num += 1
-            
-            # 如果不是最后一页，则停0.5s（避免反爬机制）
-            if next_pageID != 0 and count < limit_num:
-                time.sleep(0.5)
-                
-            if count >= limit_num:
-                break
-            
-            # 如果next_pageID为0，说明已经没有下一页了
-            if next_pageID == 0:
-                break
-        
-        # 更新爬取记录状态为完成
-        cursor.execute("UPDATE crawl_records SET status = ?, end_time = ?, comment_count = ? WHERE id = ?", 
-                      ("完成", datetime.now(), count, crawl_id))
-        conn.commit()
-        
-    except Exception as e:
-        # 更新爬取记录状态为失败
-        cursor.execute("UPDATE crawl_records SET status = ?, end_time = ? WHERE id = ?", 
-                      (f"失败: {str(e)}", datetime.now(), crawl_id))
-        conn.commit()
-    finally:
-        conn.close()
-
 # 定义请求模型
 class CrawlRequest(BaseModel):
     bv: str = Field(..., description="B站视频的BV号")
@@ -341,6 +54,20 @@ class CrawlRequest(BaseModel):
     is_second: bool = Field(True, description="是否爬取二级评论")
     mode: int = Field(3, description="评论模式：2为最新评论，3为热门评论")
     limit_num: int = Field(300, description="爬取评论的数量上限，默认300，最大1000", ge=1, le=1000)
+    incremental: bool = Field(False, description="增量爬取：只抓取该视频上次爬取之后的新评论，追加到最近一次的爬取记录")
+    priority: int = Field(scheduler.DEFAULT_PRIORITY, description="任务优先级，数值越大越先执行；普通用户最高为0，只有管理员可以提高优先级", ge=-10, le=10)
+
+# 批量爬取配置
+BATCH_MAX_BVS = 200  # 单次批量提交的视频数上限
+BATCH_RESOLVE_CONCURRENCY = 8  # 批量提交时同时解析视频信息的数量（请求仍受全局限速控制）
+
+class CrawlBatchRequest(BaseModel):
+    bvs: List[str] = Field(..., description="B站视频的BV号列表（重复的BV号只爬取一次）", min_length=1, max_length=BATCH_MAX_BVS)
+    name: Optional[str] = Field(None, description="分组名称，例如关注列表的名称", max_length=100)
+    is_second: bool = Field(True, description="是否爬取二级评论")
+    mode: int = Field(3, description="评论模式：2为最新评论，3为热门评论")
+    limit_num: int = Field(300, description="每个视频爬取评论的数量上限，默认300，最大1000", ge=1, le=1000)
+    priority: int = Field(scheduler.DEFAULT_PRIORITY, description="任务优先级，数值越大越先执行；普通用户最高为0，只有管理员可以提高优先级", ge=-10, le=10)
 
 # 定义响应模型
 class CrawlResponse(BaseModel):
@@ -350,83 +77,319 @@ class CrawlResponse(BaseModel):
     status: str
     message: str
 
+class CrawlBatchResponse(BaseModel):
+    group_id: int
+    total: int
+    records: List[CrawlResponse]
+    failed: List[Dict[str, str]]
+    message: str
+
+# 爬取记录和分组的查询（migrations.query_plan_checks 检查这些语句的执行计划）
+INCREMENTAL_RECORD_QUERY = """
+SELECT id, status FROM crawl_records
+WHERE user_id = ? AND (oid = ? OR (oid IS NULL AND bv = ?))
+ORDER BY start_time DESC LIMIT 1
+"""
+ADMIN_CRAWL_RECORDS_QUERY = """
+SELECT cr.id, cr.bv, cr.title, cr.mode, cr.is_second, cr.comment_count, cr.start_time, cr.end_time, cr.status, u.username 
+FROM crawl_records cr
+LEFT JOIN users u ON cr.user_id = u.id
+ORDER BY cr.start_time DESC
+"""
+USER_CRAWL_RECORDS_QUERY = """
+SELECT id, bv, title, mode, is_second, comment_count, start_time, end_time, status 
+FROM crawl_records 
+WHERE user_id = ?
+ORDER BY start_time DESC
+"""
+ADMIN_CRAWL_GROUPS_QUERY = """
+SELECT g.id, g.name, g.total, g.created_at, u.username FROM crawl_groups g
+LEFT JOIN users u ON g.user_id = u.id
+ORDER BY g.created_at DESC
+"""
+USER_CRAWL_GROUPS_QUERY = "SELECT id, name, total, created_at FROM crawl_groups WHERE user_id = ? ORDER BY created_at DESC"
+GROUP_RECORDS_QUERY = "SELECT id, bv, title, comment_count, status FROM crawl_records WHERE group_id = ? ORDER BY id"
+DELETE_COMMENTS_QUERY = "DELETE FROM comments WHERE crawl_id = ?"
+
 # 添加用户路由
 app.include_router(user_router)
 
+# 应用启动时恢复中断的爬取任务并启动任务调度器
+@app.on_event("startup")
+async def start_scheduler():
+    await scheduler.start()
+
+# 应用关闭时停止任务调度器，释放共享的HTTP连接池和数据库连接
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    await scheduler.stop()
+    await close_http_client()
+    keywords.shutdown_executor()
+    shutdown_user_workers()
+    db.shutdown_pool()
+    db.close_all()
+
+# 服务健康状态与运行统计
+@app.get("/api/health")
+async def health():
+    return {
+        "status": "ok",
+        "database": db.stats(),
+        "crawler": {
+            "rows_written": write_stats["rows"],
+            "rows_per_second": write_stats["rows"] / write_stats["seconds"] if write_stats["seconds"] else 0.0
+        },
+        "export": exporter.export_stats,
+        "video_cache": video_info.cache_stats,
+        "cookies": cookie_pool.stats(),
+        "rate_limit": rate_limiter.metrics(),
+        "wbi": wbi.key_stats(),
+        "user_cache": user_cache_stats,
+        "mail": mail_outbox.stats,
+        "scheduler": scheduler.dispatch_stats,
+        "progress": progress.progress_bus.stats
+    }
+
 # API路由
 @app.post("/api/crawl", response_model=CrawlResponse)
-async def crawl_comments_api(request: CrawlRequest, background_tasks: BackgroundTasks, current_user: dict = Depends(get_current_user)):
+async def crawl_comments_api(request: CrawlRequest, current_user: dict = Depends(get_current_user)):
     # 验证参数
     if request.limit_num > 1000:
         request.limit_num = 1000
+    if current_user["level"] != 2:
+        request.priority = min(request.priority, scheduler.MAX_USER_PRIORITY)
     
     try:
-        # 获取视频信息
-        oid, title = get_information(request.bv)
+        # 获取视频信息（优先读取缓存）
+        try:
+            video = await video_info.resolve_video(request.bv)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        oid, title = video["oid"], video["title"]
         
-        # 创建爬取记录
-        conn = sqlite3.connect('bilibili_CH.db')
-        cursor = conn.cursor()
+        # 数据库操作在数据库线程池中执行，任务入队后通知调度器
+        response = await db.run(_start_crawl, request, current_user, oid, title)
+        scheduler.wake()
+        return response
         
-        cursor.execute("""
-        INSERT INTO crawl_records (bv, title, mode, is_second, comment_count, start_time, status, user_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (request.bv, title, request.mode, request.is_second, 0, datetime.now(), "等待中", current_user["id"]))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 创建（或增量爬取时复用）爬取记录，并在同一事务中加入爬取任务队列
+def _start_crawl(request: CrawlRequest, current_user: dict, oid, title) -> CrawlResponse:
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    
+    # 增量爬取：追加到该用户最近一次爬取同一视频的记录
+    if request.incremental:
+        cursor.execute(INCREMENTAL_RECORD_QUERY, (current_user["id"], str(oid), request.bv))
+        record = cursor.fetchone()
         
-        conn.commit()
+        if record:
+            if record["status"] in ("进行中", "等待中"):
+                raise HTTPException(status_code=400, detail="该视频的爬取任务正在进行中")
+            
+            with db.transaction(conn):
+                conn.execute("UPDATE crawl_records SET status = ?, title = ?, limit_num = ? WHERE id = ?",
+                             ("等待中", title, request.limit_num, record["id"]))
+                scheduler.enqueue(conn, record["id"], current_user["id"], "incremental", {
+                    "oid": str(oid), "is_second": request.is_second, "limit_num": request.limit_num
+                }, request.priority)
+            
+            return CrawlResponse(
+                crawl_id=record["id"],
+                bv=request.bv,
+                title=title,
+                status="已加入增量爬取队列",
+                message="增量爬取任务已加入队列，新评论将追加到该爬取记录"
+            )
+        
+        # 没有爬取过该视频时按最新评论完整爬取，之后的增量爬取以此为基准
+        request.mode = 2
+    
+    # 创建爬取记录并加入任务队列
+    with db.transaction(conn):
+        cursor.execute("""
+        INSERT INTO crawl_records (bv, title, mode, is_second, comment_count, start_time, status, user_id, oid, limit_num)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (request.bv, title, request.mode, request.is_second, 0, datetime.now(), "等待中", current_user["id"], str(oid),
+              request.limit_num))
         crawl_id = cursor.lastrowid
-        conn.close()
-        
-        # 在后台任务中执行爬取
-        background_tasks.add_task(
-            crawl_comments, 
-            crawl_id, 
-            request.bv, 
-            oid, 
-            request.next_pageID, 
-            0, 
-            request.is_second, 
-            request.mode, 
-            request.limit_num
-        )
+        scheduler.enqueue(conn, crawl_id, current_user["id"], "full", {
+            "bv": request.bv, "oid": str(oid), "next_pageID": request.next_pageID,
+            "is_second": request.is_second, "mode": request.mode, "limit_num": request.limit_num
+        }, request.priority)
+    
+    return CrawlResponse(
+        crawl_id=crawl_id,
+        bv=request.bv,
+        title=title,
+        status="已加入爬取队列",
+        message="爬取任务已加入队列，将按优先级和并发配额依次执行"
+    )
+
+# 批量爬取：并发解析视频信息，在一个事务中创建分组、爬取记录和爬取任务；
+# 无法解析的BV号在failed中返回，其余视频照常加入队列
+@app.post("/api/crawl/batch", response_model=CrawlBatchResponse)
+async def crawl_batch_api(request: CrawlBatchRequest, current_user: dict = Depends(get_current_user)):
+    if current_user["level"] != 2:
+        request.priority = min(request.priority, scheduler.MAX_USER_PRIORITY)
+    bvs = list(dict.fromkeys(bv.strip() for bv in request.bvs if bv.strip()))
+    if not bvs:
+        raise HTTPException(status_code=400, detail="BV号列表不能为空")
+    
+    try:
+        semaphore = asyncio.Semaphore(BATCH_RESOLVE_CONCURRENCY)
         
-        return CrawlResponse(
-            crawl_id=crawl_id,
-            bv=request.bv,
-            title=title,
-            status="已开始爬取",
-            message="爬取任务已在后台开始执行"
+        async def resolve(bv):
+            async with semaphore:
+                return await video_info.resolve_video(bv)
+        
+        results = await asyncio.gather(*(resolve(bv) for bv in bvs), return_exceptions=True)
+        videos, failed = [], []
+        for bv, result in zip(bvs, results):
+            if isinstance(result, Exception):
+                failed.append({"bv": bv, "error": str(result) or type(result).__name__})
+            else:
+                videos.append((bv, result))
+        if not videos:
+            raise HTTPException(status_code=400, detail="所有视频信息都无法获取：" + "；".join(item["error"] for item in failed[:5]))
+        
+        group_id, records = await db.run(_start_batch, request, current_user, videos)
+        scheduler.wake()
+        
+        return CrawlBatchResponse(
+            group_id=group_id,
+            total=len(records),
+            records=records,
+            failed=failed,
+            message=f"{len(records)}个视频的爬取任务已加入队列" + (f"，{len(failed)}个视频无法获取信息" if failed else "")
         )
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _start_batch(request: CrawlBatchRequest, current_user: dict, videos: list):
+    conn = db.get_connection()
+    records = []
+    with db.transaction(conn):
+        group_id = conn.execute(
+            "INSERT INTO crawl_groups (user_id, name, total, created_at) VALUES (?, ?, ?, ?)",
+            (current_user["id"], request.name, len(videos), datetime.now())
+        ).lastrowid
+        for bv, video in videos:
+            crawl_id = conn.execute("""
+            INSERT INTO crawl_records (bv, title, mode, is_second, comment_count, start_time, status, user_id, oid, group_id, limit_num)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (bv, video["title"], request.mode, request.is_second, 0, datetime.now(), "等待中",
+                  current_user["id"], str(video["oid"]), group_id, request.limit_num)).lastrowid
+            scheduler.enqueue(conn, crawl_id, current_user["id"], "full", {
+                "bv": bv, "oid": str(video["oid"]), "next_pageID": "",
+                "is_second": request.is_second, "mode": request.mode, "limit_num": request.limit_num
+            }, request.priority)
+            records.append(CrawlResponse(crawl_id=crawl_id, bv=bv, title=video["title"], status="已加入爬取队列", message=f"分组{group_id}"))
+    return group_id, records
+
+# 分组汇总：各状态的视频数、已爬取评论数、进度和整体状态（submitted为提交时的视频数，组内记录可能被删除）
+def _group_summary(group: dict, records: list) -> dict:
+    counts = {"等待中": 0, "进行中": 0, "完成": 0, "失败": 0}
+    for record in records:
+        status = record["status"] or ""
+        counts["失败" if status.startswith("失败") else status if status in counts else "等待中"] += 1
+    total = len(records)
+    finished = counts["完成"] + counts["失败"]
+    if total and counts["完成"] == total:
+        status = "完成"
+    elif total and finished == total:
+        status = "部分失败" if counts["完成"] else "失败"
+    elif counts["进行中"] or finished:
+        status = "进行中"
+    else:
+        status = "等待中"
+    return {
+        **group,
+        "submitted": group["total"],
+        "total": total,
+        "status": status,
+        "progress": round(finished / total, 4) if total else 1.0,
+        "counts": counts,
+        "comment_count": sum(record["comment_count"] or 0 for record in records),
+    }
+
+# 获取批量爬取分组列表（含汇总进度）
+@app.get("/api/crawl_groups")
+@db.in_pool
+def get_crawl_groups(current_user: dict = Depends(get_current_user)):
+    try:
+        conn = db.get_connection()
+        if current_user["level"] == 2:  # 管理员可以查看所有分组
+            groups = conn.execute(ADMIN_CRAWL_GROUPS_QUERY).fetchall()
+        else:
+            groups = conn.execute(USER_CRAWL_GROUPS_QUERY, (current_user["id"],)).fetchall()
+        
+        result = []
+        for group in groups:
+            records = conn.execute(GROUP_RECORDS_QUERY, (group["id"],)).fetchall()
+            result.append(_group_summary(dict(group), records))
+        return {"groups": result}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 获取批量爬取分组详情：汇总进度和组内每个视频的爬取记录
+@app.get("/api/crawl_groups/{group_id}")
+@db.in_pool
+def get_crawl_group_detail(group_id: int, current_user: dict = Depends(get_current_user)):
+    try:
+        conn = db.get_connection()
+        group = conn.execute("SELECT id, user_id, name, total, created_at FROM crawl_groups WHERE id = ?", (group_id,)).fetchone()
+        if not group:
+            raise HTTPException(status_code=404, detail="爬取分组不存在")
+        
+        # 检查用户是否有权限访问该分组
+        if current_user["level"] != 2 and group["user_id"] != current_user["id"]:  # 非管理员需要验证所有权
+            raise HTTPException(status_code=403, detail="您没有权限访问此爬取分组")
+        
+        records = [dict(row) for row in conn.execute(GROUP_RECORDS_QUERY, (group_id,))]
+        return {**_group_summary(dict(group), records), "records": records}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 爬取任务队列状态：排队/运行中任务数、并发配额、等待时间，以及当前用户自己的任务
+@app.get("/api/crawl/queue")
+@db.in_pool
+def get_crawl_queue(current_user: dict = Depends(get_current_user)):
+    try:
+        stats = scheduler.queue_stats(current_user["id"])
+        # 普通用户不显示其他用户的任务数
+        if current_user["level"] != 2:
+            stats["users"] = [item for item in stats["users"] if item["user_id"] == current_user["id"]]
+        return stats
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 获取爬取记录列表
 @app.get("/api/crawl_records")
-async def get_crawl_records(current_user: dict = Depends(get_current_user)):
+@db.in_pool
+def get_crawl_records(current_user: dict = Depends(get_current_user)):
     try:
-        conn = sqlite3.connect('bilibili_CH.db')
-        conn.row_factory = sqlite3.Row  # 启用字典形式返回结果
+        conn = db.get_connection()
         cursor = conn.cursor()
         
         # 根据用户权限级别获取爬取记录
         if current_user["level"] == 2:  # 管理员可以查看所有记录
-            cursor.execute("""
-            SELECT cr.id, cr.bv, cr.title, cr.mode, cr.is_second, cr.comment_count, cr.start_time, cr.end_time, cr.status, u.username 
-            FROM crawl_records cr
-            LEFT JOIN users u ON cr.user_id = u.id
-            ORDER BY cr.start_time DESC
-            """)
+            cursor.execute(ADMIN_CRAWL_RECORDS_QUERY)
         else:  # 普通用户只能查看自己的记录
-            cursor.execute("""
-            SELECT id, bv, title, mode, is_second, comment_count, start_time, end_time, status 
-            FROM crawl_records 
-            WHERE user_id = ?
-            ORDER BY start_time DESC
-            """, (current_user["id"],))
+            cursor.execute(USER_CRAWL_RECORDS_QUERY, (current_user["id"],))
         
         records = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         # 转换日期时间格式为字符串
         for record in records:
@@ -442,7 +405,8 @@ async def get_crawl_records(current_user: dict = Depends(get_current_user)):
 
 # 获取特定爬取记录的评论
 @app.get("/api/comments/{crawl_id}")
-async def get_comments(
+@db.in_pool
+def get_comments(
     crawl_id: int, 
     page: int = Query(1, ge=1), 
     page_size: int = Query(30, ge=10, le=100), 
@@ -458,108 +422,91 @@ async def get_comments(
     is_vip: str = None,
     start_time: str = None,
     end_time: str = None,
+    order_by: str = Query("index", description="排序方式：index按评论序号，relevance按关键词相关度"),
+    page_cursor: str = Query(None, alias="cursor", description="游标分页：传入上一页返回的next_cursor，首页传空字符串"),
+    with_total: bool = Query(False, description="游标分页时是否返回总数"),
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        conn = sqlite3.connect('bilibili_CH.db')
-        conn.row_factory = sqlite3.Row
+        conn = db.get_connection()
         cursor = conn.cursor()
         
+        cursor.execute("SELECT user_id, status, start_time, end_time, comment_count FROM crawl_records WHERE id = ?", (crawl_id,))
+        record = cursor.fetchone()
+        
         # 检查用户是否有权限访问该爬取记录
         if current_user["level"] != 2:  # 非管理员需要验证所有权
-            cursor.execute("SELECT user_id FROM crawl_records WHERE id = ?", (crawl_id,))
-            record = cursor.fetchone()
             if not record or record["user_id"] != current_user["id"]:
-                conn.close()
                 raise HTTPException(status_code=403, detail="您没有权限访问此爬取记录")
         
+        # 已完成的爬取记录评论不再变化，总数按记录版本缓存
+        count_version = count_cache_version(record)
+        
         # 构建查询条件
-        query_conditions = ["crawl_id = ?"] 
-        query_params = [crawl_id]
+        from_clause, where_clause, query_params, ranked = build_comment_filters(
+            conn, crawl_id,
+            username=username, keyword=keyword, gender=gender,
+            min_reply_count=min_reply_count, max_reply_count=max_reply_count,
+            min_like_count=min_like_count, max_like_count=max_like_count,
+            show_second_level=show_second_level, user_level=user_level, is_vip=is_vip,
+            start_time=start_time, end_time=end_time,
+            rank_by_relevance=order_by == "relevance"
+        )
         
-        # 添加用户名搜索条件
-        if username:
-            query_conditions.append("username LIKE ?")
-            query_params.append(f"%{username}%")
-            
-        # 添加关键词搜索条件
-        if keyword:
-            query_conditions.append("content LIKE ?")
-            query_params.append(f"%{keyword}%")
-            
-        # 添加性别筛选条件
-        if gender:
-            query_conditions.append("gender = ?")
-            query_params.append(gender)
-            
-        # 添加回复数筛选条件
-        if min_reply_count is not None:
-            query_conditions.append("reply_count >= ?")
-            query_params.append(min_reply_count)
-            
-        if max_reply_count is not None:
-            query_conditions.append("reply_count <= ?")
-            query_params.append(max_reply_count)
-            
-        # 添加点赞数筛选条件
-        if min_like_count is not None:
-            query_conditions.append("like_count >= ?")
-            query_params.append(min_like_count)
-            
-        if max_like_count is not None:
-            query_conditions.append("like_count <= ?")
-            query_params.append(max_like_count)
+        relevance = ranked and order_by == "relevance"
+        order_clause = comment_order(relevance)
+        
+        # 游标分页：按排序键定位，不使用OFFSET，总数可选
+        if page_cursor is not None:
+            count_where, count_params = where_clause, query_params
+            if page_cursor:
+                try:
+                    last = decode_cursor(page_cursor)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                if relevance and not isinstance(last.get("r"), (int, float)):
+                    raise HTTPException(status_code=400, detail="无效的分页游标")
+                where_clause, query_params = after_cursor(where_clause, query_params, last, relevance)
             
-        # 添加二级评论筛选条件
-        if show_second_level is not None:
-            if not show_second_level:
-                # 只显示一级评论
-                query_conditions.append("parent_id = 0")
-                
-        # 添加用户等级筛选条件
-        if user_level is not None:
-            query_conditions.append("user_level = ?")
-            query_params.append(user_level)
+            columns = f"{COMMENT_COLUMNS}, comments_fts.rank AS _rank" if relevance else COMMENT_COLUMNS
+            cursor.execute(page_query(from_clause, where_clause, order_clause, columns, by_cursor=True),
+                           query_params + [page_size + 1])
             
-        # 添加VIP筛选条件
-        if is_vip:
-            query_conditions.append("is_vip = ?")
-            query_params.append(is_vip)
+            comments = [dict(row) for row in cursor.fetchall()]
+            has_more = len(comments) > page_size
+            comments = comments[:page_size]
             
-        # 添加时间范围筛选条件
-        if start_time:
-            query_conditions.append("comment_time >= ?")
-            query_params.append(start_time)
+            next_cursor = None
+            if has_more:
+                last_comment = comments[-1]
+                sort_key = {"i": last_comment["comment_index"]}
+                if relevance:
+                    sort_key["r"] = last_comment["_rank"]
+                next_cursor = encode_cursor(sort_key)
+            for comment in comments:
+                comment.pop("_rank", None)
             
-        if end_time:
-            query_conditions.append("comment_time <= ?")
-            query_params.append(end_time)
-            
-
+            pagination = {
+                "page_size": page_size,
+                "next_cursor": next_cursor,
+                "has_more": has_more
+            }
+            if with_total:
+                pagination["total"] = count_comments(conn, crawl_id, from_clause, count_where, count_params, count_version)
             
-        # 构建WHERE子句
-        where_clause = " AND ".join(query_conditions)
+            return {"comments": comments, "pagination": pagination}
         
         # 获取总评论数
-        count_query = f"SELECT COUNT(*) as count FROM comments WHERE {where_clause}"
-        cursor.execute(count_query, query_params)
-        total_count = cursor.fetchone()["count"]
+        total_count = count_comments(conn, crawl_id, from_clause, where_clause, query_params, count_version)
         
         # 计算总页数
         total_pages = (total_count + page_size - 1) // page_size
         
         # 获取当前页的评论
         offset = (page - 1) * page_size
-        comments_query = f"""
-        SELECT * FROM comments 
-        WHERE {where_clause} 
-        ORDER BY comment_index 
-        LIMIT ? OFFSET ?
-        """
-        cursor.execute(comments_query, query_params + [page_size, offset])
+        cursor.execute(page_query(from_clause, where_clause, order_clause), query_params + [page_size, offset])
         
         comments = [dict(row) for row in cursor.fetchall()]
-        conn.close()
         
         # 转换日期时间格式为字符串
         for comment in comments:
@@ -576,15 +523,66 @@ async def get_comments(
             }
         }
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 跨爬取记录搜索评论（普通用户只搜索自己的爬取记录）
+@app.get("/api/search/comments")
+@db.in_pool
+def search_comments(
+    keyword: str = Query(..., min_length=1),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(30, ge=10, le=100),
+    search_signature: bool = Query(False, description="是否同时搜索个性签名"),
+    order_by: str = Query("relevance", description="排序方式：relevance按相关度，index按爬取记录和评论序号"),
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        
+        from_clause, where_clause, query_params, ranked = build_comment_filters(
+            conn, keyword=keyword, search_signature=search_signature,
+            rank_by_relevance=order_by == "relevance"
+        )
+        from_clause += " JOIN crawl_records cr ON cr.id = comments.crawl_id"
+        
+        # 普通用户只能搜索自己的记录
+        if current_user["level"] != 2:
+            where_clause += " AND cr.user_id = ?"
+            query_params.append(current_user["id"])
+        
+        cursor.execute(count_query(from_clause, where_clause), query_params)
+        total_count = cursor.fetchone()[0]
+        total_pages = (total_count + page_size - 1) // page_size
+        
+        order_clause = "comments_fts.rank" if ranked and order_by == "relevance" else "comments.crawl_id DESC, comments.comment_index"
+        cursor.execute(page_query(from_clause, where_clause, order_clause, f"{COMMENT_COLUMNS}, cr.bv, cr.title"),
+                       query_params + [page_size, (page - 1) * page_size])
+        
+        comments = [dict(row) for row in cursor.fetchall()]
+        
+        return {
+            "comments": comments,
+            "pagination": {
+                "total": total_count,
+                "page": page,
+                "page_size": page_size,
+                "total_pages": total_pages
+            }
+        }
+        
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 获取爬取记录详情
 @app.get("/api/crawl_records/{crawl_id}")
-async def get_crawl_record_detail(crawl_id: int, current_user: dict = Depends(get_current_user)):
+@db.in_pool
+def get_crawl_record_detail(crawl_id: int, current_user: dict = Depends(get_current_user)):
     try:
-        conn = sqlite3.connect('bilibili_CH.db')
-        conn.row_factory = sqlite3.Row
+        conn = db.get_connection()
         cursor = conn.cursor()
         
         # 检查用户是否有权限访问该爬取记录
@@ -592,7 +590,6 @@ async def get_crawl_record_detail(crawl_id: int, current_user: dict = Depends(ge
             cursor.execute("SELECT user_id FROM crawl_records WHERE id = ?", (crawl_id,))
             record = cursor.fetchone()
             if not record or record["user_id"] != current_user["id"]:
-                conn.close()
                 raise HTTPException(status_code=403, detail="您没有权限访问此爬取记录")
         
         # 获取爬取记录详情
@@ -612,7 +609,6 @@ async def get_crawl_record_detail(crawl_id: int, current_user: dict = Depends(ge
         
         record = cursor.fetchone()
         if not record:
-            conn.close()
             raise HTTPException(status_code=404, detail="爬取记录不存在")
             
         record_dict = dict(record)
@@ -623,17 +619,143 @@ async def get_crawl_record_detail(crawl_id: int, current_user: dict = Depends(ge
         if record_dict['end_time']:
             record_dict['end_time'] = record_dict['end_time']
         
-        conn.close()
         return record_dict
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 爬取记录的评论分布统计（性别、小时、VIP、等级及高回复/高点赞评论），筛选参数与评论列表一致
+@app.get("/api/crawl_records/{crawl_id}/stats")
+@db.in_pool
+def get_crawl_record_stats(
+    crawl_id: int,
+    username: str = None,
+    keyword: str = None,
+    gender: str = None,
+    min_reply_count: int = None,
+    max_reply_count: int = None,
+    min_like_count: int = None,
+    max_like_count: int = None,
+    show_second_level: bool = None,
+    user_level: int = None,
+    is_vip: str = None,
+    start_time: str = None,
+    end_time: str = None,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT user_id, status, start_time, end_time, comment_count FROM crawl_records WHERE id = ?", (crawl_id,))
+        record = cursor.fetchone()
+        if not record:
+            raise HTTPException(status_code=404, detail="爬取记录不存在")
+        
+        # 检查用户是否有权限访问该爬取记录
+        if current_user["level"] != 2 and record["user_id"] != current_user["id"]:  # 非管理员需要验证所有权
+            raise HTTPException(status_code=403, detail="您没有权限访问此爬取记录")
+        
+        from_clause, where_clause, query_params, _ = build_comment_filters(
+            conn, crawl_id,
+            username=username, keyword=keyword, gender=gender,
+            min_reply_count=min_reply_count, max_reply_count=max_reply_count,
+            min_like_count=min_like_count, max_like_count=max_like_count,
+            show_second_level=show_second_level, user_level=user_level, is_vip=is_vip,
+            start_time=start_time, end_time=end_time
+        )
+        
+        # 已完成的爬取记录评论不再变化，统计结果按记录版本缓存
+        version = count_cache_version(record)
+        cacheable = version is not None
+        cache_key = analysis.filter_hash(where_clause, query_params, version)
+        if cacheable:
+            stats = analysis.get_cached(conn, crawl_id, "stats", cache_key)
+            if stats is not None:
+                return {"crawl_id": crawl_id, "cached": True, **stats}
+        
+        stats = analysis.compute_comment_stats(conn, from_clause, where_clause, query_params)
+        if cacheable:
+            analysis.store_cached(conn, crawl_id, "stats", cache_key, stats)
+        
+        return {"crawl_id": crawl_id, "cached": False, **stats}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 爬取记录的高回复/高点赞评论词云（中文分词 + TF-IDF），筛选参数与评论列表一致
+@app.get("/api/crawl_records/{crawl_id}/keywords")
+@db.in_pool
+def get_crawl_record_keywords(
+    crawl_id: int,
+    top_k: int = Query(keywords.TOP_K, ge=10, le=200),
+    sample_limit: int = Query(keywords.SAMPLE_LIMIT, ge=1, le=keywords.MAX_SAMPLE_LIMIT, description="每个词云取回复数/点赞数最高的评论数"),
+    username: str = None,
+    keyword: str = None,
+    gender: str = None,
+    min_reply_count: int = None,
+    max_reply_count: int = None,
+    min_like_count: int = None,
+    max_like_count: int = None,
+    show_second_level: bool = None,
+    user_level: int = None,
+    is_vip: str = None,
+    start_time: str = None,
+    end_time: str = None,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT user_id, status, start_time, end_time, comment_count FROM crawl_records WHERE id = ?", (crawl_id,))
+        record = cursor.fetchone()
+        if not record:
+            raise HTTPException(status_code=404, detail="爬取记录不存在")
+        
+        # 检查用户是否有权限访问该爬取记录
+        if current_user["level"] != 2 and record["user_id"] != current_user["id"]:  # 非管理员需要验证所有权
+            raise HTTPException(status_code=403, detail="您没有权限访问此爬取记录")
+        
+        from_clause, where_clause, query_params, _ = build_comment_filters(
+            conn, crawl_id,
+            username=username, keyword=keyword, gender=gender,
+            min_reply_count=min_reply_count, max_reply_count=max_reply_count,
+            min_like_count=min_like_count, max_like_count=max_like_count,
+            show_second_level=show_second_level, user_level=user_level, is_vip=is_vip,
+            start_time=start_time, end_time=end_time
+        )
+        
+        # 已完成的爬取记录评论不再变化，词云结果按记录版本缓存
+        version = count_cache_version(record)
+        cacheable = version is not None
+        cache_key = analysis.filter_hash(where_clause, query_params + [top_k, sample_limit], version)
+        if cacheable:
+            words = analysis.get_cached(conn, crawl_id, "keywords", cache_key)
+            if words is not None:
+                return {"crawl_id": crawl_id, "cached": True, **words}
+        
+        words = keywords.compute_word_clouds(conn, from_clause, where_clause, query_params, top_k, sample_limit)
+        if cacheable:
+            analysis.store_cached(conn, crawl_id, "keywords", cache_key, words)
+        
+        return {"crawl_id": crawl_id, "cached": False, **words}
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 删除爬取记录
 @app.delete("/api/crawl_records/{crawl_id}")
-async def delete_crawl_record(crawl_id: int, current_user: dict = Depends(get_current_user)):
+@db.in_pool
+def delete_crawl_record(crawl_id: int, current_user: dict = Depends(get_current_user)):
     try:
-        conn = sqlite3.connect('bilibili_CH.db')
+        conn = db.get_connection()
         cursor = conn.cursor()
         
         # 检查用户是否有权限删除该爬取记录
@@ -641,32 +763,151 @@ async def delete_crawl_record(crawl_id: int, current_user: dict = Depends(get_cu
             cursor.execute("SELECT user_id FROM crawl_records WHERE id = ?", (crawl_id,))
             record = cursor.fetchone()
             if not record or record[0] != current_user["id"]:
-                conn.close()
                 raise HTTPException(status_code=403, detail="您没有权限删除此爬取记录")
         
-        # 删除相关评论
-        cursor.execute("DELETE FROM comments WHERE crawl_id = ?", (crawl_id,))
+        # 删除相关评论、断点和爬取任务
+        cursor.execute(DELETE_COMMENTS_QUERY, (crawl_id,))
+        cursor.execute("DELETE FROM crawl_checkpoints WHERE crawl_id = ?", (crawl_id,))
+        cursor.execute("DELETE FROM crawl_jobs WHERE crawl_id = ?", (crawl_id,))
+        invalidate_count_cache(crawl_id)
+        analysis.invalidate_analysis_cache(conn, crawl_id)
         
         # 删除爬取记录
         cursor.execute("DELETE FROM crawl_records WHERE id = ?", (crawl_id,))
         
         conn.commit()
-        conn.close()
         
         return {"message": "爬取记录及相关评论已成功删除"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 从断点继续爬取
+@app.post("/api/crawl_records/{crawl_id}/resume", response_model=CrawlResponse)
+@db.in_pool
+def resume_crawl_record(crawl_id: int, current_user: dict = Depends(get_current_user)):
+    try:
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT bv, title, status, user_id FROM crawl_records WHERE id = ?", (crawl_id,))
+        record = cursor.fetchone()
+        if not record:
+            raise HTTPException(status_code=404, detail="爬取记录不存在")
+        
+        # 检查用户是否有权限继续该爬取记录
+        if current_user["level"] != 2 and record["user_id"] != current_user["id"]:  # 非管理员需要验证所有权
+            raise HTTPException(status_code=403, detail="您没有权限操作此爬取记录")
+        
+        if record["status"] in ("进行中", "等待中", "完成"):
+            raise HTTPException(status_code=400, detail=f"爬取记录状态为{record['status']}，无法继续爬取")
+        
+        cursor.execute("SELECT comment_count FROM crawl_checkpoints WHERE crawl_id = ?", (crawl_id,))
+        checkpoint = cursor.fetchone()
+        if not checkpoint:
+            raise HTTPException(status_code=400, detail="该爬取记录没有可用的断点")
+        
+        # 加入任务队列，从断点继续爬取
+        with db.transaction(conn):
+            conn.execute("UPDATE crawl_records SET status = ?, end_time = NULL WHERE id = ?", ("等待中", crawl_id))
+            scheduler.enqueue(conn, crawl_id, record["user_id"], "resume", {})
+        scheduler.wake()
+        
+        return CrawlResponse(
+            crawl_id=crawl_id,
+            bv=record["bv"],
+            title=record["title"],
+            status="已继续爬取",
+            message=f"爬取任务将从第{checkpoint['comment_count'] + 1}条评论处继续执行"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 实时爬取进度（Server-Sent Events）：爬取在本进程运行时推送进度总线的事件，
+# 排队中或在独立工作进程中运行时按间隔读取爬取记录；EventSource无法设置请求头，令牌通过查询参数传入
+@app.get("/api/crawl_records/{crawl_id}/progress")
+async def stream_crawl_progress(
+    crawl_id: int,
+    request: Request,
+    token: str = Query(..., description="登录令牌（与Authorization请求头中的令牌相同）")
+):
+    current_user = await get_current_user(token)
+    try:
+        record = await db.run(_find_record_owner, crawl_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="爬取记录不存在")
+        
+        # 检查用户是否有权限访问该爬取记录
+        if current_user["level"] != 2 and record["user_id"] != current_user["id"]:  # 非管理员需要验证所有权
+            raise HTTPException(status_code=403, detail="您没有权限访问此爬取记录")
+        
+        return StreamingResponse(
+            _progress_events(crawl_id, request),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _find_record_owner(crawl_id: int):
+    return db.get_connection().execute("SELECT user_id FROM crawl_records WHERE id = ?", (crawl_id,)).fetchone()
+
+# 进度事件流：任务完成或失败后结束；没有新事件时发送注释行保持连接
+async def _progress_events(crawl_id: int, request: Request):
+    queue = progress.progress_bus.subscribe(crawl_id)
+    last_polled = None
+    # 本进程没有该任务的事件时，立即读取一次爬取记录作为第一条事件
+    timeout = 0 if progress.progress_bus.latest(crawl_id) is None else progress.PROGRESS_POLL_INTERVAL
+    try:
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                event = None
+                latest = progress.progress_bus.latest(crawl_id)
+                # 排队中的任务可能由独立工作进程执行，本进程收不到其进度事件
+                if latest is None or latest["state"] in ("queued", "interrupted"):
+                    polled = await db.run(progress.record_snapshot, crawl_id)
+                    if polled is None:
+                        break
+                    changed = (polled["state"], polled["comments"]) != last_polled
+                    last_polled = (polled["state"], polled["comments"])
+                    event = polled if changed else None
+            timeout = progress.PROGRESS_POLL_INTERVAL
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: progress\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if event["state"] in progress.FINAL_STATES:
+                break
+    finally:
+        progress.progress_bus.unsubscribe(crawl_id, queue)
+
 # 下载爬取记录
 @app.get("/api/crawl_records/{crawl_id}/download")
-async def download_crawl_record(crawl_id: int, current_user: dict = Depends(get_current_user)):
+@db.in_pool
+def download_crawl_record(
+    crawl_id: int,
+    export_format: str = Query("csv", alias="format", description="导出格式：csv/jsonl/parquet/arrow"),
+    compression: str = Query(None, description="压缩方式：gzip/zstd"),
+    current_user: dict = Depends(get_current_user)
+):
+    started = time.perf_counter()
     try:
-        from fastapi.responses import StreamingResponse
-        import io
+        try:
+            media_type, extension = exporter.resolve_format(export_format, compression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        conn = sqlite3.connect('bilibili_CH.db')
-        conn.row_factory = sqlite3.Row
+        conn = db.get_connection()
         cursor = conn.cursor()
         
         # 检查用户是否有权限下载该爬取记录
@@ -674,77 +915,41 @@ async def download_crawl_record(crawl_id: int, current_user: dict = Depends(get_
             cursor.execute("SELECT user_id FROM crawl_records WHERE id = ?", (crawl_id,))
             record = cursor.fetchone()
             if not record or record["user_id"] != current_user["id"]:
-                conn.close()
                 raise HTTPException(status_code=403, detail="您没有权限下载此爬取记录")
         
         # 获取爬取记录信息
         cursor.execute("SELECT title FROM crawl_records WHERE id = ?", (crawl_id,))
         record = cursor.fetchone()
         if not record:
-            conn.close()
             raise HTTPException(status_code=404, detail="爬取记录不存在")
             
         title = record["title"]
         
-        # 获取评论数据
-        cursor.execute("""
-        SELECT * FROM comments 
-        WHERE crawl_id = ? 
-        ORDER BY comment_index
-        """, (crawl_id,))
-        
-        comments = cursor.fetchall()
-        conn.close()
-        
-        if not comments:
+        # 先确认有数据，再按块流式导出
+        cursor.execute("SELECT 1 FROM comments WHERE crawl_id = ? LIMIT 1", (crawl_id,))
+        if not cursor.fetchone():
             raise HTTPException(status_code=404, detail="该爬取记录没有评论数据")
         
-        # 创建CSV文件
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # 写入表头
-        headers = ["评论序号", "父评论ID", "评论ID", "用户ID", "用户名", "用户等级", "性别", "评论内容", "评论时间", "回复数", "点赞数", "个性签名", "IP属地", "是否大会员", "头像链接"]
-        writer.writerow(headers)
-        
-        # 写入数据
-        for comment in comments:
-            writer.writerow([
-                comment["comment_index"],
-                comment["parent_id"],
-                comment["comment_id"],
-                comment["user_id"],
-                comment["username"],
-                comment["user_level"],
-                comment["gender"],
-                comment["content"],
-                comment["comment_time"],
-                comment["reply_count"],
-                comment["like_count"],
-                comment["signature"],
-                comment["ip_location"],
-                comment["is_vip"],
-                comment["avatar"]
-            ])
-        
-        # 返回CSV文件
-        output.seek(0)
-        filename = f"{title}_评论数据.csv"
+        filename = f"{title}_评论数据{extension}"
+        chunks = exporter.iter_comment_chunks(COMMENTS_SOURCE, "comments.crawl_id = ?", [crawl_id])
         
         return StreamingResponse(
-            io.StringIO(output.getvalue()),
-            media_type="text/csv",
+            exporter.stream_export(chunks, export_format, compression, started),
+            media_type=media_type,
             headers={
                 "Content-Disposition": f"attachment; filename={quote(filename)}"
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 下载评论数据
 @app.get("/api/comments/{crawl_id}/download")
-async def download_comments(
+@db.in_pool
+def download_comments(
     crawl_id: int, 
     username: str = None, 
     keyword: str = None,
@@ -758,14 +963,18 @@ async def download_comments(
     is_vip: str = None,
     start_time: str = None,
     end_time: str = None,
+    export_format: str = Query("csv", alias="format", description="导出格式：csv/jsonl/parquet/arrow"),
+    compression: str = Query(None, description="压缩方式：gzip/zstd"),
     current_user: dict = Depends(get_current_user)
 ):
+    started = time.perf_counter()
     try:
-        from fastapi.responses import StreamingResponse
-        import io
+        try:
+            media_type, extension = exporter.resolve_format(export_format, compression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        conn = sqlite3.connect('bilibili_CH.db')
-        conn.row_factory = sqlite3.Row
+        conn = db.get_connection()
         cursor = conn.cursor()
         
         # 检查用户是否有权限下载该爬取记录的评论
@@ -773,127 +982,31 @@ async def download_comments(
             cursor.execute("SELECT user_id FROM crawl_records WHERE id = ?", (crawl_id,))
             record = cursor.fetchone()
             if not record or record["user_id"] != current_user["id"]:
-                conn.close()
                 raise HTTPException(status_code=403, detail="您没有权限下载此爬取记录的评论")
         
         # 获取爬取记录信息
         cursor.execute("SELECT title FROM crawl_records WHERE id = ?", (crawl_id,))
         record = cursor.fetchone()
         if not record:
-            conn.close()
             raise HTTPException(status_code=404, detail="爬取记录不存在")
             
         title = record["title"]
         
         # 构建查询条件
-        query_conditions = ["crawl_id = ?"] 
-        query_params = [crawl_id]
-        
-        # 添加用户名搜索条件
-        if username:
-            query_conditions.append("username LIKE ?")
-            query_params.append(f"%{username}%")
-            
-        # 添加关键词搜索条件
-        if keyword:
-            query_conditions.append("content LIKE ?")
-            query_params.append(f"%{keyword}%")
-            
-        # 添加性别筛选条件
-        if gender:
-            query_conditions.append("gender = ?")
-            query_params.append(gender)
-            
-        # 添加回复数筛选条件
-        if min_reply_count is not None:
-            query_conditions.append("reply_count >= ?")
-            query_params.append(min_reply_count)
-            
-        if max_reply_count is not None:
-            query_conditions.append("reply_count <= ?")
-            query_params.append(max_reply_count)
-            
-        # 添加点赞数筛选条件
-        if min_like_count is not None:
-            query_conditions.append("like_count >= ?")
-            query_params.append(min_like_count)
-            
-        if max_like_count is not None:
-            query_conditions.append("like_count <= ?")
-            query_params.append(max_like_count)
-            
-        # 添加二级评论筛选条件
-        if show_second_level is not None:
-            if not show_second_level:
-                # 只显示一级评论
-                query_conditions.append("parent_id = 0")
-                
-        # 添加用户等级筛选条件
-        if user_level is not None:
-            query_conditions.append("user_level = ?")
-            query_params.append(user_level)
-            
-        # 添加VIP筛选条件
-        if is_vip:
-            query_conditions.append("is_vip = ?")
-            query_params.append(is_vip)
-            
-        # 添加时间范围筛选条件
-        if start_time:
-            query_conditions.append("comment_time >= ?")
-            query_params.append(start_time)
-            
-        if end_time:
-            query_conditions.append("comment_time <= ?")
-            query_params.append(end_time)
-            
-        # 构建WHERE子句
-        where_clause = " AND ".join(query_conditions)
-        
-        # 获取评论数据
-        comments_query = f"""
-        SELECT * FROM comments 
-        WHERE {where_clause} 
-        ORDER BY comment_index
-        """
-        cursor.execute(comments_query, query_params)
-        
-        comments = cursor.fetchall()
-        conn.close()
+        from_clause, where_clause, query_params, _ = build_comment_filters(
+            conn, crawl_id,
+            username=username, keyword=keyword, gender=gender,
+            min_reply_count=min_reply_count, max_reply_count=max_reply_count,
+            min_like_count=min_like_count, max_like_count=max_like_count,
+            show_second_level=show_second_level, user_level=user_level, is_vip=is_vip,
+            start_time=start_time, end_time=end_time
+        )
         
-        if not comments:
+        # 先确认有数据，再按块流式导出
+        cursor.execute(f"SELECT 1 FROM {from_clause} WHERE {where_clause} LIMIT 1", query_params)
+        if not cursor.fetchone():
             raise HTTPException(status_code=404, detail="没有找到符合条件的评论数据")
         
-        # 创建CSV文件
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # 写入表头
-        headers = ["评论序号", "父评论ID", "评论ID", "用户ID", "用户名", "用户等级", "性别", "评论内容", "评论时间", "回复数", "点赞数", "个性签名", "IP属地", "是否大会员", "头像链接"]
-        writer.writerow(headers)
-        
-        # 写入数据
-        for comment in comments:
-            writer.writerow([
-                comment["comment_index"],
-                comment["parent_id"],
-                comment["comment_id"],
-                comment["user_id"],
-                comment["username"],
-                comment["user_level"],
-                comment["gender"],
-                comment["content"],
-                comment["comment_time"],
-                comment["reply_count"],
-                comment["like_count"],
-                comment["signature"],
-                comment["ip_location"],
-                comment["is_vip"],
-                comment["avatar"]
-            ])
-        
-        # 返回CSV文件
-        output.seek(0)
         filename = f"{title}_评论数据"
         if username:
             filename += f"_用户名({username})"
@@ -932,16 +1045,19 @@ async def download_comments(
                 filename += "_包含二级评论"
             else:
                 filename += "_仅一级评论"
-        filename += ".csv"
+        filename += extension
+        chunks = exporter.iter_comment_chunks(from_clause, where_clause, query_params)
         
         return StreamingResponse(
-            io.StringIO(output.getvalue()),
-            media_type="text/csv",
+            exporter.stream_export(chunks, export_format, compression, started),
+            media_type=media_type,
             headers={
                 "Content-Disposition": f"attachment; filename={quote(filename)}"
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
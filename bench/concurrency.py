@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+import httpx
+
+# 并发基准：比较接口数据库查询在事件循环中直接执行（迁移到线程池之前）与在数据库线程池中执行时，
+# 吞吐量随并发客户端数的变化。每轮若干客户端持续发送慢查询（短关键词全文搜索，退回LIKE全表扫描），
+# 同时一个客户端反复请求爬取记录详情，统计慢查询吞吐量和详情请求的延迟。
+# 数据库复制到临时目录后使用，不修改原文件。
+#
+# 预期的扩展性：sqlite3模块在执行SQL（sqlite3_step）期间释放GIL，扫描本身可以在线程池的多个线程中
+# 并行；把结果行转换为Python对象、序列化响应和FastAPI的处理都持有GIL，只能串行执行。
+# - inline：查询在事件循环线程中执行，任意时刻只有一个查询，慢查询吞吐量不随客户端数增加，详情请求要排在慢查询之后
+# - pool：慢查询吞吐量随客户端数增加，上限约为 min(客户端数, POOL_WORKERS, CPU核数) 倍（扣除持有GIL的部分）；
+#   单核机器上两种方式的吞吐量相同，线程池的收益只体现在详情请求的延迟上；
+#   客户端数达到POOL_WORKERS时线程池被慢查询占满，详情请求也要排队，延迟随之上升
+#
+# 用法：python bench/concurrency.py [--db bilibili_CH.db] [--clients 1,2,4,8] [--duration 5]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SLOW_KEYWORD = "评论"  # 少于3个字符，不走全文索引
+FAST_INTERVAL = 0.02  # 详情请求之间的间隔（秒）
+
+# 百分位数（values为空时返回0）
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+# 在事件循环中直接执行数据库函数（模拟迁移到线程池之前的接口）
+async def run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+# 在当前数据库执行方式下运行一轮：clients个慢查询客户端和一个详情客户端同时请求duration秒
+async def measure(app, headers, crawl_id, clients, duration):
+    slow_latency, fast_latency = [], []
+    deadline = time.perf_counter() + duration
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def slow(worker):
+            page = 0
+            while time.perf_counter() < deadline:
+                page += 1
+                started = time.perf_counter()
+                response = await client.get("/api/search/comments", headers=headers,
+                                            params={"keyword": SLOW_KEYWORD, "page": worker * 1000 + page, "page_size": 10})
+                response.raise_for_status()
+                slow_latency.append(time.perf_counter() - started)
+                # 进程内传输不经过网络，每个请求结束后让出事件循环，相当于真实连接上的一次往返
+                await asyncio.sleep(0)
+
+        # 延迟从计划发送时间算起，包含事件循环被阻塞时的等待
+        async def fast():
+            planned = time.perf_counter()
+            while planned < deadline:
+                await asyncio.sleep(max(planned - time.perf_counter(), 0))
+                response = await client.get(f"/api/crawl_records/{crawl_id}", headers=headers)
+                response.raise_for_status()
+                fast_latency.append(time.perf_counter() - planned)
+                planned = time.perf_counter() + FAST_INTERVAL
+
+        started = time.perf_counter()
+        await asyncio.gather(fast(), *[slow(i) for i in range(clients)])
+        elapsed = time.perf_counter() - started
+    return {
+        "slow_rps": len(slow_latency) / elapsed,
+        "fast_rps": len(fast_latency) / elapsed,
+        "fast_p50_ms": percentile(fast_latency, 0.5) * 1000,
+        "fast_p99_ms": percentile(fast_latency, 0.99) * 1000,
+        "slow_p50_ms": percentile(slow_latency, 0.5) * 1000,
+    }
+
+# 依次以inline（事件循环中直接执行）和pool（数据库线程池）两种方式运行并输出对比
+def main():
+    parser = argparse.ArgumentParser(description="接口数据库线程池并发基准")
+    parser.add_argument("--db", default=os.path.join(ROOT, "bilibili_CH.db"), help="数据库文件（复制后使用）")
+    parser.add_argument("--clients", default="1,2,4,8", help="依次测试的并发慢查询客户端数，逗号分隔")
+    parser.add_argument("--duration", type=float, default=5.0, help="每种模式每个客户端数的持续时间（秒）")
+    args = parser.parse_args()
+    client_counts = [int(count) for count in args.clients.split(",")]
+
+    workdir = tempfile.mkdtemp(prefix="bench_concurrency_")
+    db_path = os.path.join(workdir, "bench.db")
+    shutil.copy(args.db, db_path)
+
+    import db
+    db.DB_PATH = db_path
+    import api
+    import user_api
+
+    conn = db.get_connection()
+    admin = conn.execute("SELECT username FROM users WHERE level = 2 LIMIT 1").fetchone()
+    record = conn.execute("SELECT id FROM crawl_records ORDER BY comment_count DESC LIMIT 1").fetchone()
+    if record is None:
+        sys.exit("数据库中没有爬取记录")
+    headers = {"Authorization": "Bearer " + user_api.create_access_token({"sub": admin["username"]})}
+
+    print(f"线程池{db.POOL_WORKERS}个线程，CPU核数{os.cpu_count()}，每轮{args.duration:.0f}秒")
+    pooled_run = db.run
+    results = {}
+    try:
+        for mode, run in (("inline", run_inline), ("pool", pooled_run)):
+            db.run = run
+            for clients in client_counts:
+                result = asyncio.run(measure(api.app, headers, record["id"], clients, args.duration))
+                results[mode, clients] = result
+                print(f"{mode:<6} {clients}个客户端：慢查询 {result['slow_rps']:.1f}次/秒（p50 {result['slow_p50_ms']:.0f}ms），"
+                      f"详情 {result['fast_rps']:.1f}次/秒（p50 {result['fast_p50_ms']:.0f}ms，p99 {result['fast_p99_ms']:.0f}ms）")
+    finally:
+        db.run = pooled_run
+        db.shutdown_pool()
+        db.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 慢查询吞吐量相对单个客户端的倍数
+    print("慢查询吞吐量相对最少客户端数的倍数：")
+    for mode in ("inline", "pool"):
+        base = results[mode, client_counts[0]]["slow_rps"] or 1.0
+        scaling = "  ".join(f"{clients}: {results[mode, clients]['slow_rps'] / base:.2f}x" for clients in client_counts)
+        print(f"{mode:<6} {scaling}")
+
+if __name__ == "__main__":
+    main()
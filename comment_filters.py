@@ -0,0 +1,226 @@
+import json
+import base64
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# 评论查询的数据源：comment_details视图还原了评论者资料列，别名为comments
+COMMENTS_SOURCE = "comment_details AS comments"
+
+# 接口返回的评论列（与原评论表一致；视图中的资料版本和编码列只用于筛选）
+COMMENT_COLUMNS = ", ".join(f"comments.{name}" for name in (
+    "id", "crawl_id", "comment_index", "parent_id", "comment_id", "user_id", "username", "user_level", "gender",
+    "content", "comment_time", "reply_count", "like_count", "signature", "ip_location", "is_vip", "avatar",
+))
+
+# 评论者资料的整数编码（与 migrations.py 中 comment_details 视图的解码一致）
+GENDER_CODES = {"保密": 0, "男": 1, "女": 2}
+VIP_CODES = {"否": 0, "是": 1}
+
+# 关键词最少字符数（trigram分词至少需要3个字符，更短的关键词退回LIKE匹配）
+FTS_MIN_KEYWORD_LENGTH = 3
+
+# 已完成爬取记录的筛选计数缓存条目上限
+COUNT_CACHE_SIZE = 2048
+
+# 筛选计数缓存：(crawl_id, 记录版本, FROM, WHERE, 参数) -> 总数，只缓存状态为完成的爬取记录。
+# 记录版本取自crawl_records（开始时间、结束时间、评论数），独立工作进程追加评论后版本随之改变，
+# 即使本进程没有收到清除通知也不会命中旧的计数
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+
+# 评论全文索引是否可用（旧版SQLite不支持trigram分词时迁移会跳过建表）
+def fts_available(conn) -> bool:
+    try:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'comments_fts'").fetchone()
+    except sqlite3.Error:
+        return False
+    return row is not None
+
+# 把关键词转换为FTS5短语查询，限定在指定列中匹配
+def fts_match_expression(keyword: str, columns=("content",)) -> str:
+    phrase = '"' + keyword.replace('"', '""') + '"'
+    if len(columns) == 1:
+        return f"{columns[0]} : {phrase}"
+    return "{" + " ".join(columns) + "} : " + phrase
+
+# 关键词是否走全文索引
+def use_fts(conn, keyword) -> bool:
+    return bool(keyword) and len(keyword.strip()) >= FTS_MIN_KEYWORD_LENGTH and fts_available(conn)
+
+# 构建评论筛选条件，返回 (FROM子句, WHERE子句, 参数, 是否可按相关度排序（FROM中包含comments_fts）)
+def build_comment_filters(
+    conn,
+    crawl_id: int = None,
+    username: str = None,
+    keyword: str = None,
+    gender: str = None,
+    min_reply_count: int = None,
+    max_reply_count: int = None,
+    min_like_count: int = None,
+    max_like_count: int = None,
+    show_second_level: bool = None,
+    user_level: int = None,
+    is_vip: str = None,
+    start_time: str = None,
+    end_time: str = None,
+    search_signature: bool = False,
+    rank_by_relevance: bool = False,
+):
+    from_clause = COMMENTS_SOURCE
+    query_conditions = []
+    query_params = []
+    ranked = False
+
+    if crawl_id is not None:
+        query_conditions.append("comments.crawl_id = ?")
+        query_params.append(crawl_id)
+
+    # 添加用户名搜索条件
+    if username:
+        query_conditions.append("comments.username LIKE ?")
+        query_params.append(f"%{username}%")
+
+    # 添加关键词搜索条件（优先使用全文索引）
+    if keyword:
+        if use_fts(conn, keyword):
+            content_match = fts_match_expression(keyword.strip(), ("content",))
+            if search_signature:
+                # 个性签名按资料版本单独建索引，两个子查询取并集（相关度只对评论内容有意义，按序号排序）
+                query_conditions.append(
+                    "(comments.id IN (SELECT rowid FROM comments_fts WHERE comments_fts MATCH ?)"
+                    " OR comments.profile_id IN (SELECT rowid FROM member_profiles_fts WHERE member_profiles_fts MATCH ?))"
+                )
+                query_params.extend([content_match, fts_match_expression(keyword.strip(), ("signature",))])
+            elif rank_by_relevance:
+                # 按相关度排序时由全文索引驱动连接，ORDER BY 可使用 comments_fts.rank
+                ranked = True
+                from_clause = f"comments_fts CROSS JOIN {COMMENTS_SOURCE} ON comments.id = comments_fts.rowid"
+                query_conditions.append("comments_fts MATCH ?")
+                query_params.append(content_match)
+            else:
+                # 只做筛选时子查询只执行一次，仍按 comment_index 索引顺序读取
+                query_conditions.append("comments.id IN (SELECT rowid FROM comments_fts WHERE comments_fts MATCH ?)")
+                query_params.append(content_match)
+        elif search_signature:
+            query_conditions.append("(comments.content LIKE ? OR comments.signature LIKE ?)")
+            query_params.extend([f"%{keyword}%", f"%{keyword}%"])
+        else:
+            query_conditions.append("comments.content LIKE ?")
+            query_params.append(f"%{keyword}%")
+
+    # 添加性别筛选条件（直接比较整数编码，不经过视图的解码；未知取值不匹配任何评论）
+    if gender:
+        query_conditions.append("comments.gender_code = ?")
+        query_params.append(GENDER_CODES.get(gender, -1))
+
+    # 添加回复数筛选条件
+    if min_reply_count is not None:
+        query_conditions.append("comments.reply_count >= ?")
+        query_params.append(min_reply_count)
+
+    if max_reply_count is not None:
+        query_conditions.append("comments.reply_count <= ?")
+        query_params.append(max_reply_count)
+
+    # 添加点赞数筛选条件
+    if min_like_count is not None:
+        query_conditions.append("comments.like_count >= ?")
+        query_params.append(min_like_count)
+
+    if max_like_count is not None:
+        query_conditions.append("comments.like_count <= ?")
+        query_params.append(max_like_count)
+
+    # 添加二级评论筛选条件（只显示一级评论）
+    if show_second_level is not None and not show_second_level:
+        query_conditions.append("comments.parent_id = 0")
+
+    # 添加用户等级筛选条件
+    if user_level is not None:
+        query_conditions.append("comments.user_level = ?")
+        query_params.append(user_level)
+
+    # 添加VIP筛选条件（同样比较整数编码）
+    if is_vip:
+        query_conditions.append("comments.vip_code = ?")
+        query_params.append(VIP_CODES.get(is_vip, -1))
+
+    # 添加时间范围筛选条件
+    if start_time:
+        query_conditions.append("comments.comment_time >= ?")
+        query_params.append(start_time)
+
+    if end_time:
+        query_conditions.append("comments.comment_time <= ?")
+        query_params.append(end_time)
+
+    where_clause = " AND ".join(query_conditions) if query_conditions else "1 = 1"
+    return from_clause, where_clause, query_params, ranked
+
+# 评论列表的排序：按关键词相关度排序时以评论序号区分同分评论
+def comment_order(relevance: bool) -> str:
+    return "comments_fts.rank, comments.comment_index" if relevance else "comments.comment_index"
+
+# 评论计数查询
+def count_query(from_clause: str, where_clause: str) -> str:
+    return f"SELECT COUNT(*) FROM {from_clause} WHERE {where_clause}"
+
+# 评论分页查询：OFFSET分页的参数为 [LIMIT, OFFSET]，游标分页（by_cursor）只有 [LIMIT]
+def page_query(from_clause: str, where_clause: str, order_clause: str, columns: str = COMMENT_COLUMNS, by_cursor: bool = False) -> str:
+    limit = "LIMIT ?" if by_cursor else "LIMIT ? OFFSET ?"
+    return f"SELECT {columns} FROM {from_clause} WHERE {where_clause} ORDER BY {order_clause} {limit}"
+
+# 游标分页：追加"排在上一页最后一条之后"的条件，返回新的 (WHERE, 参数)
+def after_cursor(where_clause: str, query_params, last: dict, relevance: bool):
+    if relevance:
+        return (where_clause + " AND (comments_fts.rank > ? OR (comments_fts.rank = ? AND comments.comment_index > ?))",
+                query_params + [last["r"], last["r"], last["i"]])
+    return where_clause + " AND comments.comment_index > ?", query_params + [last["i"]]
+
+# 爬取记录的缓存版本：状态为完成时返回版本元组，否则返回None（不缓存）
+def count_cache_version(record):
+    if record is None or record["status"] != "完成":
+        return None
+    return (record["start_time"], record["end_time"], record["comment_count"])
+
+# 统计符合筛选条件的评论数（version不为None时命中缓存则不再执行COUNT）
+def count_comments(conn, crawl_id, from_clause, where_clause, query_params, version=None) -> int:
+    key = (crawl_id, version, from_clause, where_clause, tuple(query_params))
+    cacheable = version is not None
+    if cacheable:
+        with _count_cache_lock:
+            if key in _count_cache:
+                _count_cache.move_to_end(key)
+                return _count_cache[key]
+
+    total = conn.execute(count_query(from_clause, where_clause), query_params).fetchone()[0]
+
+    if cacheable:
+        with _count_cache_lock:
+            _count_cache[key] = total
+            while len(_count_cache) > COUNT_CACHE_SIZE:
+                _count_cache.popitem(last=False)
+    return total
+
+# 爬取记录的评论发生变化（删除、追加）时清除本进程中该记录的计数缓存（释放旧版本占用的条目）
+def invalidate_count_cache(crawl_id):
+    with _count_cache_lock:
+        for key in [key for key in _count_cache if key[0] == crawl_id]:
+            del _count_cache[key]
+
+# 游标编码：把最后一条记录的排序键编码为不透明字符串
+def encode_cursor(sort_key: dict) -> str:
+    raw = json.dumps(sort_key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+# 游标解码，格式错误时抛出ValueError
+def decode_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_key = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("无效的分页游标") from e
+    if not isinstance(sort_key, dict) or not isinstance(sort_key.get("i"), int):
+        raise ValueError("无效的分页游标")
+    return sort_key
@@ -0,0 +1,119 @@
+import os
+import time
+import threading
+
+# Cookie池配置
+COOKIE_FILE = 'bili_cookie.txt'  # 每行一个Cookie，空行和#开头的行忽略
+COOKIE_CHECK_INTERVAL = 2.0  # 检查文件是否变化的最短间隔（秒）
+COOKIE_BENCH_SECONDS = 60.0  # 触发风控后暂停使用的初始时长（秒）
+COOKIE_MAX_BENCH_SECONDS = 900.0  # 连续触发风控时暂停时长的上限（秒）
+
+# 风控响应：HTTP状态码412，或接口返回的code为-412（请求被拦截）/-352（风控校验失败）；
+# WBI签名的请求返回-352时先按签名失效刷新mixin key重试，刷新后仍返回-352才按风控处理（见crawler.fetch_main_page）
+RISK_CONTROL_STATUS = 412
+RISK_CONTROL_CODES = (-412, -352)
+
+# 单个Cookie及其使用统计
+class _Credential:
+    def __init__(self, cookie: str):
+        self.cookie = cookie
+        self.requests = 0
+        self.in_flight = 0
+        self.failures = 0
+        self.strikes = 0  # 连续触发风控的次数，成功一次后清零
+        self.benched_until = 0.0
+
+    # 统计信息（不包含Cookie内容）
+    def summary(self, now: float) -> dict:
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "failures": self.failures,
+            "benched_seconds": round(max(self.benched_until - now, 0.0), 1),
+        }
+
+# Cookie池：启动时加载，文件变化时重新加载；每次请求取正在使用最少、请求次数最少的Cookie，
+# 触发风控的Cookie暂停一段时间（连续触发时加倍），全部暂停时不带Cookie请求
+class CookiePool:
+    def __init__(self, path: str = COOKIE_FILE):
+        self.path = path
+        self._credentials = []
+        self._file_state = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    # 文件修改时间或大小变化时重新加载，保留仍存在的Cookie的统计
+    def _reload_if_changed(self, now: float):
+        if now - self._checked_at < COOKIE_CHECK_INTERVAL and self._file_state is not None:
+            return
+        self._checked_at = now
+        try:
+            stat = os.stat(self.path)
+            file_state = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_state = (None, None)
+        if file_state == self._file_state:
+            return
+        self._file_state = file_state
+
+        cookies = []
+        if file_state[0] is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith('#') and line not in cookies:
+                            cookies.append(line)
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"读取Cookie文件失败：{e}")
+                return
+        existing = {credential.cookie: credential for credential in self._credentials}
+        self._credentials = [existing.get(cookie) or _Credential(cookie) for cookie in cookies]
+        self.reloads += 1
+        print(f"已加载{len(self._credentials)}个Cookie")
+
+    # 取一个可用的Cookie（没有可用Cookie时返回None），请求结束后必须调用release
+    def acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            self._reload_if_changed(now)
+            available = [credential for credential in self._credentials if credential.benched_until <= now]
+            if not available:
+                return None
+            credential = min(available, key=lambda item: (item.in_flight, item.requests))
+            credential.requests += 1
+            credential.in_flight += 1
+            return credential
+
+    # 归还Cookie并根据响应判断是否触发风控
+    def release(self, credential, risk_controlled: bool = False):
+        if credential is None:
+            return
+        with self._lock:
+            credential.in_flight -= 1
+            if risk_controlled:
+                credential.failures += 1
+                credential.strikes += 1
+                bench = min(COOKIE_BENCH_SECONDS * 2 ** (credential.strikes - 1), COOKIE_MAX_BENCH_SECONDS)
+                credential.benched_until = time.monotonic() + bench
+                slot = self._credentials.index(credential) + 1 if credential in self._credentials else "?"
+                print(f"第{slot}个Cookie触发风控，暂停使用{bench:.0f}秒")
+            else:
+                credential.strikes = 0
+
+    # Cookie使用统计
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._reload_if_changed(now)
+            credentials = [credential.summary(now) for credential in self._credentials]
+        return {
+            "total": len(credentials),
+            "available": sum(1 for credential in credentials if credential["benched_seconds"] == 0),
+            "reloads": self.reloads,
+            "cookies": credentials,
+        }
+
+# 进程内共享的Cookie池
+cookie_pool = CookiePool()
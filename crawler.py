@@ -0,0 +1,781 @@
+import re
+import json
+import time
+import random
+import threading
+import asyncio
+import urllib.parse
+from datetime import datetime
+from typing import Optional, Dict
+
+import httpx
+
+import db
+import wbi
+import analysis
+from comment_filters import invalidate_count_cache, GENDER_CODES, VIP_CODES
+from progress import CrawlProgress
+from cookie_pool import cookie_pool, RISK_CONTROL_STATUS, RISK_CONTROL_CODES
+
+# HTTP客户端配置
+HTTP_TIMEOUT = 15.0  # 单次请求超时时间（秒）
+HTTP_MAX_CONNECTIONS = 64  # 连接池总连接数上限
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32  # 保持长连接的空闲连接数上限
+HTTP_KEEPALIVE_EXPIRY = 60.0  # 空闲长连接的保留时间（秒）
+HTTP_DEFAULT_HOST_LIMIT = 4  # 未单独配置的域名的并发连接上限
+HTTP_HOST_LIMITS = {  # 按域名配置的并发连接上限
+    "api.bilibili.com": 16,
+    "www.bilibili.com": 4,
+}
+
+# 二级评论抓取配置
+SECOND_LEVEL_WORKERS = 4  # 每个爬取任务的二级评论抓取worker数
+SECOND_LEVEL_CONCURRENCY = 8  # 全局同时进行的二级评论请求数上限
+
+# 全局自适应限速配置（所有爬取任务、所有B站请求共享）
+RATE_LIMIT_INITIAL = 8.0  # 初始速率（次/秒）
+RATE_LIMIT_MIN = 0.5  # 速率下限
+RATE_LIMIT_MAX = 30.0  # 速率上限
+RATE_LIMIT_BURST = 4  # 令牌桶容量（允许的突发请求数）
+RATE_LIMIT_INCREASE = 0.5  # 加性增：满速无限流时每秒提高的速率
+RATE_LIMIT_DECREASE = 0.5  # 乘性减：遇到限流时速率乘以该系数
+RATE_LIMIT_DECREASE_INTERVAL = 1.0  # 两次降速的最短间隔（秒），同一批并发请求被限流只降一次
+RETRY_MAX_ATTEMPTS = 5  # 遇到限流时的最多请求次数（含第一次）
+RETRY_BACKOFF_BASE = 1.0  # 退避基数（秒），第n次重试最多等待 base * 2^(n-1)
+RETRY_BACKOFF_MAX = 30.0  # 单次退避等待上限（秒）
+
+# 限流响应：HTTP状态码412/429，或接口code为-412/-352（风控）、-509（请求过于频繁）
+THROTTLE_STATUS = (412, 429)
+THROTTLE_CODES = (-412, -352, -509)
+
+# 数据库写入配置（日志模式和同步级别见 db.py）
+WRITE_BATCH_SIZE = 200  # 单个事务最多写入的评论数
+
+# 增量爬取时刷新已存储根评论的回复数和点赞数
+REFRESH_ROOT_QUERY = "UPDATE comments SET reply_count = ?, like_count = ? WHERE crawl_id = ? AND comment_id = ?"
+
+MAIN_URL = "https://api.bilibili.com/x/v2/reply/wbi/main"  # 一级评论分页接口
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36 Edg/134.0.0.0'
+
+# 安装了 h2 时启用 HTTP/2，否则退回 HTTP/1.1 长连接
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+# 进程内共享的HTTP客户端
+_http_client: Optional[httpx.AsyncClient] = None
+
+# 绑定到当前事件循环的并发控制对象（事件循环变化时重建）
+_loop_state: Dict[str, object] = {"loop": None}
+
+# 获取B站Header（带上Cookie池分配的Cookie）
+def get_Header(credential=None):
+    header = {
+        "User-Agent": USER_AGENT
+    }
+    if credential is not None:
+        header["Cookie"] = credential.cookie
+    return header
+
+# 获取共享的HTTP客户端（首次调用时创建，之后复用连接池）
+def get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            headers={"User-Agent": USER_AGENT},
+        )
+    return _http_client
+
+# 关闭共享的HTTP客户端（应用关闭时调用）
+async def close_http_client():
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+    _loop_state["loop"] = None
+
+# 获取当前事件循环下的全局并发控制对象
+def _get_loop_state() -> Dict[str, object]:
+    loop = asyncio.get_running_loop()
+    if _loop_state["loop"] is not loop:
+        _loop_state.update(
+            loop=loop,
+            host_semaphores={},
+            second_level_semaphore=asyncio.Semaphore(SECOND_LEVEL_CONCURRENCY),
+        )
+    return _loop_state
+
+# 获取域名对应的并发信号量
+def _get_host_semaphore(host: str) -> asyncio.Semaphore:
+    host_semaphores = _get_loop_state()["host_semaphores"]
+    semaphore = host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(HTTP_HOST_LIMITS.get(host, HTTP_DEFAULT_HOST_LIMIT))
+        host_semaphores[host] = semaphore
+    return semaphore
+
+# 自适应令牌桶限速器：成功时加性提速，遇到限流时乘性降速（AIMD）。
+# 令牌不足时按当前速率计算等待时间，醒来后重新检查，降速对已在等待的请求立即生效
+class AdaptiveRateLimiter:
+    def __init__(self, rate: float = RATE_LIMIT_INITIAL, burst: int = RATE_LIMIT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0, "decreases": 0, "wait_seconds": 0.0}
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.stats["requests"] += 1
+                    self.stats["wait_seconds"] += now - started
+                    return
+                wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    # 请求成功：每次提高 INCREASE / rate，满速时约每秒提高 INCREASE
+    def on_success(self):
+        with self._lock:
+            self.rate = min(RATE_LIMIT_MAX, self.rate + RATE_LIMIT_INCREASE / self.rate)
+
+    # 遇到限流：降速（短时间内多次限流只降一次）；retry为True时同时计入重试次数
+    def on_throttle(self, retry: bool = False):
+        with self._lock:
+            self.stats["throttled"] += 1
+            if retry:
+                self.stats["retries"] += 1
+            now = time.monotonic()
+            if now - self._decreased_at >= RATE_LIMIT_DECREASE_INTERVAL:
+                self._decreased_at = now
+                # 清空已积累的令牌，避免降速后仍有一批突发请求
+                self._refill(now)
+                self._tokens = min(self._tokens, 0.0)
+                self.rate = max(RATE_LIMIT_MIN, self.rate * RATE_LIMIT_DECREASE)
+                self.stats["decreases"] += 1
+
+    # 限速器指标
+    def metrics(self) -> dict:
+        with self._lock:
+            result = dict(self.stats)
+            result["current_rate"] = round(self.rate, 3)
+        return result
+
+# 进程内共享的限速器
+rate_limiter = AdaptiveRateLimiter()
+
+# 第attempt次重试前的等待时间（指数退避 + 全抖动）
+def _backoff_delay(attempt: int) -> float:
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** (attempt - 1)))
+
+# 发送GET请求，返回响应和本次使用的Cookie（调用方负责归还Cookie）
+async def _send(url: str, **kwargs):
+    client = get_http_client()
+    host = urllib.parse.urlsplit(url).hostname or ""
+    await rate_limiter.acquire()
+    credential = cookie_pool.acquire()
+    try:
+        async with _get_host_semaphore(host):
+            resp = await client.get(url, headers=get_Header(credential), **kwargs)
+    except BaseException:
+        cookie_pool.release(credential)
+        raise
+    return resp, credential
+
+# 发送GET请求并返回响应（遇到限流状态码时退避重试）
+async def http_get(url: str, **kwargs) -> httpx.Response:
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        resp, credential = await _send(url, **kwargs)
+        cookie_pool.release(credential, resp.status_code == RISK_CONTROL_STATUS)
+        if resp.status_code not in THROTTLE_STATUS:
+            rate_limiter.on_success()
+            return resp
+        rate_limiter.on_throttle(retry=attempt < RETRY_MAX_ATTEMPTS)
+        if attempt < RETRY_MAX_ATTEMPTS:
+            await asyncio.sleep(_backoff_delay(attempt))
+    return resp
+
+# 发送GET请求并解析JSON（接口返回风控code时暂停该Cookie，遇到限流时退避重试，最多请求attempts次）；
+# 限流状态码的响应体通常是HTML页面，先按状态码判断，响应体无法解析时同样按限流处理。
+# signed为True（WBI签名的请求）时，-352多半是mixin key已轮换：直接返回给调用方刷新key后重试，
+# 不暂停Cookie、不降速、不计入重试
+async def fetch_json(url: str, attempts: int = RETRY_MAX_ATTEMPTS, signed: bool = False) -> dict:
+    for attempt in range(1, attempts + 1):
+        resp, credential = await _send(url)
+        throttled = resp.status_code in THROTTLE_STATUS
+        risk_controlled = resp.status_code == RISK_CONTROL_STATUS
+        data, code = None, None
+        signature_rejected = False
+        try:
+            data = json.loads(resp.content.decode('utf-8'))
+            code = data.get("code") if isinstance(data, dict) else None
+            signature_rejected = signed and not throttled and code == wbi.WBI_REJECTED_CODE
+            risk_controlled = risk_controlled or (code in RISK_CONTROL_CODES and not signature_rejected)
+        except ValueError:
+            if not throttled:
+                raise
+        finally:
+            cookie_pool.release(credential, risk_controlled)
+        if signature_rejected:
+            return data
+        if not throttled and code not in THROTTLE_CODES:
+            rate_limiter.on_success()
+            return data
+        rate_limiter.on_throttle(retry=attempt < attempts)
+        if attempt < attempts:
+            print(f"请求被限流（HTTP {resp.status_code}，code {code}），第{attempt}次重试")
+            await asyncio.sleep(_backoff_delay(attempt))
+    # 重试次数用完：有JSON时交给调用方按code处理，否则按HTTP状态码报错
+    if data is None:
+        resp.raise_for_status()
+    return data
+
+# 单个根评论的二级评论抓取状态
+class _SubReplyJob:
+    def __init__(self, root, pages):
+        self.root = root
+        self.pages = [None] * pages
+        self.remaining = pages
+        self.future = asyncio.get_running_loop().create_future()
+
+    # 所有分页完成后按页码顺序拼接，遇到空页即截止
+    def finish_page(self):
+        self.remaining -= 1
+        if self.remaining == 0 and not self.future.done():
+            result = []
+            for replies in self.pages:
+                if not replies:
+                    break
+                result.extend(replies)
+            self.future.set_result(result)
+
+# 二级评论并发抓取器：每个爬取任务一组worker，全局共享并发上限和速率上限
+class SubReplyFetcher:
+    def __init__(self, oid, workers: int = SECOND_LEVEL_WORKERS):
+        self.oid = oid
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.workers = [asyncio.ensure_future(self._worker()) for _ in range(workers)]
+
+    # 提交一个根评论，返回其二级评论（按接口顺序，从start_page页开始）的future
+    def submit(self, root, reply_count, max_items, start_page: int = 1):
+        pages = max(min(reply_count // 10 + 2 - start_page, (max_items + 9) // 10), 1)
+        job = _SubReplyJob(root, pages)
+        for page in range(start_page, start_page + pages):
+            self.queue.put_nowait((job, page, page - start_page))
+        return job.future
+
+    async def _worker(self):
+        while True:
+            job, page, slot = await self.queue.get()
+            try:
+                # 已取消或已失败的任务不再请求
+                if job.future.done():
+                    continue
+                second_url = f"https://api.bilibili.com/x/v2/reply/reply?oid={self.oid}&type=1&root={job.root}&ps=10&pn={page}&web_location=333.788"
+                state = _get_loop_state()
+                async with state["second_level_semaphore"]:
+                    second_comment = await fetch_json(second_url)
+                if 'data' in second_comment and 'replies' in second_comment['data'] and second_comment['data']['replies']:
+                    job.pages[slot] = second_comment['data']['replies']
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                job.finish_page()
+                self.queue.task_done()
+
+    async def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+# 从接口返回的评论中提取需要存储的字段
+def parse_reply(reply):
+    # 是否是大会员
+    if reply["member"]["vip"]["vipStatus"] == 0:
+        vip = "否"
+    else:
+        vip = "是"
+
+    # IP属地
+    try:
+        IP = reply["reply_control"]['location'][5:]
+    except:
+        IP = "未知"
+
+    # 相关回复数
+    try:
+        rereply = reply["reply_control"]["sub_reply_entry_text"]
+        rereply = int(re.findall(r'\d+', rereply)[0])
+    except:
+        rereply = 0
+
+    # 个性签名
+    try:
+        sign = reply['member']['sign']
+    except:
+        sign = ''
+
+    return {
+        "parent_id": reply["parent"],
+        "comment_id": reply["rpid"],
+        "user_id": reply["mid"],
+        "username": reply["member"]["uname"],
+        "user_level": reply["member"]["level_info"]["current_level"],
+        "gender": reply["member"]["sex"],
+        "content": reply["content"]["message"],
+        "comment_time": datetime.fromtimestamp(reply["ctime"]),
+        "reply_count": rereply,
+        "like_count": reply['like'],
+        "signature": sign,
+        "ip_location": IP,
+        "is_vip": vip,
+        "avatar": reply["member"]["avatar"],
+    }
+
+# 批量写入评论：按页或按行数缓冲，一个事务内executemany写入
+# （评论者资料按版本写入member_profiles表，每条评论关联写入时的资料版本）
+class CommentWriter:
+    INSERT_SQL = """
+    INSERT INTO comments (crawl_id, comment_index, parent_id, comment_id, user_id, profile_id, content, comment_time, reply_count, like_count, ip_location)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    PROFILE_QUERY = """
+    SELECT id FROM member_profiles
+    WHERE mid = ? AND username IS ? AND user_level IS ? AND gender IS ? AND signature IS ? AND is_vip IS ? AND avatar IS ?
+    """
+    PROFILE_SQL = """
+    INSERT INTO member_profiles (mid, username, user_level, gender, signature, is_vip, avatar, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    def __init__(self, crawl_id, batch_size: int = WRITE_BATCH_SIZE):
+        self.crawl_id = crawl_id
+        self.batch_size = batch_size
+        self.buffer = []
+        self.rows_written = 0
+        self.write_seconds = 0.0
+        # 断点信息，随评论在同一事务中写入
+        self.checkpoint = None
+
+    # 缓冲一条评论（资料版本在写入时查找或创建，缓冲中暂存资料本身）
+    def add(self, comment_index, row):
+        profile = (row["user_id"], row["username"], row["user_level"], GENDER_CODES.get(row["gender"], 0),
+                   row["signature"], VIP_CODES.get(row["is_vip"], 0), row["avatar"])
+        self.buffer.append((self.crawl_id, comment_index, row["parent_id"], row["comment_id"], row["user_id"],
+                            profile, row["content"], row["comment_time"], row["reply_count"], row["like_count"],
+                            row["ip_location"]))
+
+    # 缓冲达到批量大小时写入（只在根评论边界调用，保证根评论与其二级评论同一事务）
+    async def maybe_flush(self):
+        if len(self.buffer) >= self.batch_size:
+            await self.flush()
+
+    # 在数据库线程池中用一个事务写入缓冲的全部评论及最新断点，同时更新爬取记录的评论数（爬取过程中即可查询进度）；
+    # 缓冲和断点在交给线程池前取出，写入期间事件循环可以继续处理其他任务
+    async def flush(self):
+        if not self.buffer and self.checkpoint is None:
+            return
+        buffer, checkpoint = self.buffer, None
+        if self.checkpoint is not None:
+            page_offset, count, finished_roots = self.checkpoint
+            checkpoint = (str(page_offset), count, json.dumps(sorted(finished_roots)))
+        self.buffer, self.checkpoint = [], None
+        self.write_seconds += await db.run(self._write, buffer, checkpoint)
+        self.rows_written += len(buffer)
+
+    # 写入一批评论（在数据库线程池中执行），返回写入耗时
+    def _write(self, buffer, checkpoint) -> float:
+        conn = db.get_connection()
+        start = time.perf_counter()
+        with db.transaction(conn):
+            profile_ids = {profile: self._profile_id(conn, profile) for profile in {row[5] for row in buffer}}
+            conn.executemany(self.INSERT_SQL, [row[:5] + (profile_ids[row[5]],) + row[6:] for row in buffer])
+            if buffer:
+                conn.execute("UPDATE crawl_records SET comment_count = ? WHERE id = ?", (buffer[-1][1], self.crawl_id))
+            if checkpoint is not None:
+                page_offset, count, finished_roots = checkpoint
+                conn.execute("""
+                UPDATE crawl_checkpoints SET page_offset = ?, comment_count = ?, finished_roots = ?, updated_at = ?
+                WHERE crawl_id = ?
+                """, (page_offset, count, finished_roots, datetime.now(), self.crawl_id))
+        return time.perf_counter() - start
+
+    # 资料版本ID：与已有版本完全相同时复用，否则新增一个版本（在写事务中执行，并发写入不会重复创建）
+    def _profile_id(self, conn, profile) -> int:
+        row = conn.execute(self.PROFILE_QUERY, profile).fetchone()
+        if row:
+            return row[0]
+        return conn.execute(self.PROFILE_SQL, profile + (datetime.now(),)).lastrowid
+
+    # 写入吞吐量（行/秒）
+    @property
+    def rows_per_second(self) -> float:
+        if self.write_seconds <= 0:
+            return 0.0
+        return self.rows_written / self.write_seconds
+
+# 全部爬取任务累计的写入统计
+write_stats = {"rows": 0, "seconds": 0.0}
+
+# 构造一级评论分页请求地址（WBI签名）
+def build_main_url(oid, sort, next_pageID, mixin_key, wts=None):
+    params = {
+        "oid": oid,
+        "type": 1,
+        "mode": sort,
+        "pagination_str": json.dumps({"offset": str(next_pageID or "")}, separators=(",", ":")),
+        "plat": 1,
+        "web_location": 1315875,
+    }
+    # 第一页额外带上空的seek_rpid
+    if next_pageID == "":
+        params["seek_rpid"] = ""
+    return wbi.sign_url(MAIN_URL, params, mixin_key, wts)
+
+# 请求一级评论分页（请求间隔由全局限速器控制）；签名被拒绝时先刷新mixin key重新签名请求，
+# 刷新后仍返回-352才按风控处理（暂停Cookie、降速、退避重试）
+async def fetch_main_page(oid, sort, next_pageID):
+    mixin_key = await wbi.current_mixin_key(fetch_json)
+    comment = await fetch_json(build_main_url(oid, sort, next_pageID, mixin_key), attempts=1, signed=True)
+    if comment.get("code") == wbi.WBI_REJECTED_CODE:
+        mixin_key = await wbi.current_mixin_key(fetch_json, force_refresh=True)
+    elif comment.get("code") not in THROTTLE_CODES:
+        return comment
+    return await fetch_json(build_main_url(oid, sort, next_pageID, mixin_key))
+
+# 以下为爬取任务的数据库操作，通过db.run在数据库线程池中执行，不阻塞事件循环
+
+# 更新爬取状态为进行中，新任务创建断点记录
+def _begin_crawl(crawl_id, oid, limit_num, next_pageID, count, finished_roots):
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("UPDATE crawl_records SET status = ? WHERE id = ?", ("进行中", crawl_id))
+        conn.execute("""
+        INSERT OR IGNORE INTO crawl_checkpoints (crawl_id, oid, limit_num, page_offset, comment_count, finished_roots, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (crawl_id, str(oid), limit_num, str(next_pageID), count, finished_roots, datetime.now()))
+
+# 更新爬取记录状态为完成，并删除断点
+def _finish_crawl(crawl_id, count):
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("UPDATE crawl_records SET status = ?, end_time = ?, comment_count = ? WHERE id = ?",
+                     ("完成", datetime.now(), count, crawl_id))
+        conn.execute("DELETE FROM crawl_checkpoints WHERE crawl_id = ?", (crawl_id,))
+
+# 更新爬取记录状态为失败
+def _fail_crawl(crawl_id, status):
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("UPDATE crawl_records SET status = ?, end_time = ? WHERE id = ?", (status, datetime.now(), crawl_id))
+
+# 读取断点及爬取参数
+def _load_checkpoint(crawl_id):
+    return db.get_connection().execute("""
+    SELECT cr.bv, cr.mode, cr.is_second, cp.oid, cp.limit_num, cp.page_offset, cp.comment_count, cp.finished_roots
+    FROM crawl_checkpoints cp
+    JOIN crawl_records cr ON cr.id = cp.crawl_id
+    WHERE cp.crawl_id = ?
+    """, (crawl_id,)).fetchone()
+
+# 爬取评论并存储到数据库（在事件循环中运行，多个爬取任务共享同一个HTTP连接池）
+async def crawl_comments(crawl_id, bv, oid, next_pageID, count, is_second, mode, limit_num=300, finished_roots=None):
+    writer = CommentWriter(crawl_id)
+    # 已完整写入（含二级评论）的根评论，断点续爬时跳过
+    finished_roots = set(finished_roots or ())
+
+    # 更新爬取状态为进行中，新任务创建断点记录
+    await db.run(_begin_crawl, crawl_id, oid, limit_num, next_pageID, count, json.dumps(sorted(finished_roots)))
+
+    progress = CrawlProgress(crawl_id, limit_num, count)
+    progress.publish(force=True)
+    fetcher = SubReplyFetcher(oid) if is_second else None
+    next_page_task = None
+    pending = []
+
+    try:
+        sort = mode  # 2是最新评论，3是热门评论
+        next_page_task = asyncio.ensure_future(fetch_main_page(oid, sort, next_pageID))
+
+        # 爬取评论
+        while True:
+            comment = await next_page_task
+            next_page_task = None
+
+            # 如果没有评论数据，则退出循环
+            if 'data' not in comment or 'replies' not in comment['data'] or not comment['data']['replies']:
+                break
+
+            # 当前页的起始位置（断点续爬时从这里重新请求）
+            page_offset = next_pageID
+            replies = comment['data']['replies']
+            rows = [parse_reply(reply) for reply in replies if reply["rpid"] not in finished_roots]
+
+            # 先把本页所有需要二级评论的根评论交给并发抓取器，写入时再按顺序取结果
+            pending = []
+            for i, row in enumerate(rows):
+                budget = limit_num - count - i - 1
+                if fetcher and row["reply_count"] != 0 and budget > 0:
+                    pending.append(fetcher.submit(row["comment_id"], row["reply_count"], budget))
+                else:
+                    pending.append(None)
+
+            # 下一页的pageID
+            try:
+                next_pageID = comment['data']['cursor']['pagination_reply']['next_offset'] or 0
+            except:
+                next_pageID = 0
+
+            # 二级评论抓取的同时预取下一页一级评论
+            if next_pageID != 0 and count + len(rows) < limit_num:
+                next_page_task = asyncio.ensure_future(fetch_main_page(oid, sort, next_pageID))
+
+            # 按页内顺序写入评论，二级评论紧跟在其根评论之后，保证comment_index确定
+            for row, future in zip(rows, pending):
+                # 评论数量+1
+                count += 1
+
+                if count > limit_num:
+                    break
+
+                writer.add(count, row)
+
+                # 二级评论(如果开启了二级评论爬取，且该评论回复数不为0，则写入该评论的二级评论)
+                if future is not None and count < limit_num:
+                    for second in await future:
+                        # 评论数量+1
+                        count += 1
+
+                        if count > limit_num:
+                            break
+
+                        # 提取并存储二级评论
+                        writer.add(count, parse_reply(second))
+
+                        if count >= limit_num:
+                            break
+
+                    progress.second_level_done += 1
+                    progress.count = min(count, limit_num)
+                    progress.publish()
+
+                finished_roots.add(row["comment_id"])
+                writer.checkpoint = (page_offset, count, finished_roots)
+                await writer.maybe_flush()
+
+                if count >= limit_num:
+                    break
+
+            # 每页结束时写入本页剩余的评论，断点推进到下一页
+            writer.checkpoint = (next_pageID if next_pageID != 0 else page_offset, count, finished_roots)
+            await writer.flush()
+            progress.pages += 1
+            progress.count = min(count, limit_num)
+            progress.publish(force=True)
+
+            if count >= limit_num:
+                break
+
+            # 如果next_pageID为0，说明已经没有下一页了
+            if next_page_task is None:
+                break
+
+        await writer.flush()
+        write_stats["rows"] += writer.rows_written
+        write_stats["seconds"] += writer.write_seconds
+        print(f"爬取任务{crawl_id}写入{writer.rows_written}条评论，写入速度{writer.rows_per_second:.0f}行/秒")
+
+        # 更新爬取记录状态为完成，并删除断点
+        await db.run(_finish_crawl, crawl_id, count)
+        progress.count = min(count, limit_num)
+        progress.finish("done")
+
+    except Exception as e:
+        # 更新爬取记录状态为失败
+        await db.run(_fail_crawl, crawl_id, f"失败: {str(e)}")
+        progress.finish("failed", f"失败: {str(e)}")
+    finally:
+        # 被取消（应用关闭或租约丢失）时任务会重新排队
+        if not progress.finished:
+            progress.finish("interrupted")
+        # 取消未完成的预取和二级评论抓取
+        if next_page_task is not None:
+            next_page_task.cancel()
+        for future in pending:
+            if future is not None and not future.cancel() and not future.cancelled():
+                future.exception()
+        if fetcher:
+            await fetcher.close()
+
+# 从断点继续爬取：从断点所在页重新请求，跳过已写入的根评论，不重复写入
+async def resume_crawl(crawl_id):
+    checkpoint = await db.run(_load_checkpoint, crawl_id)
+    if checkpoint is None:
+        return
+    bv, mode, is_second, oid, limit_num, page_offset, count, finished_roots = checkpoint
+    await crawl_comments(crawl_id, bv, oid, page_offset, count, bool(is_second), mode, limit_num,
+                         finished_roots=json.loads(finished_roots))
+
+# 读取已存储的评论ID、根评论回复数和当前最大序号（早期数据库中ID列为TEXT，统一转为整数比较）；
+# 更新爬取状态为进行中，增量爬取接管该记录，旧断点不再有效
+def _begin_incremental(crawl_id, oid):
+    conn = db.get_connection()
+    known_ids = set()
+    root_reply_counts = {}
+    count = 0
+    for row in conn.execute("SELECT comment_id, parent_id, reply_count, comment_index FROM comments WHERE crawl_id = ?", (crawl_id,)):
+        comment_id = int(row["comment_id"])
+        known_ids.add(comment_id)
+        if int(row["parent_id"]) == 0:
+            root_reply_counts[comment_id] = row["reply_count"]
+        count = max(count, row["comment_index"])
+
+    with db.transaction(conn):
+        conn.execute("UPDATE crawl_records SET status = ?, oid = ? WHERE id = ?", ("进行中", str(oid), crawl_id))
+        conn.execute("DELETE FROM crawl_checkpoints WHERE crawl_id = ?", (crawl_id,))
+        analysis.invalidate_analysis_cache(conn, crawl_id)
+    return known_ids, root_reply_counts, count
+
+# 更新刷新过的根评论回复数，爬取记录状态更新为完成
+def _finish_incremental(crawl_id, count, refreshed):
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.executemany(REFRESH_ROOT_QUERY,
+                         [(reply_count, like_count, crawl_id, comment_id) for reply_count, like_count, comment_id in refreshed])
+        conn.execute("UPDATE crawl_records SET status = ?, end_time = ?, comment_count = ? WHERE id = ?",
+                     ("完成", datetime.now(), count, crawl_id))
+
+# 增量爬取：按最新排序（mode=2）翻页，遇到已存储的根评论所在页即停止；
+# 新评论追加到该爬取记录末尾并按comment_id去重，已存储的根评论只在回复数增长时刷新二级评论
+async def incremental_crawl(crawl_id, oid, is_second, limit_num=300):
+    # 已存储的评论ID、根评论回复数和当前最大序号，并把爬取状态更新为进行中
+    known_ids, root_reply_counts, count = await db.run(_begin_incremental, crawl_id, oid)
+    invalidate_count_cache(crawl_id)
+
+    writer = CommentWriter(crawl_id)
+    fetcher = SubReplyFetcher(oid) if is_second else None
+    pending = []
+    added = 0
+    pages = 0
+    # 增量爬取的进度按本次新增的评论数计算
+    progress = CrawlProgress(crawl_id, limit_num)
+    progress.publish(force=True)
+    refreshed = []  # 回复数增长的已存储根评论 (回复数, 点赞数, 评论ID)
+
+    try:
+        next_pageID = ""
+        while added < limit_num:
+            # 请求间隔由全局限速器控制
+            comment = await fetch_main_page(oid, 2, next_pageID)
+            pages += 1
+
+            if 'data' not in comment or 'replies' not in comment['data'] or not comment['data']['replies']:
+                break
+
+            rows = [parse_reply(reply) for reply in comment['data']['replies']]
+            reached_known = any(row["comment_id"] in known_ids for row in rows)
+
+            # 新根评论抓取全部二级评论；已存储的根评论从原有最后一页开始抓取新增的二级评论
+            pending = []
+            for row in rows:
+                future = None
+                stored_replies = root_reply_counts.get(row["comment_id"])
+                budget = limit_num - added
+                if fetcher and row["reply_count"] != 0 and budget > 0:
+                    if row["comment_id"] not in known_ids:
+                        future = fetcher.submit(row["comment_id"], row["reply_count"], budget)
+                    elif stored_replies is not None and row["reply_count"] > stored_replies:
+                        future = fetcher.submit(row["comment_id"], row["reply_count"], budget,
+                                                start_page=stored_replies // 10 + 1)
+                pending.append(future)
+
+            # 按页内顺序追加写入，已存储的评论跳过
+            for row, future in zip(rows, pending):
+                if added >= limit_num:
+                    break
+
+                if row["comment_id"] not in known_ids:
+                    count += 1
+                    added += 1
+                    writer.add(count, row)
+                    known_ids.add(row["comment_id"])
+                elif row["reply_count"] > root_reply_counts.get(row["comment_id"], row["reply_count"]):
+                    refreshed.append((row["reply_count"], row["like_count"], row["comment_id"]))
+
+                if future is not None:
+                    for second in await future:
+                        if added >= limit_num:
+                            break
+                        second_row = parse_reply(second)
+                        if second_row["comment_id"] in known_ids:
+                            continue
+                        count += 1
+                        added += 1
+                        writer.add(count, second_row)
+                        known_ids.add(second_row["comment_id"])
+                    progress.second_level_done += 1
+                    progress.count = added
+                    progress.publish()
+
+                await writer.maybe_flush()
+
+            await writer.flush()
+            progress.pages = pages
+            progress.count = added
+            progress.publish(force=True)
+
+            # 本页已出现存储过的评论，更早的评论都已爬取过
+            if reached_known:
+                break
+
+            try:
+                next_pageID = comment['data']['cursor']['pagination_reply']['next_offset'] or 0
+            except:
+                next_pageID = 0
+            if next_pageID == 0:
+                break
+
+        await writer.flush()
+        write_stats["rows"] += writer.rows_written
+        write_stats["seconds"] += writer.write_seconds
+        print(f"增量爬取任务{crawl_id}请求{pages}页，新增{added}条评论，刷新{len(refreshed)}个二级评论")
+
+        # 更新刷新过的根评论回复数，爬取记录状态更新为完成
+        await db.run(_finish_incremental, crawl_id, count, refreshed)
+        progress.finish("done")
+
+    except Exception as e:
+        # 更新爬取记录状态为失败（已写入的新评论保留，再次增量爬取时按comment_id去重）
+        await db.run(_fail_crawl, crawl_id, f"失败: {str(e)}")
+        progress.finish("failed", f"失败: {str(e)}")
+    finally:
+        if not progress.finished:
+            progress.finish("interrupted")
+        for future in pending:
+            if future is not None and not future.cancel() and not future.cancelled():
+                future.exception()
+        if fetcher:
+            await fetcher.close()
@@ -0,0 +1,189 @@
+import time
+import asyncio
+import sqlite3
+import functools
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# 数据库配置
+DB_PATH = 'bilibili_CH.db'
+JOURNAL_MODE = "WAL"  # 日志模式：WAL下写入不阻塞读取
+SYNCHRONOUS = "NORMAL"  # 同步级别：OFF/NORMAL/FULL
+BUSY_TIMEOUT_MS = 5000  # 等待写锁的最长时间（毫秒）
+CACHE_SIZE_KB = 16384  # 每个连接的页缓存大小（KB）
+CACHED_STATEMENTS = 256  # 每个连接缓存的预编译语句数
+POOL_WORKERS = 8  # 数据库线程池的线程数（每个线程一个长连接）
+
+# 每个线程复用一个长连接
+_local = threading.local()
+_registry_lock = threading.Lock()
+_connections = {}  # 线程ID -> 连接信息
+
+# 连接池统计
+_stats = {
+    "connections_opened": 0,
+    "checkouts": 0,
+    "leaked_transactions": 0,
+    "transactions": 0,
+    "lock_waits": 0,
+    "lock_wait_seconds": 0.0,
+    "max_lock_wait_seconds": 0.0,
+    "lock_timeouts": 0,
+    "pool_tasks": 0,
+    "pool_seconds": 0.0,
+}
+
+# 异步接口使用的数据库线程池
+_pool = None
+
+# 打开一个新连接并应用PRAGMA设置
+def open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        cached_statements=CACHED_STATEMENTS,
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    with _registry_lock:
+        _stats["connections_opened"] += 1
+    return conn
+
+# 获取当前线程的数据库连接（首次调用时创建）
+def get_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or threading.get_ident() not in _connections:
+        conn = open_connection()
+        _local.conn = conn
+        thread = threading.current_thread()
+        with _registry_lock:
+            # 线程ID被新线程复用时关闭已退出线程遗留的连接
+            stale = _connections.get(thread.ident)
+            if stale is not None:
+                stale["conn"].close()
+            _connections[thread.ident] = {
+                "conn": conn,
+                "thread": thread.name,
+                "opened_at": datetime.now(),
+                "checkouts": 0,
+            }
+    # 上一次使用者异常退出时遗留的事务直接回滚
+    elif conn.in_transaction:
+        conn.rollback()
+        with _registry_lock:
+            _stats["leaked_transactions"] += 1
+    with _registry_lock:
+        _stats["checkouts"] += 1
+        _connections[threading.get_ident()]["checkouts"] += 1
+    return conn
+
+# 各连接当前事务提交后要执行的回调：连接 -> [(函数, 参数)]
+_after_commit = {}
+
+# 登记在当前事务提交后执行的回调（事务回滚时丢弃）；连接不在事务中时立即执行
+def after_commit(conn: sqlite3.Connection, func, *args):
+    if not conn.in_transaction:
+        func(*args)
+        return
+    with _registry_lock:
+        _after_commit.setdefault(conn, []).append((func, args))
+
+# 写事务：BEGIN IMMEDIATE 获取写锁并统计等待时间，正常结束提交并执行after_commit登记的回调，异常回滚
+@contextmanager
+def transaction(conn: sqlite3.Connection = None):
+    conn = conn or get_connection()
+    start = time.perf_counter()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+    except sqlite3.OperationalError:
+        with _registry_lock:
+            _stats["lock_timeouts"] += 1
+        raise
+    waited = time.perf_counter() - start
+    with _registry_lock:
+        _stats["transactions"] += 1
+        if waited > 0.001:
+            _stats["lock_waits"] += 1
+        _stats["lock_wait_seconds"] += waited
+        _stats["max_lock_wait_seconds"] = max(_stats["max_lock_wait_seconds"], waited)
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        with _registry_lock:
+            _after_commit.pop(conn, None)
+        raise
+    else:
+        conn.commit()
+        with _registry_lock:
+            callbacks = _after_commit.pop(conn, [])
+        for func, args in callbacks:
+            func(*args)
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=POOL_WORKERS, thread_name_prefix="db")
+    return _pool
+
+def _timed_call(func, args, kwargs):
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        with _registry_lock:
+            _stats["pool_tasks"] += 1
+            _stats["pool_seconds"] += time.perf_counter() - start
+
+# 在数据库线程池中执行同步的数据库操作（func内通过get_connection取得所在线程的连接），不阻塞事件循环
+async def run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), _timed_call, func, args, kwargs)
+
+# 装饰器：把同步函数包装为在数据库线程池中执行的协程函数（保留原签名，可直接用作FastAPI接口）
+def in_pool(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+    return wrapper
+
+# 关闭数据库线程池（应用关闭时调用）
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+# 关闭所有线程的连接（应用关闭时调用）
+def close_all():
+    with _registry_lock:
+        connections = list(_connections.values())
+        _connections.clear()
+    for info in connections:
+        try:
+            info["conn"].close()
+        except sqlite3.Error:
+            pass
+    _local.__dict__.pop("conn", None)
+
+# 连接池与锁等待统计
+def stats() -> dict:
+    with _registry_lock:
+        result = dict(_stats)
+        result["open_connections"] = len(_connections)
+        result["threads"] = [
+            {"thread": info["thread"], "opened_at": info["opened_at"], "checkouts": info["checkouts"]}
+            for info in _connections.values()
+        ]
+    result["avg_lock_wait_ms"] = (result["lock_wait_seconds"] / result["transactions"] * 1000) if result["transactions"] else 0.0
+    result["journal_mode"] = JOURNAL_MODE
+    result["busy_timeout_ms"] = BUSY_TIMEOUT_MS
+    result["pool_workers"] = POOL_WORKERS
+    return result
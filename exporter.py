@@ -0,0 +1,259 @@
+import io
+import csv
+import json
+import time
+import zlib
+
+import db
+
+# pyarrow为可选依赖：未安装时不提供Parquet/Arrow导出
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    PYARROW_ENABLED = True
+except ImportError:
+    pa = pc = pq = None
+    PYARROW_ENABLED = False
+
+# zstandard为可选依赖：未安装时不提供zstd压缩
+try:
+    import zstandard
+    ZSTD_ENABLED = True
+except ImportError:
+    zstandard = None
+    ZSTD_ENABLED = False
+
+# 导出配置
+EXPORT_CHUNK_SIZE = 1000  # 每次从游标读取并编码的行数
+
+# 导出的列（数据库列名, 表头）
+EXPORT_COLUMNS = [
+    ("comment_index", "评论序号"),
+    ("parent_id", "父评论ID"),
+    ("comment_id", "评论ID"),
+    ("user_id", "用户ID"),
+    ("username", "用户名"),
+    ("user_level", "用户等级"),
+    ("gender", "性别"),
+    ("content", "评论内容"),
+    ("comment_time", "评论时间"),
+    ("reply_count", "回复数"),
+    ("like_count", "点赞数"),
+    ("signature", "个性签名"),
+    ("ip_location", "IP属地"),
+    ("is_vip", "是否大会员"),
+    ("avatar", "头像链接"),
+]
+
+# 整数列（早期数据库中ID列为TEXT，JSONL和列式导出时统一转换为整数）
+INTEGER_COLUMNS = {"comment_index", "parent_id", "comment_id", "user_id", "user_level", "reply_count", "like_count"}
+
+# 导出格式：格式名 -> (媒体类型, 扩展名)
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", ".csv"),
+    "jsonl": ("application/x-ndjson", ".jsonl"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", ".arrows"),
+}
+
+# 压缩方式：压缩名 -> (媒体类型, 扩展名)
+EXPORT_COMPRESSIONS = {
+    "gzip": ("application/gzip", ".gz"),
+    "zstd": ("application/zstd", ".zst"),
+}
+
+# 导出统计：首字节时间（毫秒）和导出行数
+export_stats = {"exports": 0, "rows": 0, "last_ttfb_ms": 0.0, "max_ttfb_ms": 0.0}
+
+# 导出查询：按评论序号读取导出列
+def export_query(from_clause: str, where_clause: str) -> str:
+    columns = ", ".join(f"comments.{name}" for name, _ in EXPORT_COLUMNS)
+    return f"SELECT {columns} FROM {from_clause} WHERE {where_clause} ORDER BY comments.comment_index"
+
+# 分块读取评论：使用独立连接，导出期间不占用请求线程的连接
+def iter_comment_chunks(from_clause: str, where_clause: str, query_params, chunk_size: int = EXPORT_CHUNK_SIZE):
+    conn = db.open_connection()
+    try:
+        cursor = conn.execute(export_query(from_clause, where_clause), query_params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+# 把评论分块编码为CSV字节流（带UTF-8 BOM，Excel可直接识别编码）
+def stream_csv(chunks, started: float = None):
+    started = started or time.perf_counter()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for _, header in EXPORT_COLUMNS])
+    yield _record_first_byte(started, "\ufeff" + buffer.getvalue())
+
+    rows_written = 0
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        rows_written += len(rows)
+        yield buffer.getvalue().encode("utf-8")
+    export_stats["rows"] += rows_written
+
+# 记录首字节时间并返回编码后的首块数据
+def _record_first_byte(started: float, text: str) -> bytes:
+    ttfb_ms = (time.perf_counter() - started) * 1000
+    export_stats["exports"] += 1
+    export_stats["last_ttfb_ms"] = ttfb_ms
+    export_stats["max_ttfb_ms"] = max(export_stats["max_ttfb_ms"], ttfb_ms)
+    return text.encode("utf-8")
+
+# 评论逐行输出为JSON（列名使用数据库列名，保留数值类型）
+def stream_jsonl(chunks, started: float = None):
+    started = started or time.perf_counter()
+    names = [name for name, _ in EXPORT_COLUMNS]
+    converters = [_as_int if name in INTEGER_COLUMNS else None for name in names]
+    first = True
+    rows_written = 0
+    for rows in chunks:
+        text = "".join(
+            json.dumps({
+                name: convert(value) if convert else value
+                for name, convert, value in zip(names, converters, row)
+            }, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+        rows_written += len(rows)
+        if first:
+            first = False
+            yield _record_first_byte(started, text)
+        else:
+            yield text.encode("utf-8")
+    if first:
+        yield _record_first_byte(started, "")
+    export_stats["rows"] += rows_written
+
+def _as_int(value):
+    return None if value is None or value == "" else int(value)
+
+# 列式导出的类型：整数列使用定长类型，性别/VIP/IP属地使用字典编码
+def arrow_schema():
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("comment_index", pa.int64()),
+        ("parent_id", pa.int64()),
+        ("comment_id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("username", pa.string()),
+        ("user_level", pa.int8()),
+        ("gender", category),
+        ("content", pa.string()),
+        ("comment_time", pa.timestamp("s")),
+        ("reply_count", pa.int32()),
+        ("like_count", pa.int32()),
+        ("signature", pa.string()),
+        ("ip_location", category),
+        ("is_vip", category),
+        ("avatar", pa.string()),
+    ])
+
+# 把一块评论转换为Arrow RecordBatch
+def _to_record_batch(rows, schema):
+    arrays = []
+    for index, field in enumerate(schema):
+        values = [row[index] for row in rows]
+        if pa.types.is_dictionary(field.type):
+            array = pa.array(values, type=pa.string()).dictionary_encode()
+        elif pa.types.is_timestamp(field.type):
+            array = pc.strptime(pa.array(values, type=pa.string()), format="%Y-%m-%d %H:%M:%S", unit="s", error_is_null=True)
+        elif field.name in INTEGER_COLUMNS:
+            array = pa.array([_as_int(value) for value in values], type=field.type)
+        else:
+            array = pa.array(values, type=field.type)
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+# 写入端：收集写出的字节，每写完一块就取出发送
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+# 按块写出Parquet（每块一个row group）或Arrow IPC流
+def stream_arrow(chunks, fmt: str, started: float = None):
+    started = started or time.perf_counter()
+    schema = arrow_schema()
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    first = True
+    rows_written = 0
+    try:
+        for rows in chunks:
+            writer.write_batch(_to_record_batch(rows, schema))
+            rows_written += len(rows)
+            data = sink.drain()
+            if first:
+                first = False
+                yield _record_first_byte(started, "") + data
+            elif data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    yield (_record_first_byte(started, "") + data) if first else data
+    export_stats["rows"] += rows_written
+
+# 对任意格式的字节流做gzip或zstd压缩
+def compress_stream(stream, compression: str):
+    if compression == "gzip":
+        compressor = zlib.compressobj(wbits=31)
+    else:
+        compressor = zstandard.ZstdCompressor().compressobj()
+    for data in stream:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+# 校验导出格式和压缩方式，返回 (媒体类型, 扩展名)，不支持时抛出ValueError
+def resolve_format(fmt: str, compression: str = None):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式：{fmt}，可选 {'/'.join(EXPORT_FORMATS)}")
+    if fmt in ("parquet", "arrow") and not PYARROW_ENABLED:
+        raise ValueError(f"服务器未安装pyarrow，无法导出{fmt}格式")
+    media_type, extension = EXPORT_FORMATS[fmt]
+    if compression:
+        if compression not in EXPORT_COMPRESSIONS:
+            raise ValueError(f"不支持的压缩方式：{compression}，可选 {'/'.join(EXPORT_COMPRESSIONS)}")
+        if compression == "zstd" and not ZSTD_ENABLED:
+            raise ValueError("服务器未安装zstandard，无法使用zstd压缩")
+        media_type, compressed_extension = EXPORT_COMPRESSIONS[compression]
+        extension += compressed_extension
+    return media_type, extension
+
+# 按格式和压缩方式生成导出字节流
+def stream_export(chunks, fmt: str = "csv", compression: str = None, started: float = None):
+    if fmt == "csv":
+        stream = stream_csv(chunks, started)
+    elif fmt == "jsonl":
+        stream = stream_jsonl(chunks, started)
+    else:
+        stream = stream_arrow(chunks, fmt, started)
+    if compression:
+        stream = compress_stream(stream, compression)
+    return stream
@@ -0,0 +1,142 @@
+import re
+import math
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+# jieba为可选依赖：未安装时退回按汉字二元组切分
+try:
+    import jieba
+    jieba.setLogLevel(logging.WARNING)
+    JIEBA_ENABLED = True
+except ImportError:
+    jieba = None
+    JIEBA_ENABLED = False
+
+# 词云配置
+HIGH_REPLY_THRESHOLD = 5  # 高回复评论：回复数大于该值
+HIGH_LIKE_THRESHOLD = 10  # 高点赞评论：点赞数大于该值
+SAMPLE_LIMIT = 20  # 每个词云默认取回复数/点赞数最高的评论数（与原先统计接口返回的高回复/高点赞评论数一致）
+MAX_SAMPLE_LIMIT = 500  # 接口允许指定的样本评论数上限
+TOP_K = 50  # 每个词云返回的词数
+MIN_WORD_LENGTH = 2  # 词的最少字符数
+
+# 并行分词配置：评论数超过阈值时分块交给进程池
+PARALLEL_THRESHOLD = 5000
+PARALLEL_CHUNK_SIZE = 2000
+PARALLEL_WORKERS = 4
+
+# 停用词
+STOPWORDS = frozenset("""
+的 了 是 在 我 你 他 她 它 这 那 有 和 与 或 但 而 就 都 也 还 只 又 很 更 最 啊 吧 呢 吗 哦 哈 嗯
+非常 特别 真的 确实 应该 可以 能够 不是 没有 不会 不能 不要 不用 一个 一些 一样 什么 怎么 为什么
+哪里 哪个 多少 几个 我们 你们 他们 她们 它们 自己 这个 那个 这样 那样 这些 那些 这么 那么 因为 所以
+但是 然后 如果 虽然 就是 还是 而且 或者 已经 现在 时候 知道 觉得 感觉 其实 可能 一下 一直 还有 只是
+不过 真是 看到 出来 起来 回复 哈哈 哈哈哈 哈哈哈哈 doge 笑哭 打call 大哭 the and
+""".split())
+
+# B站表情（如[doge]）、链接和@用户名在分词前去掉
+_NOISE_RE = re.compile(r"\[[^\[\]]{1,20}\]|https?://\S+|@\S+")
+_CJK_RUN_RE = re.compile(r"[\u4e00-\u9fff]+|[A-Za-z][A-Za-z0-9]+")
+_WORD_RE = re.compile(r"[\u4e00-\u9fffA-Za-z]")
+
+_executor = None
+
+# 把一条评论切分为去重前的词列表
+def tokenize(text: str) -> list:
+    text = _NOISE_RE.sub(" ", text or "")
+    if JIEBA_ENABLED:
+        words = jieba.lcut(text)
+    else:
+        # 无jieba时：英文按单词，中文按相邻两字切分
+        words = []
+        for run in _CJK_RUN_RE.findall(text):
+            if run.isascii():
+                words.append(run)
+            else:
+                words.extend(run[i:i + 2] for i in range(len(run) - 1))
+    result = []
+    for word in words:
+        word = word.strip().lower()
+        if len(word) >= MIN_WORD_LENGTH and word not in STOPWORDS and _WORD_RE.search(word):
+            result.append(word)
+    return result
+
+# 统计一块评论：全部评论的文档频率，以及高回复/高点赞样本的词频
+def _count_chunk(rows):
+    document_freq = Counter()
+    reply_freq = Counter()
+    like_freq = Counter()
+    for content, in_reply, in_like in rows:
+        words = tokenize(content)
+        document_freq.update(set(words))
+        if in_reply:
+            reply_freq.update(words)
+        if in_like:
+            like_freq.update(words)
+    return document_freq, reply_freq, like_freq
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PARALLEL_WORKERS)
+    return _executor
+
+# 关闭分词进程池（应用关闭时调用）
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+# TF-IDF权重：样本内词频 × 平滑后的逆文档频率（以全部筛选评论为语料）
+def _tf_idf(term_freq: Counter, document_freq: Counter, total_documents: int, top_k: int):
+    weighted = [
+        (word, count * (math.log((1 + total_documents) / (1 + document_freq[word])) + 1))
+        for word, count in term_freq.items()
+    ]
+    weighted.sort(key=lambda item: (-item[1], item[0]))
+    return [{"name": word, "value": round(weight, 3)} for word, weight in weighted[:top_k]]
+
+# 计算高回复、高点赞两个词云：一次读取筛选后的评论，同时统计语料文档频率和两个样本的词频
+def compute_word_clouds(conn, from_clause: str, where_clause: str, query_params, top_k: int = TOP_K,
+                        sample_limit: int = SAMPLE_LIMIT) -> dict:
+    reply_ids = _sample_ids(conn, from_clause, where_clause, query_params, "reply_count", HIGH_REPLY_THRESHOLD, sample_limit)
+    like_ids = _sample_ids(conn, from_clause, where_clause, query_params, "like_count", HIGH_LIKE_THRESHOLD, sample_limit)
+
+    rows = [
+        (row["content"], row["id"] in reply_ids, row["id"] in like_ids)
+        for row in conn.execute(
+            f"SELECT comments.id, comments.content FROM {from_clause} WHERE {where_clause}",
+            query_params
+        )
+    ]
+
+    if len(rows) > PARALLEL_THRESHOLD:
+        chunks = [rows[i:i + PARALLEL_CHUNK_SIZE] for i in range(0, len(rows), PARALLEL_CHUNK_SIZE)]
+        results = list(_get_executor().map(_count_chunk, chunks))
+    else:
+        results = [_count_chunk(rows)]
+
+    document_freq, reply_freq, like_freq = Counter(), Counter(), Counter()
+    for chunk_document_freq, chunk_reply_freq, chunk_like_freq in results:
+        document_freq.update(chunk_document_freq)
+        reply_freq.update(chunk_reply_freq)
+        like_freq.update(chunk_like_freq)
+
+    return {
+        "documents": len(rows),
+        "segmenter": "jieba" if JIEBA_ENABLED else "bigram",
+        "reply_words": _tf_idf(reply_freq, document_freq, len(rows), top_k),
+        "like_words": _tf_idf(like_freq, document_freq, len(rows), top_k),
+    }
+
+# 回复数或点赞数最高的样本评论ID
+def _sample_ids(conn, from_clause, where_clause, query_params, column, threshold, sample_limit):
+    rows = conn.execute(f"""
+    SELECT comments.id FROM {from_clause}
+    WHERE {where_clause} AND comments.{column} > ?
+    ORDER BY comments.{column} DESC, comments.comment_index
+    LIMIT ?
+    """, list(query_params) + [threshold, sample_limit])
+    return {row["id"] for row in rows}
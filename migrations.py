@@ -0,0 +1,610 @@
+import sys
+import json
+import sqlite3
+
+import db
+
+# 数据库结构迁移：按版本号顺序执行，已执行的版本记录在 PRAGMA user_version 中。
+# 新增迁移时只在列表末尾追加，不要修改已发布的迁移。
+
+# 1. 基础表结构
+def _create_base_tables(conn):
+    # 创建爬取记录表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        bv TEXT NOT NULL,
+        title TEXT NOT NULL,
+        mode INTEGER NOT NULL,
+        is_second BOOLEAN NOT NULL,
+        comment_count INTEGER NOT NULL,
+        start_time TIMESTAMP NOT NULL,
+        end_time TIMESTAMP,
+        status TEXT NOT NULL,
+        user_id INTEGER
+    )
+    ''')
+
+    # 创建评论表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS comments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        crawl_id INTEGER NOT NULL,
+        comment_index INTEGER NOT NULL,
+        parent_id INTEGER NOT NULL,
+        comment_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        user_level INTEGER NOT NULL,
+        gender TEXT NOT NULL,
+        content TEXT NOT NULL,
+        comment_time TIMESTAMP NOT NULL,
+        reply_count INTEGER NOT NULL,
+        like_count INTEGER NOT NULL,
+        signature TEXT,
+        ip_location TEXT,
+        is_vip TEXT,
+        avatar TEXT,
+        FOREIGN KEY (crawl_id) REFERENCES crawl_records (id)
+    )
+    ''')
+
+    # 创建用户表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        email TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        level INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+    # 创建验证码缓存表
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS verification_codes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT NOT NULL,
+        code TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+# 2. 爬取记录表添加用户ID字段（早期数据库没有该字段）
+def _add_crawl_records_user_id(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(crawl_records)")]
+    if "user_id" not in columns:
+        conn.execute("ALTER TABLE crawl_records ADD COLUMN user_id INTEGER")
+
+# 3. 爬取断点表（记录分页游标、已爬数量和已完成的根评论，用于断点续爬）
+def _create_crawl_checkpoints(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+        crawl_id INTEGER PRIMARY KEY,
+        oid TEXT NOT NULL,
+        limit_num INTEGER NOT NULL,
+        page_offset TEXT NOT NULL,
+        comment_count INTEGER NOT NULL,
+        finished_roots TEXT NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        FOREIGN KEY (crawl_id) REFERENCES crawl_records (id)
+    )
+    ''')
+
+# 4. 评论、爬取记录和验证码的查询索引
+def _create_query_indexes(conn):
+    # 评论列表/下载/删除：按 crawl_id 过滤并按 comment_index 排序
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_crawl_index ON comments (crawl_id, comment_index)")
+    # 普通用户的爬取记录列表：按 user_id 过滤并按 start_time 倒序
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_records_user_start ON crawl_records (user_id, start_time)")
+    # 管理员的爬取记录列表：按 start_time 倒序
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_records_start ON crawl_records (start_time)")
+    # 注册时按邮箱查最新验证码
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_verification_codes_email ON verification_codes (email, created_at)")
+
+# 5. 评论内容全文索引（trigram分词，适用于中文子串搜索），通过触发器与comments表同步
+def _create_comments_fts(conn):
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+            content, signature,
+            content = 'comments', content_rowid = 'id',
+            tokenize = 'trigram'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite版本过旧（<3.34）不支持trigram分词时跳过，关键词搜索退回LIKE
+        print(f"跳过评论全文索引：{e}")
+        return
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts (rowid, content, signature) VALUES (new.id, new.content, new.signature);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, content, signature) VALUES ('delete', old.id, old.content, old.signature);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF content, signature ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, content, signature) VALUES ('delete', old.id, old.content, old.signature);
+        INSERT INTO comments_fts (rowid, content, signature) VALUES (new.id, new.content, new.signature);
+    END
+    """)
+    # 为已有评论建立索引
+    conn.execute("INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')")
+
+# 6. 统计分析结果缓存（已完成爬取记录的分布统计等，按筛选条件哈希区分）
+def _create_analysis_cache(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS analysis_cache (
+        crawl_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        filter_hash TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (crawl_id, kind, filter_hash),
+        FOREIGN KEY (crawl_id) REFERENCES crawl_records (id)
+    )
+    ''')
+
+# 7. 增量爬取：爬取记录保存视频oid，评论按comment_id去重和更新
+def _add_incremental_crawl_columns(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(crawl_records)")]
+    if "oid" not in columns:
+        conn.execute("ALTER TABLE crawl_records ADD COLUMN oid TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_crawl_comment_id ON comments (crawl_id, comment_id)")
+
+# 8. 评论者资料拆分到members表（按B站mid去重），性别和大会员改为整数编码；
+#    comment_details视图按原有列名和取值还原评论数据，接口查询都通过该视图进行
+def _normalize_members(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS members (
+        mid INTEGER PRIMARY KEY,
+        username TEXT NOT NULL,
+        user_level INTEGER NOT NULL,
+        gender INTEGER NOT NULL,
+        signature TEXT,
+        is_vip INTEGER NOT NULL,
+        avatar TEXT,
+        updated_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+    # 每个用户取最后写入的一条评论上的资料
+    conn.execute('''
+    INSERT OR REPLACE INTO members (mid, username, user_level, gender, signature, is_vip, avatar, updated_at)
+    SELECT CAST(user_id AS INTEGER), username, user_level,
+           CASE gender WHEN '男' THEN 1 WHEN '女' THEN 2 ELSE 0 END,
+           signature,
+           CASE is_vip WHEN '是' THEN 1 ELSE 0 END,
+           avatar, CURRENT_TIMESTAMP
+    FROM comments
+    WHERE id IN (SELECT MAX(id) FROM comments GROUP BY CAST(user_id AS INTEGER))
+    ''')
+
+    # 旧的全文索引包含个性签名列，随comments表一起重建
+    for trigger in ("comments_fts_insert", "comments_fts_delete", "comments_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS comments_fts")
+
+    # 重建comments表：去掉资料列，ID列统一为INTEGER
+    conn.execute('''
+    CREATE TABLE comments_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        crawl_id INTEGER NOT NULL,
+        comment_index INTEGER NOT NULL,
+        parent_id INTEGER NOT NULL,
+        comment_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        comment_time TIMESTAMP NOT NULL,
+        reply_count INTEGER NOT NULL,
+        like_count INTEGER NOT NULL,
+        ip_location TEXT,
+        FOREIGN KEY (crawl_id) REFERENCES crawl_records (id),
+        FOREIGN KEY (user_id) REFERENCES members (mid)
+    )
+    ''')
+    conn.execute('''
+    INSERT INTO comments_new (id, crawl_id, comment_index, parent_id, comment_id, user_id, content, comment_time, reply_count, like_count, ip_location)
+    SELECT id, crawl_id, comment_index, CAST(parent_id AS INTEGER), CAST(comment_id AS INTEGER), CAST(user_id AS INTEGER),
+           content, comment_time, reply_count, like_count, ip_location
+    FROM comments
+    ''')
+    conn.execute("DROP TABLE comments")
+    conn.execute("ALTER TABLE comments_new RENAME TO comments")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_crawl_index ON comments (crawl_id, comment_index)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_crawl_comment_id ON comments (crawl_id, comment_id)")
+
+    # LEFT JOIN 主键查找：只用到评论列的查询（如计数）可省略连接
+    conn.execute('''
+    CREATE VIEW IF NOT EXISTS comment_details AS
+    SELECT c.id, c.crawl_id, c.comment_index, c.parent_id, c.comment_id, c.user_id,
+           m.username, m.user_level,
+           CASE m.gender WHEN 1 THEN '男' WHEN 2 THEN '女' ELSE '保密' END AS gender,
+           c.content, c.comment_time, c.reply_count, c.like_count,
+           m.signature, c.ip_location,
+           CASE m.is_vip WHEN 1 THEN '是' ELSE '否' END AS is_vip,
+           m.avatar
+    FROM comments c
+    LEFT JOIN members m ON m.mid = c.user_id
+    ''')
+
+    # 全文索引：评论内容和个性签名分别建索引
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+            content, content = 'comments', content_rowid = 'id', tokenize = 'trigram'
+        )
+        """)
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS members_fts USING fts5(
+            signature, content = 'members', content_rowid = 'mid', tokenize = 'trigram'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"跳过评论全文索引：{e}")
+        return
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF content ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS members_fts_insert AFTER INSERT ON members BEGIN
+        INSERT INTO members_fts (rowid, signature) VALUES (new.mid, new.signature);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS members_fts_delete AFTER DELETE ON members BEGIN
+        INSERT INTO members_fts (members_fts, rowid, signature) VALUES ('delete', old.mid, old.signature);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS members_fts_update AFTER UPDATE OF signature ON members BEGIN
+        INSERT INTO members_fts (members_fts, rowid, signature) VALUES ('delete', old.mid, old.signature);
+        INSERT INTO members_fts (rowid, signature) VALUES (new.mid, new.signature);
+    END
+    """)
+    conn.execute("INSERT INTO comments_fts (comments_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO members_fts (members_fts) VALUES ('rebuild')")
+
+# 9. 视频信息缓存（BV号 -> oid、标题、评论数），按最近使用时间淘汰
+def _create_video_cache(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS video_cache (
+        bv TEXT PRIMARY KEY,
+        oid TEXT NOT NULL,
+        title TEXT,
+        reply_count INTEGER,
+        fetched_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_video_cache_last_used ON video_cache (last_used)")
+
+# 10. 爬取任务队列（持久化，重启后恢复；调度器按优先级、用户轮转和并发配额派发）
+def _create_crawl_jobs(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        crawl_id INTEGER NOT NULL,
+        user_id INTEGER,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        priority INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        error TEXT,
+        FOREIGN KEY (crawl_id) REFERENCES crawl_records (id)
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_jobs_status_priority ON crawl_jobs (status, priority DESC, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_jobs_crawl ON crawl_jobs (crawl_id)")
+
+# 11. 爬取任务租约（worker_id、租约到期时间、领取次数），工作进程失联后任务可被重新领取
+def _add_crawl_job_leases(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(crawl_jobs)")]
+    if "worker_id" not in columns:
+        conn.execute("ALTER TABLE crawl_jobs ADD COLUMN worker_id TEXT")
+    if "lease_expires_at" not in columns:
+        conn.execute("ALTER TABLE crawl_jobs ADD COLUMN lease_expires_at REAL")
+    if "attempts" not in columns:
+        conn.execute("ALTER TABLE crawl_jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+# 12. 批量爬取分组（一次提交的多个视频），爬取记录关联所属分组
+def _create_crawl_groups(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS crawl_groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        name TEXT,
+        total INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_groups_user ON crawl_groups (user_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_groups_created ON crawl_groups (created_at)")
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(crawl_records)")]
+    if "group_id" not in columns:
+        conn.execute("ALTER TABLE crawl_records ADD COLUMN group_id INTEGER")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_records_group ON crawl_records (group_id)")
+
+# 13. 爬取记录保存评论数量上限，服务重启后恢复任务时使用（已有记录从任务参数中补全）
+def _add_crawl_records_limit_num(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(crawl_records)")]
+    if "limit_num" not in columns:
+        conn.execute("ALTER TABLE crawl_records ADD COLUMN limit_num INTEGER")
+    limits = {}
+    for crawl_id, payload in conn.execute("SELECT crawl_id, payload FROM crawl_jobs ORDER BY id"):
+        try:
+            limit_num = json.loads(payload).get("limit_num")
+        except (TypeError, ValueError, AttributeError):
+            continue
+        if limit_num:
+            limits[crawl_id] = limit_num
+    conn.executemany("UPDATE crawl_records SET limit_num = ? WHERE id = ? AND limit_num IS NULL",
+                     [(limit_num, crawl_id) for crawl_id, limit_num in limits.items()])
+
+# 14. 按状态查找爬取记录（启动时为进行中/等待中的记录补建任务）
+def _add_crawl_records_status_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_crawl_records_status ON crawl_records (status)")
+
+# 15. 评论者资料按版本保存：members表只保留每个用户最新的资料，旧评论会显示用户后来的昵称、等级和签名。
+#     改为member_profiles表，资料变化时新增一个版本（相同的资料共用一行），每条评论关联写入时的资料版本。
+#     迁移前已写入的评论只有members表中的最新资料，全部关联到该版本
+def _version_member_profiles(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS member_profiles (
+        id INTEGER PRIMARY KEY,
+        mid INTEGER NOT NULL,
+        username TEXT NOT NULL,
+        user_level INTEGER NOT NULL,
+        gender INTEGER NOT NULL,
+        signature TEXT,
+        is_vip INTEGER NOT NULL,
+        avatar TEXT,
+        created_at TIMESTAMP NOT NULL
+    )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_member_profiles_mid ON member_profiles (mid)")
+    conn.execute('''
+    INSERT INTO member_profiles (mid, username, user_level, gender, signature, is_vip, avatar, created_at)
+    SELECT mid, username, user_level, gender, signature, is_vip, avatar, updated_at FROM members
+    ''')
+
+    # 视图和触发器引用了要重建的表，先删除
+    conn.execute("DROP VIEW IF EXISTS comment_details")
+    for trigger in ("members_fts_insert", "members_fts_delete", "members_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS members_fts")
+
+    # 重建comments表：增加资料版本列，user_id不再引用members表
+    conn.execute('''
+    CREATE TABLE comments_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        crawl_id INTEGER NOT NULL,
+        comment_index INTEGER NOT NULL,
+        parent_id INTEGER NOT NULL,
+        comment_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        profile_id INTEGER,
+        content TEXT NOT NULL,
+        comment_time TIMESTAMP NOT NULL,
+        reply_count INTEGER NOT NULL,
+        like_count INTEGER NOT NULL,
+        ip_location TEXT,
+        FOREIGN KEY (crawl_id) REFERENCES crawl_records (id),
+        FOREIGN KEY (profile_id) REFERENCES member_profiles (id)
+    )
+    ''')
+    conn.execute('''
+    INSERT INTO comments_new (id, crawl_id, comment_index, parent_id, comment_id, user_id, profile_id, content, comment_time, reply_count, like_count, ip_location)
+    SELECT c.id, c.crawl_id, c.comment_index, c.parent_id, c.comment_id, c.user_id, p.id,
+           c.content, c.comment_time, c.reply_count, c.like_count, c.ip_location
+    FROM comments c
+    LEFT JOIN member_profiles p ON p.mid = c.user_id
+    ''')
+    conn.execute("DROP TABLE comments")
+    conn.execute("DROP TABLE members")
+    conn.execute("ALTER TABLE comments_new RENAME TO comments")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_crawl_index ON comments (crawl_id, comment_index)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_comments_crawl_comment_id ON comments (crawl_id, comment_id)")
+
+    # 视图额外提供性别和大会员的整数编码列（gender_code、vip_code），筛选时直接比较编码
+    conn.execute('''
+    CREATE VIEW IF NOT EXISTS comment_details AS
+    SELECT c.id, c.crawl_id, c.comment_index, c.parent_id, c.comment_id, c.user_id,
+           p.username, p.user_level,
+           CASE p.gender WHEN 1 THEN '男' WHEN 2 THEN '女' ELSE '保密' END AS gender,
+           c.content, c.comment_time, c.reply_count, c.like_count,
+           p.signature, c.ip_location,
+           CASE p.is_vip WHEN 1 THEN '是' ELSE '否' END AS is_vip,
+           p.avatar, c.profile_id, p.gender AS gender_code, p.is_vip AS vip_code
+    FROM comments c
+    LEFT JOIN member_profiles p ON p.id = c.profile_id
+    ''')
+
+    # 个性签名全文索引改为按资料版本建立（资料版本写入后不再修改）；评论内容索引的触发器随表重建
+    try:
+        conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS member_profiles_fts USING fts5(
+            signature, content = 'member_profiles', content_rowid = 'id', tokenize = 'trigram'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"跳过个性签名全文索引：{e}")
+        return
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS member_profiles_fts_insert AFTER INSERT ON member_profiles BEGIN
+        INSERT INTO member_profiles_fts (rowid, signature) VALUES (new.id, new.signature);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS member_profiles_fts_delete AFTER DELETE ON member_profiles BEGIN
+        INSERT INTO member_profiles_fts (member_profiles_fts, rowid, signature) VALUES ('delete', old.id, old.signature);
+    END
+    """)
+    conn.execute("INSERT INTO member_profiles_fts (member_profiles_fts) VALUES ('rebuild')")
+
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'comments_fts'").fetchone():
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_fts_insert AFTER INSERT ON comments BEGIN
+            INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """)
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_fts_delete AFTER DELETE ON comments BEGIN
+            INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """)
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS comments_fts_update AFTER UPDATE OF content ON comments BEGIN
+            INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """)
+
+MIGRATIONS = [
+    (1, "基础表结构", _create_base_tables),
+    (2, "crawl_records 添加 user_id 字段", _add_crawl_records_user_id),
+    (3, "爬取断点表", _create_crawl_checkpoints),
+    (4, "查询索引", _create_query_indexes),
+    (5, "评论全文索引", _create_comments_fts),
+    (6, "统计分析缓存表", _create_analysis_cache),
+    (7, "增量爬取字段与索引", _add_incremental_crawl_columns),
+    (8, "评论者资料拆分到members表", _normalize_members),
+    (9, "视频信息缓存表", _create_video_cache),
+    (10, "爬取任务队列表", _create_crawl_jobs),
+    (11, "爬取任务租约字段", _add_crawl_job_leases),
+    (12, "批量爬取分组", _create_crawl_groups),
+    (13, "爬取记录保存数量上限", _add_crawl_records_limit_num),
+    (14, "爬取记录状态索引", _add_crawl_records_status_index),
+    (15, "评论者资料按版本保存", _version_member_profiles),
+]
+
+# 当前数据库结构版本
+def get_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# 执行所有未执行的迁移，每个迁移在单独的事务中完成
+def migrate(conn=None) -> int:
+    conn = conn or db.get_connection()
+    version = get_version(conn)
+    for target, description, apply in MIGRATIONS:
+        if target <= version:
+            continue
+        with db.transaction(conn):
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+        print(f"数据库迁移到版本{target}：{description}")
+        version = target
+    return version
+
+# 各接口查询的执行计划检查：禁止出现全表扫描和临时排序。
+# 语句取自各模块实际执行的查询（评论查询由 comment_filters 的构建函数生成），返回 (名称, SQL, 参数) 列表
+def query_plan_checks(conn):
+    # 延迟导入：这些模块导入时依赖已迁移的数据库（api 导入时会执行迁移和初始化用户数据）
+    import api
+    import analysis
+    import crawler
+    import exporter
+    import scheduler
+    import user_api
+    import video_info
+    from comment_filters import COMMENTS_SOURCE, build_comment_filters, comment_order, count_query, page_query, after_cursor
+
+    checks = []
+
+    # get_comments：按筛选条件计数和分页（OFFSET分页与游标分页）
+    from_clause, where_clause, params, _ = build_comment_filters(conn, 1, gender="男")
+    checks.append(("get_comments 计数", count_query(from_clause, where_clause), params))
+    from_clause, where_clause, params, _ = build_comment_filters(conn, 1, min_like_count=0)
+    checks.append(("get_comments 分页", page_query(from_clause, where_clause, comment_order(False)), params + [30, 0]))
+    from_clause, where_clause, params, _ = build_comment_filters(conn, 1)
+    where_clause, params = after_cursor(where_clause, params, {"i": 100}, False)
+    checks.append(("get_comments 游标分页", page_query(from_clause, where_clause, comment_order(False), by_cursor=True), params + [31]))
+
+    # 全文搜索（只做筛选，按评论序号排序）
+    from_clause, where_clause, params, _ = build_comment_filters(conn, 1, keyword="测试关键词")
+    checks.append(("关键词全文搜索", page_query(from_clause, where_clause, comment_order(False)), params + [30, 0]))
+    from_clause, where_clause, params, _ = build_comment_filters(conn, 1, keyword="测试关键词", search_signature=True)
+    checks.append(("个性签名全文搜索", page_query(from_clause, where_clause, comment_order(False)), params + [30, 0]))
+
+    # 导出
+    from_clause, where_clause, params, _ = build_comment_filters(conn, 1, show_second_level=False)
+    checks.append(("download_comments", exporter.export_query(from_clause, where_clause), params))
+    checks.append(("download_crawl_record", exporter.export_query(COMMENTS_SOURCE, "comments.crawl_id = ?"), [1]))
+
+    checks += [
+        ("crawl_record_stats 缓存", analysis.CACHED_QUERY, (1, "stats", "0")),
+        ("delete_crawl_record", api.DELETE_COMMENTS_QUERY, (1,)),
+        ("incremental_crawl 更新根评论", crawler.REFRESH_ROOT_QUERY, (3, 10, 1, 123)),
+        ("crawl_comments_api 增量爬取记录", api.INCREMENTAL_RECORD_QUERY, (1, "123", "BV1xx")),
+        ("crawl_records 普通用户列表", api.USER_CRAWL_RECORDS_QUERY, (1,)),
+        ("crawl_records 管理员列表", api.ADMIN_CRAWL_RECORDS_QUERY, ()),
+        ("crawl_groups 分组进度", api.GROUP_RECORDS_QUERY, (1,)),
+        ("crawl_groups 用户分组列表", api.USER_CRAWL_GROUPS_QUERY, (1,)),
+        ("crawl_groups 管理员分组列表", api.ADMIN_CRAWL_GROUPS_QUERY, ()),
+        ("resolve_video 缓存淘汰", video_info.EVICT_QUERY, (video_info.VIDEO_CACHE_MAX_ENTRIES,)),
+        ("scheduler 待派发任务", scheduler.QUEUED_JOBS_QUERY, (scheduler.QUEUED, scheduler.DISPATCH_SCAN_LIMIT)),
+        ("scheduler 运行中任务", scheduler.RUNNING_USERS_QUERY, (scheduler.RUNNING,)),
+        ("scheduler 租约过期任务", scheduler.EXPIRED_LEASES_QUERY, (scheduler.RUNNING, 0.0)),
+        ("scheduler 未完成的爬取记录", scheduler.ORPHAN_RECORDS_QUERY, (scheduler.QUEUED, scheduler.RUNNING)),
+        ("worker 续约", scheduler.RENEW_LEASE_QUERY, (0.0, 1, "w", scheduler.RUNNING)),
+        ("register 验证码", user_api.LATEST_CODE_QUERY, ("a@example.com",)),
+    ]
+    return checks
+
+FORBIDDEN_PLAN_PATTERNS = ("SCAN comments", "SCAN c", "SCAN p", "SCAN member_profiles", "SCAN crawl_records", "SCAN cr", "SCAN verification_codes", "SCAN video_cache", "SCAN crawl_jobs", "SCAN crawl_groups", "USE TEMP B-TREE")
+
+# 检查执行计划，返回 (名称, 执行计划, 是否通过) 列表
+def check_query_plans(conn=None):
+    conn = conn or db.get_connection()
+    results = []
+    for name, sql, params in query_plan_checks(conn):
+        try:
+            plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        except sqlite3.OperationalError as e:
+            # 依赖的可选结构（如全文索引）不存在时跳过
+            results.append((name, [f"跳过：{e}"], True))
+            continue
+        ok = not any(
+            detail.startswith(pattern) and "USING" not in detail and "VIRTUAL TABLE" not in detail
+            for detail in plan for pattern in FORBIDDEN_PLAN_PATTERNS
+        )
+        results.append((name, plan, ok))
+    return results
+
+# 命令行：python migrations.py 执行迁移并检查执行计划
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        db.DB_PATH = sys.argv[1]
+    connection = db.get_connection()
+    print(f"数据库版本：{migrate(connection)}")
+    failed = False
+    for name, plan, ok in check_query_plans(connection):
+        print(f"[{'通过' if ok else '失败'}] {name}")
+        for detail in plan:
+            print(f"    {detail}")
+        failed = failed or not ok
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,150 @@
+import time
+import asyncio
+import threading
+
+import db
+
+# 爬取进度推送配置
+PROGRESS_QUEUE_SIZE = 100  # 每个订阅者缓冲的事件数，消费过慢时丢弃最旧的事件
+PROGRESS_MIN_INTERVAL = 0.5  # 同一爬取任务两次进度事件的最短间隔（秒），开始、翻页和结束事件不受限制
+PROGRESS_RETAIN_SECONDS = 300.0  # 爬取结束后保留最后一条事件的时长（秒），供之后连接的订阅者读取
+PROGRESS_POLL_INTERVAL = 2.0  # 本进程没有该任务的事件时（排队中或在独立工作进程中运行）轮询数据库的间隔（秒）
+
+# 进度事件的状态：queued排队中、running运行中、interrupted被中断（将重新排队）、done完成、failed失败
+FINAL_STATES = ("done", "failed")
+
+# 进程内的爬取进度发布/订阅：爬取协程发布事件，每个订阅者一个有界队列（可在不同事件循环中订阅）
+class ProgressBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # crawl_id -> {(loop, queue)}
+        self._latest = {}  # crawl_id -> 最后一条事件
+        self.stats = {"published": 0, "dropped": 0, "subscribers": 0}
+
+    # 发布事件（在爬取任务的事件循环中调用）
+    def publish(self, crawl_id: int, event: dict):
+        now = time.time()
+        with self._lock:
+            self._latest[crawl_id] = event
+            subscribers = list(self._subscribers.get(crawl_id, ()))
+            self.stats["published"] += 1
+            # 清理已结束较久的任务的最后一条事件
+            for key in [key for key, item in self._latest.items()
+                        if item["state"] in FINAL_STATES and now - item["time"] > PROGRESS_RETAIN_SECONDS]:
+                del self._latest[key]
+        for loop, queue in subscribers:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+
+    def _deliver(self, queue: asyncio.Queue, event: dict):
+        if queue.full():
+            queue.get_nowait()
+            self.stats["dropped"] += 1
+        queue.put_nowait(event)
+
+    # 订阅某个爬取任务的事件（在订阅者的事件循环中调用），已有事件时先放入最后一条
+    def subscribe(self, crawl_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(PROGRESS_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(crawl_id, set()).add((asyncio.get_running_loop(), queue))
+            self.stats["subscribers"] += 1
+            latest = self._latest.get(crawl_id)
+        if latest is not None:
+            queue.put_nowait(latest)
+        return queue
+
+    def unsubscribe(self, crawl_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(crawl_id, set())
+            subscribers.discard(next(((loop, item) for loop, item in subscribers if item is queue), None))
+            if not subscribers:
+                self._subscribers.pop(crawl_id, None)
+            self.stats["subscribers"] -= 1
+
+    # 本进程内该任务的最后一条事件（任务不在本进程运行时为None）
+    def latest(self, crawl_id: int):
+        with self._lock:
+            return self._latest.get(crawl_id)
+
+# 进程内共享的进度总线
+progress_bus = ProgressBus()
+
+# 爬取记录重新加入队列（继续爬取、增量爬取、任务重新排队）时发布排队事件，
+# 替换上一次运行保留的结束事件，避免新的订阅者收到过期的完成/失败状态后立即断开
+def publish_queued(crawl_id: int):
+    progress_bus.publish(crawl_id, {"crawl_id": crawl_id, "state": "queued", "error": None, "time": time.time()})
+
+# 单个爬取任务的进度：页数、已爬取评论数、已完成的二级评论数、速率和预计剩余时间
+# （剩余时间按数量上限估算，视频评论少于上限时会提前结束）
+class CrawlProgress:
+    def __init__(self, crawl_id: int, limit_num: int, count: int = 0):
+        self.crawl_id = crawl_id
+        self.limit_num = limit_num
+        self.count = count
+        self.pages = 0
+        self.second_level_done = 0
+        self.state = "running"
+        self.error = None
+        self._start_count = count  # 断点续爬时从断点处的评论数开始计算速率
+        self._started = time.monotonic()
+        self._published_at = 0.0
+
+    def snapshot(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        rate = (self.count - self._start_count) / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.limit_num - self.count, 0)
+        return {
+            "crawl_id": self.crawl_id,
+            "state": self.state,
+            "pages": self.pages,
+            "comments": self.count,
+            "limit": self.limit_num,
+            "second_level_done": self.second_level_done,
+            "rate": round(rate, 2),
+            "eta_seconds": round(remaining / rate, 1) if self.state == "running" and rate > 0 else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "error": self.error,
+            "time": time.time(),
+        }
+
+    # 发布当前进度（距上次发布不足PROGRESS_MIN_INTERVAL时跳过，force为True时总是发布）
+    def publish(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._published_at < PROGRESS_MIN_INTERVAL:
+            return
+        self._published_at = now
+        progress_bus.publish(self.crawl_id, self.snapshot())
+
+    # 结束：state为done、failed或interrupted
+    def finish(self, state: str, error: str = None):
+        self.state = state
+        self.error = error
+        self.publish(force=True)
+
+    @property
+    def finished(self) -> bool:
+        return self.state != "running"
+
+# 由爬取记录生成进度事件（本进程没有该任务的事件时使用；comment_count在每次批量写入时更新）
+def record_snapshot(crawl_id: int):
+    conn = db.get_connection()
+    record = conn.execute("SELECT status, comment_count FROM crawl_records WHERE id = ?", (crawl_id,)).fetchone()
+    if record is None:
+        return None
+    status = record["status"] or ""
+    if status == "完成":
+        state = "done"
+    elif status.startswith("失败"):
+        state = "failed"
+    elif status == "进行中":
+        state = "running"
+    else:
+        state = "queued"
+    return {
+        "crawl_id": crawl_id,
+        "state": state,
+        "comments": record["comment_count"] or 0,
+        "error": status if state == "failed" else None,
+        "source": "database",
+        "time": time.time(),
+    }
@@ -0,0 +1,383 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+from collections import Counter
+
+import db
+from progress import publish_queued
+from crawler import crawl_comments, resume_crawl, incremental_crawl
+
+# 爬取任务调度配置
+MAX_CONCURRENT_CRAWLS = 4  # 全局（所有工作进程合计）同时运行的爬取任务数上限
+MAX_CRAWLS_PER_USER = 2  # 每个用户同时运行的爬取任务数上限
+DISPATCH_INTERVAL = 2.0  # 没有新任务或任务结束时，重新检查队列的间隔（秒）
+DISPATCH_SCAN_LIMIT = 500  # 每次派发时读取的排队任务数上限
+DEFAULT_PRIORITY = 0  # 默认优先级（数值越大越先执行）
+MAX_USER_PRIORITY = 0  # 普通用户可设置的最高优先级（只能降低自己任务的优先级，管理员不受限制）
+EMBEDDED_WORKER = True  # 是否在API进程内执行爬取任务；使用独立的 worker.py 时设为False
+
+# 任务租约配置
+LEASE_SECONDS = 60.0  # 领取任务后的租约时长（秒），工作进程失联超过该时长后任务被重新领取
+HEARTBEAT_INTERVAL = 15.0  # 运行中任务的续约间隔（秒），需明显小于租约时长
+MAX_JOB_ATTEMPTS = 3  # 任务被领取的次数上限，工作进程反复中断时不再重试
+
+# 任务类型：full完整爬取、incremental增量爬取、resume从断点继续
+JOB_KINDS = ("full", "incremental", "resume")
+
+# 旧版本创建的爬取记录没有保存评论数量上限，恢复任务时使用接口的默认值
+DEFAULT_LIMIT_NUM = 300
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# 调度查询（migrations.query_plan_checks 检查这些语句的执行计划）
+RUNNING_USERS_QUERY = "SELECT user_id FROM crawl_jobs WHERE status = ?"
+QUEUED_JOBS_QUERY = "SELECT id, user_id, priority FROM crawl_jobs WHERE status = ? ORDER BY priority DESC, id LIMIT ?"
+EXPIRED_LEASES_QUERY = "SELECT id, crawl_id, worker_id, attempts FROM crawl_jobs WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)"
+RENEW_LEASE_QUERY = "UPDATE crawl_jobs SET lease_expires_at = ? WHERE id = ? AND worker_id = ? AND status = ?"
+ORPHAN_RECORDS_QUERY = """
+SELECT cr.id, cr.bv, cr.oid, cr.mode, cr.is_second, cr.limit_num, cr.user_id FROM crawl_records cr
+WHERE cr.status IN ('进行中', '等待中')
+  AND NOT EXISTS (SELECT 1 FROM crawl_jobs j WHERE j.crawl_id = cr.id AND j.status IN (?, ?))
+"""
+
+# 调度统计：派发数和排队等待时间（当前进程）
+dispatch_stats = {"dispatched": 0, "finished": 0, "failed": 0, "recovered": 0, "released": 0, "lost": 0,
+                  "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+
+# 加入任务队列（在调用方的事务中执行，提交后调用wake通知调度器；排队事件在事务提交后发布）
+def enqueue(conn, crawl_id: int, user_id: int, kind: str, payload: dict, priority: int = DEFAULT_PRIORITY) -> int:
+    cursor = conn.execute("""
+    INSERT INTO crawl_jobs (crawl_id, user_id, kind, payload, priority, status, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (crawl_id, user_id, kind, json.dumps(payload), priority, QUEUED, time.time()))
+    db.after_commit(conn, publish_queued, crawl_id)
+    return cursor.lastrowid
+
+# 通知本进程的工作者立即检查队列（可在任意线程调用；独立工作进程按DISPATCH_INTERVAL轮询）
+def wake():
+    if embedded_worker is not None:
+        embedded_worker.wake()
+
+# 用户在轮转中的排序键（user_id可能为空）
+def _user_key(user_id):
+    return -1 if user_id is None else user_id
+
+# 任务重新排队，爬取记录恢复为等待中
+def _requeue(conn, job_id: int, crawl_id: int, count_attempt: bool = True):
+    conn.execute(f"""
+    UPDATE crawl_jobs SET status = ?, worker_id = NULL, lease_expires_at = NULL, started_at = NULL
+    {"" if count_attempt else ", attempts = MAX(attempts - 1, 0)"}
+    WHERE id = ?
+    """, (QUEUED, job_id))
+    conn.execute("UPDATE crawl_records SET status = ? WHERE id = ?", ("等待中", crawl_id))
+    db.after_commit(conn, publish_queued, crawl_id)
+
+# 回收租约过期的任务（工作进程崩溃或失联）：重新排队，领取次数达到上限时标记失败
+def _expire_leases(conn, now: float) -> int:
+    expired = conn.execute(EXPIRED_LEASES_QUERY, (RUNNING, now)).fetchall()
+    for job in expired:
+        if job["attempts"] >= MAX_JOB_ATTEMPTS:
+            error = f"失败: 工作进程中断{job['attempts']}次，不再重试"
+            conn.execute(
+                "UPDATE crawl_jobs SET status = ?, finished_at = ?, error = ?, worker_id = NULL, lease_expires_at = NULL WHERE id = ?",
+                (FAILED, now, error, job["id"])
+            )
+            conn.execute("UPDATE crawl_records SET status = ? WHERE id = ?", (error, job["crawl_id"]))
+        else:
+            _requeue(conn, job["id"], job["crawl_id"])
+        print(f"爬取任务{job['id']}的租约已过期（工作进程：{job['worker_id']}），已重新排队")
+    dispatch_stats["recovered"] += len(expired)
+    return len(expired)
+
+# 启动时恢复任务：回收过期租约，并为没有对应任务的进行中/等待中爬取记录（旧版本遗留）补建任务
+def recover_jobs() -> int:
+    conn = db.get_connection()
+    recovered = 0
+    with db.transaction(conn):
+        expired = _expire_leases(conn, time.time())
+        checkpoints = {row[0] for row in conn.execute("SELECT crawl_id FROM crawl_checkpoints")}
+        orphans = conn.execute(ORPHAN_RECORDS_QUERY, (QUEUED, RUNNING)).fetchall()
+        for record in orphans:
+            if record["id"] in checkpoints:
+                enqueue(conn, record["id"], record["user_id"], "resume", {})
+            elif record["oid"]:
+                enqueue(conn, record["id"], record["user_id"], "full", {
+                    "bv": record["bv"], "oid": record["oid"], "next_pageID": "",
+                    "is_second": bool(record["is_second"]), "mode": record["mode"],
+                    "limit_num": record["limit_num"] or DEFAULT_LIMIT_NUM,
+                })
+            else:
+                conn.execute("UPDATE crawl_records SET status = ? WHERE id = ?", ("失败: 服务重启，任务已中断", record["id"]))
+                continue
+            conn.execute("UPDATE crawl_records SET status = ? WHERE id = ?", ("等待中", record["id"]))
+            recovered += 1
+    dispatch_stats["recovered"] += recovered
+    if expired + recovered:
+        print(f"已恢复{expired + recovered}个中断的爬取任务")
+    return expired + recovered
+
+# 执行一个任务（爬取函数自己记录失败状态，调用方根据爬取记录的最终状态更新任务状态）；
+# 完整爬取任务被中断后重新领取时，从断点继续
+async def run_job(job: dict):
+    payload = json.loads(job["payload"])
+    crawl_id = job["crawl_id"]
+    if job["kind"] == "full" and await db.run(_has_checkpoint, crawl_id):
+        await resume_crawl(crawl_id)
+    elif job["kind"] == "resume":
+        await resume_crawl(crawl_id)
+    elif job["kind"] == "incremental":
+        await incremental_crawl(crawl_id, payload["oid"], payload["is_second"], payload["limit_num"])
+    else:
+        await crawl_comments(crawl_id, payload["bv"], payload["oid"], payload["next_pageID"], 0,
+                             payload["is_second"], payload["mode"], payload["limit_num"])
+
+def _has_checkpoint(crawl_id: int) -> bool:
+    conn = db.get_connection()
+    return conn.execute("SELECT 1 FROM crawl_checkpoints WHERE crawl_id = ?", (crawl_id,)).fetchone() is not None
+
+# 爬取任务工作者：按租约从共享数据库领取任务并执行，定期续约；
+# API进程内嵌一个（EMBEDDED_WORKER），也可以用 worker.py 在多台机器上启动多个
+class CrawlWorker:
+    def __init__(self, capacity: int = MAX_CONCURRENT_CRAWLS, worker_id: str = None):
+        self.capacity = capacity
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._loop = None
+        self._wakeup = None
+        self._tasks = []
+        self._running = {}  # job_id -> asyncio.Task
+        self._last_user = None
+
+    # 通知立即检查队列（可在任意线程调用）
+    def wake(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    # 回收过期租约后，按配额领取排队任务：先取最高优先级，同优先级的用户之间轮转，每个用户按入队顺序执行
+    def _claim_jobs(self, local_slots: int) -> list:
+        conn = db.get_connection()
+        now = time.time()
+        with db.transaction(conn):
+            _expire_leases(conn, now)
+            running = Counter(row[0] for row in conn.execute(RUNNING_USERS_QUERY, (RUNNING,)))
+            slots = min(MAX_CONCURRENT_CRAWLS - sum(running.values()), local_slots)
+            if slots <= 0:
+                return []
+            queued = conn.execute(QUEUED_JOBS_QUERY, (QUEUED, DISPATCH_SCAN_LIMIT)).fetchall()
+
+            claimed = []
+            while slots > 0 and queued:
+                # 每个还有配额的用户排在最前的任务
+                heads = {}
+                for job in queued:
+                    if running[job["user_id"]] < MAX_CRAWLS_PER_USER and job["user_id"] not in heads:
+                        heads[job["user_id"]] = job
+                if not heads:
+                    break
+                top = max(job["priority"] for job in heads.values())
+                users = sorted((user for user, job in heads.items() if job["priority"] == top), key=_user_key)
+                last = _user_key(self._last_user)
+                user = next((user for user in users if _user_key(user) > last), users[0])
+                job = heads[user]
+                queued.remove(job)
+
+                if conn.execute("""
+                UPDATE crawl_jobs SET status = ?, started_at = ?, worker_id = ?, lease_expires_at = ?, attempts = attempts + 1
+                WHERE id = ? AND status = ?
+                """, (RUNNING, now, self.worker_id, now + LEASE_SECONDS, job["id"], QUEUED)).rowcount:
+                    claimed.append(job["id"])
+                    running[user] += 1
+                    slots -= 1
+                    self._last_user = user
+
+            if not claimed:
+                return []
+            placeholders = ", ".join("?" * len(claimed))
+            jobs = [dict(row) for row in conn.execute(f"SELECT * FROM crawl_jobs WHERE id IN ({placeholders})", claimed)]
+        jobs.sort(key=lambda job: claimed.index(job["id"]))
+        return jobs
+
+    # 为运行中的任务续约，返回租约已被回收（被其他工作进程重新领取）的任务
+    def _renew_leases(self, job_ids: list) -> list:
+        conn = db.get_connection()
+        expires_at = time.time() + LEASE_SECONDS
+        lost = []
+        with db.transaction(conn):
+            for job_id in job_ids:
+                if not conn.execute(RENEW_LEASE_QUERY, (expires_at, job_id, self.worker_id, RUNNING)).rowcount:
+                    lost.append(job_id)
+        return lost
+
+    # 根据爬取记录的最终状态结束任务（租约已不属于本工作进程时不修改）
+    def _finish_job(self, job_id: int, crawl_id: int, error: str = None):
+        conn = db.get_connection()
+        record = conn.execute("SELECT status FROM crawl_records WHERE id = ?", (crawl_id,)).fetchone()
+        if error is None and (record is None or record["status"] != "完成"):
+            error = record["status"] if record else "爬取记录已删除"
+        with db.transaction(conn):
+            conn.execute("""
+            UPDATE crawl_jobs SET status = ?, finished_at = ?, error = ?, lease_expires_at = NULL
+            WHERE id = ? AND worker_id = ? AND status = ?
+            """, (FAILED if error else DONE, time.time(), error, job_id, self.worker_id, RUNNING))
+        dispatch_stats["failed" if error else "finished"] += 1
+
+    # 停止时把本工作进程运行中的任务立即放回队列（不计入领取次数），无需等待租约过期
+    def _release_jobs(self, job_ids: list):
+        conn = db.get_connection()
+        with db.transaction(conn):
+            for job_id in job_ids:
+                job = conn.execute(
+                    "SELECT crawl_id FROM crawl_jobs WHERE id = ? AND worker_id = ? AND status = ?",
+                    (job_id, self.worker_id, RUNNING)
+                ).fetchone()
+                if job is not None:
+                    _requeue(conn, job_id, job["crawl_id"], count_attempt=False)
+        dispatch_stats["released"] += len(job_ids)
+
+    async def _run_job(self, job: dict):
+        error = None
+        try:
+            await run_job(job)
+        except asyncio.CancelledError:
+            # 停止或租约丢失时被取消：任务由_release_jobs放回队列或已被其他工作进程领取
+            raise
+        except Exception as e:
+            error = str(e)
+            print(f"爬取任务{job['id']}执行出错：{e}")
+        try:
+            await db.run(self._finish_job, job["id"], job["crawl_id"], error)
+        finally:
+            self._running.pop(job["id"], None)
+            self.wake()
+
+    # 派发循环：有空闲配额时领取任务，任务入队或结束时被唤醒
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                jobs = await db.run(self._claim_jobs, self.capacity - len(self._running))
+            except Exception as e:
+                print(f"领取爬取任务失败：{e}")
+                jobs = []
+            now = time.time()
+            for job in jobs:
+                waited = now - job["created_at"]
+                dispatch_stats["dispatched"] += 1
+                dispatch_stats["wait_seconds"] += waited
+                dispatch_stats["max_wait_seconds"] = max(dispatch_stats["max_wait_seconds"], waited)
+                self._running[job["id"]] = asyncio.ensure_future(self._run_job(job))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), DISPATCH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    # 续约循环：租约丢失的任务立即取消，避免与重新领取它的工作进程重复爬取
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            if not self._running:
+                continue
+            try:
+                lost = await db.run(self._renew_leases, list(self._running))
+            except Exception as e:
+                print(f"爬取任务续约失败：{e}")
+                continue
+            for job_id in lost:
+                task = self._running.pop(job_id, None)
+                if task is not None:
+                    task.cancel()
+                    dispatch_stats["lost"] += 1
+                    print(f"爬取任务{job_id}的租约已被回收，停止执行")
+
+    # 启动：补建遗留任务后开始派发和续约
+    async def start(self):
+        if self._tasks:
+            return
+        await db.run(recover_jobs)
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._dispatch_loop()), asyncio.ensure_future(self._heartbeat_loop())]
+        print(f"爬取任务工作者已启动：{self.worker_id}，最多同时运行{self.capacity}个任务")
+
+    # 停止：取消派发和运行中的任务，并把任务放回队列
+    async def stop(self):
+        tasks, running = self._tasks, dict(self._running)
+        self._tasks, self._loop = [], None
+        for task in [*tasks, *running.values()]:
+            task.cancel()
+        await asyncio.gather(*tasks, *running.values(), return_exceptions=True)
+        self._running.clear()
+        if running:
+            await db.run(self._release_jobs, list(running))
+
+    # 当前工作者状态
+    def stats(self) -> dict:
+        return {"worker_id": self.worker_id, "capacity": self.capacity, "running": len(self._running)}
+
+# API进程内的工作者（EMBEDDED_WORKER为False时为None，任务全部由独立工作进程执行）
+embedded_worker = CrawlWorker() if EMBEDDED_WORKER else None
+
+# 启动调度（应用启动时调用）：内嵌工作者启动派发，否则只补建遗留任务
+async def start():
+    if embedded_worker is not None:
+        await embedded_worker.start()
+    else:
+        await db.run(recover_jobs)
+
+# 停止调度（应用关闭时调用）
+async def stop():
+    if embedded_worker is not None:
+        await embedded_worker.stop()
+
+# 队列状态：排队/运行中任务数、各用户任务数、工作进程和等待时间（user_id不为空时附带该用户的任务列表）
+def queue_stats(user_id: int = None) -> dict:
+    conn = db.get_connection()
+    now = time.time()
+    rows = conn.execute("""
+    SELECT j.id, j.crawl_id, j.user_id, j.kind, j.priority, j.status, j.created_at, j.started_at, j.worker_id, j.attempts, cr.bv, cr.title
+    FROM crawl_jobs j LEFT JOIN crawl_records cr ON cr.id = j.crawl_id
+    WHERE j.status IN (?, ?)
+    ORDER BY j.priority DESC, j.id
+    """, (QUEUED, RUNNING)).fetchall()
+
+    per_user = {}
+    for row in rows:
+        counts = per_user.setdefault(row["user_id"], {"user_id": row["user_id"], "queued": 0, "running": 0})
+        counts["queued" if row["status"] == QUEUED else "running"] += 1
+    queued = [row for row in rows if row["status"] == QUEUED]
+
+    result = {
+        "max_concurrent": MAX_CONCURRENT_CRAWLS,
+        "max_per_user": MAX_CRAWLS_PER_USER,
+        "running": len(rows) - len(queued),
+        "queued": len(queued),
+        "oldest_wait_seconds": round(now - min(row["created_at"] for row in queued), 1) if queued else 0.0,
+        "avg_wait_seconds": round(dispatch_stats["wait_seconds"] / dispatch_stats["dispatched"], 2) if dispatch_stats["dispatched"] else 0.0,
+        "max_wait_seconds": round(dispatch_stats["max_wait_seconds"], 2),
+        "users": list(per_user.values()),
+        "workers": dict(Counter(row["worker_id"] for row in rows if row["status"] == RUNNING)),
+        "embedded_worker": embedded_worker.stats() if embedded_worker is not None else None,
+    }
+    if user_id is not None:
+        result["jobs"] = [
+            {
+                "job_id": row["id"],
+                "crawl_id": row["crawl_id"],
+                "bv": row["bv"],
+                "title": row["title"],
+                "kind": row["kind"],
+                "priority": row["priority"],
+                "status": row["status"],
+                "attempts": row["attempts"],
+                "wait_seconds": round((row["started_at"] or now) - row["created_at"], 1),
+            }
+            for row in rows if row["user_id"] == user_id
+        ]
+    return result
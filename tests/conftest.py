@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# 测试使用临时数据库，不修改项目中的 bilibili_CH.db
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+db.DB_PATH = os.path.join(tempfile.mkdtemp(prefix="bilibili_ch_test_"), "test.db")
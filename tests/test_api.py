@@ -0,0 +1,178 @@
+import time
+import asyncio
+from datetime import datetime
+
+import httpx
+
+import db
+import api
+import crawler
+import user_api
+
+# 创建普通用户和一条属于管理员的爬取记录，返回 (普通用户令牌, 管理员令牌, 爬取记录ID)
+def _seed():
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("""
+        INSERT OR IGNORE INTO users (username, email, password, level, created_at) VALUES (?, ?, ?, ?, ?)
+        """, ("api_user", "api_user@example.com", "x", 1, datetime.now()))
+        admin_id = conn.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()[0]
+        crawl_id = conn.execute("""
+        INSERT INTO crawl_records (bv, title, mode, is_second, comment_count, start_time, status, user_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, ("BVapi", "t", 3, 0, 0, datetime.now(), "完成", admin_id)).lastrowid
+    return (user_api.create_access_token({"sub": "api_user"}),
+            user_api.create_access_token({"sub": "admin"}), crawl_id)
+
+def _request(method, path, token, **kwargs):
+    async def send():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+    return asyncio.run(send())
+
+# 按爬虫的写入方式追加count条评论（序号从start+1开始），并更新爬取记录的评论数
+def _add_comments(crawl_id, count, start=0):
+    writer = crawler.CommentWriter(crawl_id)
+    for index in range(start + 1, start + count + 1):
+        writer.add(index, {
+            "parent_id": 0, "comment_id": crawl_id * 100000 + index, "user_id": index % 7 + 1,
+            "content": f"第{index}条测试评论", "comment_time": f"2024-01-01 {index % 24:02d}:00:00",
+            "reply_count": index % 3, "like_count": index % 5, "ip_location": "上海",
+            "username": f"member{index % 7 + 1}", "user_level": index % 7, "gender": "男" if index % 2 else "女",
+            "signature": "", "is_vip": "否", "avatar": "",
+        })
+    asyncio.run(writer.flush())
+
+# 线程池中执行的接口抛出的403/404不能被通用异常处理转换为500
+def test_crawl_record_detail_and_delete_keep_http_errors():
+    user_token, admin_token, crawl_id = _seed()
+
+    assert _request("GET", "/api/crawl_records/999999", admin_token).status_code == 404
+    assert _request("GET", f"/api/crawl_records/{crawl_id}", user_token).status_code == 403
+    assert _request("DELETE", f"/api/crawl_records/{crawl_id}", user_token).status_code == 403
+    assert _request("GET", f"/api/crawl_records/{crawl_id}", admin_token).status_code == 200
+
+# 统计结果按记录版本缓存：计算期间被增量爬取清除缓存后才写入的旧结果，在记录更新后不会再被读到
+def test_crawl_stats_cache_keyed_on_record_version():
+    _, admin_token, crawl_id = _seed()
+    _add_comments(crawl_id, 10)
+
+    first = _request("GET", f"/api/crawl_records/{crawl_id}/stats", admin_token).json()
+    assert (first["cached"], first["total"]) == (False, 10)
+    assert _request("GET", f"/api/crawl_records/{crawl_id}/stats", admin_token).json()["cached"] is True
+
+    # 模拟增量爬取追加评论并完成，旧版本的缓存行仍留在表中
+    _add_comments(crawl_id, 5, start=10)
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("UPDATE crawl_records SET end_time = ? WHERE id = ?", (datetime.now(), crawl_id))
+
+    second = _request("GET", f"/api/crawl_records/{crawl_id}/stats", admin_token).json()
+    assert (second["cached"], second["total"]) == (False, 15)
+
+# 词云结果同样按记录版本缓存
+def test_crawl_keywords_cache_keyed_on_record_version():
+    _, admin_token, crawl_id = _seed()
+    _add_comments(crawl_id, 10)
+
+    first = _request("GET", f"/api/crawl_records/{crawl_id}/keywords", admin_token).json()
+    assert (first["cached"], first["documents"]) == (False, 10)
+    assert _request("GET", f"/api/crawl_records/{crawl_id}/keywords", admin_token).json()["cached"] is True
+
+    _add_comments(crawl_id, 5, start=10)
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("UPDATE crawl_records SET end_time = ? WHERE id = ?", (datetime.now(), crawl_id))
+
+    second = _request("GET", f"/api/crawl_records/{crawl_id}/keywords", admin_token).json()
+    assert (second["cached"], second["documents"]) == (False, 15)
+
+def _p99(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.99))]
+
+# 登录高峰期间评论列表的延迟：bcrypt在密码哈希线程池中执行，p99应接近空闲时的水平
+def test_comments_latency_during_login_burst():
+    _, admin_token, crawl_id = _seed()
+    _add_comments(crawl_id, 200)
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("""
+        INSERT OR IGNORE INTO users (username, email, password, level, created_at) VALUES (?, ?, ?, ?, ?)
+        """, ("login_user", "login_user@example.com", user_api.get_password_hash("secret123"), 1, datetime.now()))
+    logins = 8
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    path = f"/api/comments/{crawl_id}?page=1&page_size=30&min_like_count=1"
+
+    async def sample(client):
+        started = time.perf_counter()
+        resp = await client.get(path, headers=headers)
+        assert resp.status_code == 200
+        return time.perf_counter() - started
+
+    async def login(client):
+        return (await client.post("/api/user/login", json={"username": "login_user", "password": "secret123"})).status_code
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            idle = []
+            for _ in range(30):
+                idle.append(await sample(client))
+                await asyncio.sleep(0.01)
+
+            burst_tasks = [asyncio.ensure_future(login(client)) for _ in range(logins)]
+            burst = []
+            while not all(task.done() for task in burst_tasks):
+                burst.append(await sample(client))
+                await asyncio.sleep(0.01)
+            return idle, burst, await asyncio.gather(*burst_tasks)
+
+    idle, burst, statuses = asyncio.run(scenario())
+    assert statuses == [200] * logins
+    # 8次bcrypt验证由2个线程执行，至少持续数百毫秒，期间采到足够多的样本
+    assert len(burst) >= 10
+    assert _p99(burst) < _p99(idle) * 3 + 0.05, (_p99(idle), _p99(burst))
+
+# 评论显示写入时的评论者资料：用户之后改名、升级不影响旧评论；资料相同的评论共用一个资料版本
+def test_comments_keep_profile_at_write_time():
+    _, admin_token, crawl_id = _seed()
+    member = {
+        "parent_id": 0, "user_id": 424242, "comment_time": "2024-01-01 00:00:00", "reply_count": 0, "like_count": 0,
+        "ip_location": "上海", "gender": "女", "is_vip": "否", "avatar": "a.jpg",
+    }
+    writer = crawler.CommentWriter(crawl_id)
+    writer.add(1, {**member, "comment_id": 1, "content": "改名之前", "username": "旧昵称", "user_level": 3, "signature": "旧签名内容"})
+    writer.add(2, {**member, "comment_id": 2, "content": "还是旧的", "username": "旧昵称", "user_level": 3, "signature": "旧签名内容"})
+    asyncio.run(writer.flush())
+    writer.add(3, {**member, "comment_id": 3, "content": "改名之后", "username": "新昵称", "user_level": 5, "signature": "新签名内容",
+                   "is_vip": "是"})
+    asyncio.run(writer.flush())
+
+    comments = _request("GET", f"/api/comments/{crawl_id}", admin_token).json()["comments"]
+    assert [(c["username"], c["user_level"], c["signature"], c["is_vip"]) for c in comments] == [
+        ("旧昵称", 3, "旧签名内容", "否"), ("旧昵称", 3, "旧签名内容", "否"), ("新昵称", 5, "新签名内容", "是"),
+    ]
+    assert "profile_id" not in comments[0] and "gender_code" not in comments[0]
+    conn = db.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM member_profiles WHERE mid = 424242").fetchone()[0] == 2
+
+    # 个性签名搜索匹配评论写入时的签名
+    found = _request("GET", "/api/search/comments", admin_token,
+                     params={"keyword": "旧签名", "search_signature": True, "order_by": "index"}).json()["comments"]
+    assert [c["comment_index"] for c in found if c["crawl_id"] == crawl_id] == [1, 2]
+
+# 性别和大会员筛选按整数编码比较，结果与原取值一致；未知取值不匹配任何评论
+def test_gender_and_vip_filters():
+    _, admin_token, crawl_id = _seed()
+    _add_comments(crawl_id, 10)
+
+    def total(**params):
+        return _request("GET", f"/api/comments/{crawl_id}", admin_token, params=params).json()["pagination"]["total"]
+    assert total(gender="男") == 5
+    assert total(gender="女") == 5
+    assert total(gender="保密") == 0
+    assert total(gender="未知") == 0
+    assert total(is_vip="否") == 10
+    assert total(is_vip="是", gender="男") == 0
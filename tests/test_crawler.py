@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+import pytest
+
+import wbi
+import crawler
+
+IMG_KEY = "7cd084941338484aae1ad9425b84077c"
+SUB_KEY = "4932caff0ff746eab6f01bf08b70ac45"
+
+# 模拟B站接口：nav返回固定的img/sub key，一级评论接口按main_codes依次返回code
+class _FakeBilibili:
+    def __init__(self, main_codes):
+        self.main_codes = list(main_codes)
+        self.nav_calls = 0
+        self.main_calls = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/x/web-interface/nav":
+            self.nav_calls += 1
+            return httpx.Response(200, json={"code": -101, "data": {"wbi_img": {
+                "img_url": f"https://i0.hdslb.com/bfs/wbi/{IMG_KEY}.png",
+                "sub_url": f"https://i0.hdslb.com/bfs/wbi/{SUB_KEY}.png",
+            }}})
+        self.main_calls += 1
+        code = self.main_codes.pop(0) if self.main_codes else 0
+        return httpx.Response(200, json={"code": code, "data": {"replies": []}})
+
+@pytest.fixture
+def bilibili(monkeypatch):
+    released = []
+    monkeypatch.setattr(crawler.cookie_pool, "acquire", lambda: None)
+    monkeypatch.setattr(crawler.cookie_pool, "release", lambda credential, risk_controlled=False: released.append(risk_controlled))
+    monkeypatch.setattr(crawler, "rate_limiter", crawler.AdaptiveRateLimiter(rate=1000.0, burst=100))
+    monkeypatch.setattr(crawler, "_backoff_delay", lambda attempt: 0)
+    monkeypatch.setattr(wbi, "_key_state", {"mixin_key": None, "fetched_at": 0.0, "expires_at": 0.0, "refreshes": 0, "failures": 0})
+    monkeypatch.setattr(wbi, "WBI_MIN_REFRESH_INTERVAL", 0.0)
+
+    def start(main_codes):
+        fake = _FakeBilibili(main_codes)
+        fake.released = released
+        monkeypatch.setattr(crawler, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(fake.handler)))
+        return fake
+    return start
+
+# mixin key轮换后第一次返回-352：刷新key后重试成功，不暂停Cookie、不降速
+def test_signature_rejection_refreshes_key_without_throttling(bilibili):
+    fake = bilibili([wbi.WBI_REJECTED_CODE])
+    comment = asyncio.run(crawler.fetch_main_page(1, 2, ""))
+
+    assert comment["code"] == 0
+    assert fake.main_calls == 2
+    assert fake.nav_calls == 2  # 首次获取 + 被拒绝后强制刷新
+    assert not any(fake.released)
+    metrics = crawler.rate_limiter.metrics()
+    assert (metrics["throttled"], metrics["retries"], metrics["decreases"]) == (0, 0, 0)
+
+# 刷新key后仍返回-352：按风控处理，暂停Cookie、降速并退避重试
+def test_repeated_signature_rejection_is_risk_control(bilibili):
+    fake = bilibili([wbi.WBI_REJECTED_CODE, wbi.WBI_REJECTED_CODE])
+    comment = asyncio.run(crawler.fetch_main_page(1, 2, ""))
+
+    assert comment["code"] == 0
+    assert fake.main_calls == 3
+    assert fake.released.count(True) == 1
+    metrics = crawler.rate_limiter.metrics()
+    assert (metrics["throttled"], metrics["retries"], metrics["decreases"]) == (1, 1, 1)
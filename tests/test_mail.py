@@ -0,0 +1,130 @@
+import time
+import asyncio
+import threading
+import socketserver
+
+import httpx
+import pytest
+
+import user_api
+
+# 模拟的慢速SMTP服务器：每封邮件在DATA结束后等待delay秒再确认
+class _SlowSMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self._reply("220 localhost stub")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self._reply("250-localhost")
+                self._reply("250 AUTH PLAIN")
+            elif command.startswith("AUTH"):
+                self._reply("235 ok")
+            elif command == "DATA":
+                self._reply("354 end with .")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                time.sleep(self.server.delay)
+                self.server.delivered += 1
+                self._reply("250 queued")
+            elif command == "QUIT":
+                self._reply("221 bye")
+                return
+            else:
+                self._reply("250 ok")
+
+class _SlowSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SlowSMTPHandler)
+        self.delay = 0.0
+        self.delivered = 0
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = _SlowSMTPServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(user_api, "EMAIL_HOST", "127.0.0.1")
+    monkeypatch.setattr(user_api, "EMAIL_PORT", server.server_address[1])
+    monkeypatch.setattr(user_api, "EMAIL_USE_TLS", False)
+    monkeypatch.setattr(user_api, "EMAIL_USE_SSL", False)
+    monkeypatch.setattr(user_api, "EMAIL_HOST_USER", "sender@example.com")
+    monkeypatch.setattr(user_api, "EMAIL_HOST_PASSWORD", "secret")
+    monkeypatch.setattr(user_api, "EMAIL_FROM", "sender@example.com")
+    monkeypatch.setattr(user_api, "MAIL_RETRY_DELAY", 0.01)
+    user_api.mail_outbox.close()
+    yield server
+    user_api.mail_outbox.close()
+    server.shutdown()
+    server.server_close()
+
+def _p99(values):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.99))]
+
+async def _timed_post(client, email):
+    start = time.perf_counter()
+    resp = await client.post("/api/user/send_email_code", json={"email": email})
+    return resp.status_code, time.perf_counter() - start
+
+async def _timed_get(client, path):
+    start = time.perf_counter()
+    resp = await client.get(path)
+    return resp.status_code, time.perf_counter() - start
+
+def _client():
+    import api
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://test")
+
+# SMTP每封邮件耗时0.1秒：发送验证码接口全部成功且在预期时间内返回，其间其他接口不受影响
+def test_send_email_code_latency_with_slow_smtp(smtp_server):
+    smtp_server.delay = 0.1
+    requests = 10
+
+    async def scenario():
+        async with _client() as client:
+            mails = [asyncio.ensure_future(_timed_post(client, f"user{i}@example.com")) for i in range(requests)]
+            health = []
+            while not all(task.done() for task in mails):
+                health.append(await _timed_get(client, "/api/health"))
+                await asyncio.sleep(0.02)
+            return await asyncio.gather(*mails), health
+
+    mails, health = asyncio.run(scenario())
+    assert [status for status, _ in mails] == [200] * requests
+    assert smtp_server.delivered == requests
+    # 邮件串行发送，最后一封约等待 requests * delay
+    assert _p99([elapsed for _, elapsed in mails]) < requests * smtp_server.delay + 2.0
+    # SMTP在发送线程中执行，不阻塞事件循环
+    assert all(status == 200 for status, _ in health)
+    assert _p99([elapsed for _, elapsed in health]) < 0.5
+
+# SMTP比接口等待时间更慢：接口按超时返回失败，排队中被取消的邮件不再发送，发送线程继续工作
+def test_send_email_code_timeout_keeps_outbox_alive(smtp_server, monkeypatch):
+    monkeypatch.setattr(user_api, "MAIL_SEND_TIMEOUT", 0.3)
+    smtp_server.delay = 1.0
+
+    async def scenario():
+        async with _client() as client:
+            timed_out = await asyncio.gather(*(_timed_post(client, f"slow{i}@example.com") for i in range(3)))
+            # 等第一封慢邮件发送完毕
+            await asyncio.sleep(1.2)
+            smtp_server.delay = 0.0
+            recovered = await _timed_post(client, "fast@example.com")
+            return timed_out, recovered
+
+    timed_out, recovered = asyncio.run(scenario())
+    assert [status for status, _ in timed_out] == [500] * 3
+    assert max(elapsed for _, elapsed in timed_out) < 0.3 + 0.5
+    assert recovered[0] == 200
+    assert recovered[1] < 0.3
+    assert user_api.mail_outbox.thread.is_alive()
+    # 只有已经开始发送的第一封慢邮件和之后的邮件被投递
+    assert smtp_server.delivered == 2
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+import db
+import migrations
+import progress
+import scheduler
+
+def _create_record(conn):
+    return conn.execute("""
+    INSERT INTO crawl_records (bv, title, mode, is_second, comment_count, start_time, status, user_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, ("BVprogress", "t", 2, 0, 0, datetime.now(), "完成", None)).lastrowid
+
+# 排队事件在事务提交后才发布，替换上一次运行保留的结束事件；事务回滚时不发布
+def test_queued_event_published_after_commit():
+    migrations.migrate()
+    conn = db.get_connection()
+    with db.transaction(conn):
+        crawl_id = _create_record(conn)
+    progress.CrawlProgress(crawl_id, 10).finish("done")
+
+    with pytest.raises(RuntimeError):
+        with db.transaction(conn):
+            scheduler.enqueue(conn, crawl_id, None, "incremental", {})
+            assert progress.progress_bus.latest(crawl_id)["state"] == "done"
+            raise RuntimeError("rollback")
+    assert progress.progress_bus.latest(crawl_id)["state"] == "done"
+    assert conn.execute("SELECT COUNT(*) FROM crawl_jobs WHERE crawl_id = ?", (crawl_id,)).fetchone()[0] == 0
+
+    with db.transaction(conn):
+        scheduler.enqueue(conn, crawl_id, None, "incremental", {})
+        assert progress.progress_bus.latest(crawl_id)["state"] == "done"
+    assert progress.progress_bus.latest(crawl_id)["state"] == "queued"
@@ -0,0 +1,9 @@
+import migrations
+
+# 各接口实际执行的查询（由查询构建函数和各模块的查询常量生成）都应使用索引：不出现全表扫描和临时排序
+def test_query_plans_use_indexes():
+    migrations.migrate()
+    results = migrations.check_query_plans()
+    assert results
+    failed = {name: plan for name, plan, ok in results if not ok}
+    assert not failed, failed
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+from types import SimpleNamespace
+
+import pytest
+
+import wbi
+
+# 公开文档中的WBI签名示例（nav接口返回的img_key/sub_key及对应的签名结果）
+IMG_KEY = "7cd084941338484aae1ad9425b84077c"
+SUB_KEY = "4932caff0ff746eab6f01bf08b70ac45"
+MIXIN_KEY = "ea1db124af3c7062474693fa704f4ff8"
+PARAMS = {"foo": "114", "bar": "514", "zab": 1919810}
+WTS = 1702204169
+W_RID = "8f6f2b5b3d485fe1886cec6a0be8c5d4"
+
+
+def test_get_mixin_key():
+    assert wbi.get_mixin_key(IMG_KEY, SUB_KEY) == MIXIN_KEY
+
+
+def test_sign_params_with_fixed_wts():
+    signed = wbi.sign_params(PARAMS, MIXIN_KEY, wts=WTS)
+    assert signed["w_rid"] == W_RID
+    assert signed["wts"] == str(WTS)
+    # 参数按键排序，原参数不被修改
+    assert list(signed) == ["bar", "foo", "wts", "zab", "w_rid"]
+    assert "wts" not in PARAMS
+
+
+def test_sign_params_strips_filtered_chars():
+    signed = wbi.sign_params({"foo": "1!1'4", "bar": "(5)1*4", "zab": 1919810}, MIXIN_KEY, wts=WTS)
+    assert signed["foo"] == "114"
+    assert signed["bar"] == "514"
+    assert signed["w_rid"] == W_RID
+
+    # 过滤后的字符串参与签名，而不是原始值
+    raw_query = "bar=%285%291%2A4&foo=1%211%274&wts=1702204169&zab=1919810"
+    assert signed["w_rid"] != hashlib.md5((raw_query + MIXIN_KEY).encode("utf-8")).hexdigest()
+
+
+def test_sign_url():
+    url = wbi.sign_url("https://api.bilibili.com/x/v2/reply/wbi/main", PARAMS, MIXIN_KEY, wts=WTS)
+    assert url == (
+        "https://api.bilibili.com/x/v2/reply/wbi/main"
+        f"?bar=514&foo=114&wts={WTS}&zab=1919810&w_rid={W_RID}"
+    )
+
+
+def test_current_mixin_key_from_nav(monkeypatch):
+    monkeypatch.setattr(wbi, "_key_state", {"mixin_key": None, "fetched_at": 0.0, "expires_at": 0.0, "refreshes": 0, "failures": 0})
+
+    async def fetch(url):
+        assert url == wbi.NAV_URL
+        return {"code": -101, "data": {"wbi_img": {
+            "img_url": f"https://i0.hdslb.com/bfs/wbi/{IMG_KEY}.png",
+            "sub_url": f"https://i0.hdslb.com/bfs/wbi/{SUB_KEY}.png",
+        }}}
+
+    assert asyncio.run(wbi.current_mixin_key(fetch)) == MIXIN_KEY
+    assert wbi._key_state["refreshes"] == 1
+
+
+def test_current_mixin_key_falls_back_to_default(monkeypatch):
+    monkeypatch.setattr(wbi, "_key_state", {"mixin_key": None, "fetched_at": 0.0, "expires_at": 0.0, "refreshes": 0, "failures": 0})
+
+    async def fetch(url):
+        raise RuntimeError("nav unavailable")
+
+    assert asyncio.run(wbi.current_mixin_key(fetch)) == wbi.DEFAULT_MIXIN_KEY
+    assert wbi._key_state["failures"] == 1
+
+
+# 可控时钟下的nav接口：每次调用返回keys中的下一对key（用完后重复最后一对），记录调用次数
+@pytest.fixture
+def nav(monkeypatch):
+    clock = SimpleNamespace(now=1_000_000.0)
+    monkeypatch.setattr(wbi, "time", SimpleNamespace(time=lambda: clock.now))
+    monkeypatch.setattr(wbi, "_key_state", {"mixin_key": None, "fetched_at": 0.0, "expires_at": 0.0, "refreshes": 0, "failures": 0})
+    # 第二对key由第一对互换得到，对应不同的mixin key
+    keys = [(IMG_KEY, SUB_KEY), (SUB_KEY, IMG_KEY)]
+    calls = []
+
+    async def fetch(url):
+        img_key, sub_key = keys[min(len(calls), len(keys) - 1)]
+        calls.append(url)
+        return {"code": -101, "data": {"wbi_img": {
+            "img_url": f"https://i0.hdslb.com/bfs/wbi/{img_key}.png",
+            "sub_url": f"https://i0.hdslb.com/bfs/wbi/{sub_key}.png",
+        }}}
+
+    def current(force_refresh=False):
+        return asyncio.run(wbi.current_mixin_key(fetch, force_refresh=force_refresh))
+    return SimpleNamespace(clock=clock, calls=calls, current=current, rotated=wbi.get_mixin_key(SUB_KEY, IMG_KEY))
+
+
+# 有效期内重复使用缓存的key，不请求nav接口
+def test_cached_key_reused_within_ttl(nav):
+    assert nav.current() == MIXIN_KEY
+    nav.clock.now += wbi.WBI_KEY_TTL - 1
+    assert nav.current() == MIXIN_KEY
+    assert len(nav.calls) == 1
+
+
+# 超过有效期后重新获取，使用轮换后的key
+def test_key_refetched_after_ttl(nav):
+    assert nav.current() == MIXIN_KEY
+    nav.clock.now += wbi.WBI_KEY_TTL + 1
+    assert nav.current() == nav.rotated
+    assert len(nav.calls) == 2
+    assert wbi._key_state["refreshes"] == 2
+
+
+# 签名被拒绝时强制刷新：距上次获取超过最短间隔时立即重新获取
+def test_forced_refresh_after_min_interval(nav):
+    assert nav.current() == MIXIN_KEY
+    nav.clock.now += wbi.WBI_MIN_REFRESH_INTERVAL
+    assert nav.current(force_refresh=True) == nav.rotated
+    assert len(nav.calls) == 2
+
+
+# 最短间隔内的强制刷新被合并：多个请求同时被拒绝时只请求一次nav接口
+def test_forced_refresh_debounced_within_min_interval(nav):
+    assert nav.current() == MIXIN_KEY
+    nav.clock.now += wbi.WBI_MIN_REFRESH_INTERVAL / 2
+    assert nav.current(force_refresh=True) == MIXIN_KEY
+    assert nav.current(force_refresh=True) == MIXIN_KEY
+    assert len(nav.calls) == 1
+
+    nav.clock.now += wbi.WBI_MIN_REFRESH_INTERVAL / 2
+    assert nav.current(force_refresh=True) == nav.rotated
+    assert len(nav.calls) == 2
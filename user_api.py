@@ -1,7 +1,14 @@
-import sqlite3
 import re
+import json
+import time
+import base64
+import queue
+import asyncio
 import secrets
 import string
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 import smtplib
 from email.mime.text import MIMEText
@@ -12,6 +19,7 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, Field, EmailStr
+import db
 
 # 创建路由器
 router = APIRouter(prefix="/api/user", tags=["用户管理"])
@@ -24,6 +32,17 @@ SECRET_KEY = "bilibili_comments_crawler_secret_key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7天过期
 
+# 已认证用户缓存配置
+USER_CACHE_TTL = 60  # 用户记录的缓存时长（秒），到期后重新查询数据库
+USER_CACHE_SIZE = 1024  # 缓存条目上限，超出时淘汰最久未使用的条目
+
+# 已认证用户缓存：(用户名, 令牌) -> (用户记录, 过期时间)，按用户名失效。
+# 目前只有注册和启动时创建默认管理员会写入users表，两处都会清除同名用户的缓存；
+# 以后新增修改等级、密码或删除用户的接口时，需要在提交后调用invalidate_user_cache
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+user_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
 # 邮件配置
 EMAIL_HOST = 'smtp.qq.com'  # SMTP服务器地址
 EMAIL_PORT = 587  # SMTP服务器端口
@@ -33,40 +52,25 @@ EMAIL_HOST_PASSWORD = ''  # 授权码
 EMAIL_FROM = ''  # 发件人
 EMAIL_USE_TLS = True  # 使用TLS加密（端口587需要TLS）
 
-# 初始化数据库
+# 邮件发送队列配置（单独的发送线程复用SMTP连接）
+MAIL_MAX_ATTEMPTS = 3  # 每封邮件最多尝试发送的次数
+MAIL_RETRY_DELAY = 1.0  # 首次重试前的等待时间（秒），之后每次加倍
+MAIL_IDLE_TIMEOUT = 60.0  # SMTP连接空闲多久后关闭（秒）
+MAIL_SEND_TIMEOUT = 30.0  # 接口等待邮件发送结果的最长时间（秒）
+
+# 密码哈希线程池配置（bcrypt计算时释放GIL，在线程池中执行不阻塞事件循环）
+PASSWORD_HASH_WORKERS = 2
+
+# 注册时读取该邮箱最近一次的验证码
+LATEST_CODE_QUERY = "SELECT code FROM verification_codes WHERE email = ? ORDER BY created_at DESC LIMIT 1"
+
+_password_executor = None
+
+# 初始化用户数据（表结构由 migrations.py 创建）
 def init_user_db():
-    conn = sqlite3.connect('bilibili_CH.db')
+    conn = db.get_connection()
     cursor = conn.cursor()
     
-    # 创建用户表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT NOT NULL UNIQUE,
-        email TEXT NOT NULL UNIQUE,
-        password TEXT NOT NULL,
-        level INTEGER NOT NULL DEFAULT 1,
-        created_at TIMESTAMP NOT NULL
-    )
-    ''')
-    
-    # 创建验证码缓存表
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS verification_codes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT NOT NULL,
-        code TEXT NOT NULL,
-        created_at TIMESTAMP NOT NULL
-    )
-    ''')
-    
-    # 修改爬取记录表，添加用户ID字段
-    try:
-        cursor.execute("ALTER TABLE crawl_records ADD COLUMN user_id INTEGER")
-    except sqlite3.OperationalError:
-        # 如果字段已存在，忽略错误
-        pass
-    
     # 检查是否已有管理员账户，如果没有则创建一个默认管理员
     cursor.execute("SELECT COUNT(*) FROM users WHERE level = 2")
     admin_count = cursor.fetchone()[0]
@@ -80,11 +84,11 @@ def init_user_db():
         )
     
     conn.commit()
-    conn.close()
+    invalidate_user_cache("admin")
 
 # 清理过期验证码
 def clean_expired_codes():
-    conn = sqlite3.connect('bilibili_CH.db')
+    conn = db.get_connection()
     cursor = conn.cursor()
     
     # 删除3分钟前的验证码
@@ -92,7 +96,6 @@ def clean_expired_codes():
     cursor.execute("DELETE FROM verification_codes WHERE created_at < ?", (three_minutes_ago,))
     
     conn.commit()
-    conn.close()
 
 # 密码加密
 def get_password_hash(password: str) -> str:
@@ -102,19 +105,70 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+def _get_password_executor():
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+    return _password_executor
+
+# 在密码哈希线程池中加密密码
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_get_password_executor(), get_password_hash, password)
+
+# 在密码哈希线程池中验证密码
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_get_password_executor(), verify_password, plain_password, hashed_password)
+
 # 生成随机验证码
 def generate_verification_code(length=6):
     return ''.join(secrets.choice(string.digits) for _ in range(length))
 
-# 发送邮件
-def send_email(to_email: str, subject: str, content: str) -> bool:
-    try:
-        message = MIMEText(content, 'html', 'utf-8')
-        # 修复 From 头部格式，符合 RFC5322、RFC2047、RFC822 标准
-        message['From'] = f'=?utf-8?B?QmlsaWJpbGnor7forqLniYjnur8=?= <{EMAIL_FROM}>'
-        message['To'] = Header(to_email, 'utf-8')
-        message['Subject'] = Header(subject, 'utf-8')
-        
+# 构造邮件
+def _build_message(to_email: str, subject: str, content: str) -> MIMEText:
+    message = MIMEText(content, 'html', 'utf-8')
+    # 修复 From 头部格式，符合 RFC5322、RFC2047、RFC822 标准
+    message['From'] = f'=?utf-8?B?QmlsaWJpbGnor7forqLniYjnur8=?= <{EMAIL_FROM}>'
+    message['To'] = Header(to_email, 'utf-8')
+    message['Subject'] = Header(subject, 'utf-8')
+    return message
+
+# 邮件发送队列：单独的线程按顺序发送，复用SMTP连接（空闲超时后关闭），发送失败时重连并重试
+class MailOutbox:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.smtp = None
+        self.lock = threading.Lock()
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "connections": 0}
+
+    # 加入发送队列，返回发送结果（True/False）的Future
+    def submit(self, to_email: str, message: MIMEText) -> Future:
+        future = Future()
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="mail-outbox", daemon=True)
+                self.thread.start()
+        self.queue.put((to_email, message, future))
+        return future
+
+    # 停止发送线程并关闭SMTP连接（应用关闭时调用）
+    def close(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join(timeout=5)
+
+    # 获取SMTP连接：已有连接先用NOOP检查是否可用，不可用时重新连接
+    def _connection(self):
+        if self.smtp is not None:
+            try:
+                if self.smtp.noop()[0] == 250:
+                    return self.smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._disconnect()
+
         if EMAIL_USE_TLS:
             smtp = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
             smtp.starttls()
@@ -122,15 +176,82 @@ def send_email(to_email: str, subject: str, content: str) -> bool:
             smtp = smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT)
         else:
             smtp = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
-            
         smtp.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
-        smtp.sendmail(EMAIL_FROM, [to_email], message.as_string())
-        smtp.quit()
-        return True
+        self.smtp = smtp
+        self.stats["connections"] += 1
+        return smtp
+
+    def _disconnect(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self.smtp.close()
+            self.smtp = None
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=MAIL_IDLE_TIMEOUT)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            if item is None:
+                self._disconnect()
+                return
+            to_email, message, future = item
+            # 调用方等待超时后已取消的邮件不再发送
+            if not future.set_running_or_notify_cancel():
+                continue
+            # 单封邮件出错不能让发送线程退出
+            try:
+                future.set_result(self._send(to_email, message))
+            except Exception as e:
+                print(f"邮件发送线程出错: {str(e)}")
+                self.stats["failed"] += 1
+                if not future.done():
+                    future.set_result(False)
+
+    def _send(self, to_email: str, message: MIMEText) -> bool:
+        for attempt in range(1, MAIL_MAX_ATTEMPTS + 1):
+            try:
+                self._connection().sendmail(EMAIL_FROM, [to_email], message.as_string())
+                self.stats["sent"] += 1
+                return True
+            except smtplib.SMTPRecipientsRefused as e:
+                # 收件人被拒绝时重试没有意义
+                print(f"邮件发送失败: {str(e)}")
+                break
+            except Exception as e:
+                print(f"邮件发送失败（第{attempt}次）: {str(e)}")
+                self._disconnect()
+                if attempt < MAIL_MAX_ATTEMPTS:
+                    self.stats["retries"] += 1
+                    time.sleep(MAIL_RETRY_DELAY * 2 ** (attempt - 1))
+        self.stats["failed"] += 1
+        return False
+
+# 进程内共享的邮件发送队列
+mail_outbox = MailOutbox()
+
+# 发送邮件：交给发送队列，等待发送结果但不阻塞事件循环
+async def send_email(to_email: str, subject: str, content: str) -> bool:
+    try:
+        message = _build_message(to_email, subject, content)
+        future = mail_outbox.submit(to_email, message)
+        return await asyncio.wait_for(asyncio.wrap_future(future), MAIL_SEND_TIMEOUT)
     except Exception as e:
         print(f"邮件发送失败: {str(e)}")
         return False
 
+# 关闭密码哈希线程池和邮件发送队列（应用关闭时调用）
+def shutdown_workers():
+    global _password_executor
+    mail_outbox.close()
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False)
+        _password_executor = None
+
 # 创建访问令牌
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -145,7 +266,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     
     return encoded_jwt
 
-# 获取当前用户
+# 获取当前用户（同一令牌在缓存有效期内不再解码JWT和查询数据库）
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -153,6 +274,18 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    now = time.time()
+    cache_key = (_token_subject(token), token)
+    with _user_cache_lock:
+        cached = _user_cache.get(cache_key)
+        if cached is not None:
+            if cached[1] > now:
+                _user_cache.move_to_end(cache_key)
+                user_cache_stats["hits"] += 1
+                return dict(cached[0])
+            del _user_cache[cache_key]
+        user_cache_stats["misses"] += 1
+    
     try:
         payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -160,20 +293,42 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise credentials_exception
     except pyjwt.PyJWTError:
         raise credentials_exception
-        
-    conn = sqlite3.connect('bilibili_CH.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-    user = cursor.fetchone()
-    conn.close()
     
+    user = await db.run(_find_user, "SELECT * FROM users WHERE username = ?", (username,))
     if user is None:
         raise credentials_exception
     
+    # 缓存到期时间不超过令牌本身的过期时间
+    expires_at = min(now + USER_CACHE_TTL, payload.get("exp", now + USER_CACHE_TTL))
+    with _user_cache_lock:
+        _user_cache[(username, token)] = (user, expires_at)
+        while len(_user_cache) > USER_CACHE_SIZE:
+            _user_cache.popitem(last=False)
+    
     return dict(user)
 
+# 读取令牌中的用户名（不校验签名，仅用于缓存键；未命中缓存时仍会完整校验令牌）
+def _token_subject(token: str) -> Optional[str]:
+    try:
+        segment = token.split(".")[1]
+        payload = json.loads(base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4)))
+    except (IndexError, ValueError, TypeError):
+        return None
+    return payload.get("sub") if isinstance(payload, dict) else None
+
+# 查询单个用户（在数据库线程池中执行）
+def _find_user(query: str, params) -> Optional[dict]:
+    row = db.get_connection().execute(query, params).fetchone()
+    return dict(row) if row else None
+
+# 用户等级、密码等信息变更或删除用户后清除其缓存（username为None时清空全部）
+def invalidate_user_cache(username: str = None):
+    with _user_cache_lock:
+        keys = [key for key in _user_cache if username is None or key[0] == username]
+        for key in keys:
+            del _user_cache[key]
+        user_cache_stats["invalidations"] += len(keys)
+
 # 请求模型
 class UserRegister(BaseModel):
     username: str = Field(..., min_length=3, max_length=20)
@@ -202,54 +357,78 @@ class UserInfo(BaseModel):
     email: str
     level: int
 
-# API路由
-@router.post("/register", response_model=Token)
-async def register(user: UserRegister):
+# 注册前检查用户名、邮箱是否已存在以及验证码是否正确
+def _check_registration(user: UserRegister):
     # 清理过期验证码
     clean_expired_codes()
     
-    # 验证用户名格式
-    if not re.match(r'^[a-zA-Z0-9_]{3,20}$', user.username):
-        raise HTTPException(status_code=400, detail="用户名只能包含字母、数字和下划线，长度为3-20个字符")
-    
-    conn = sqlite3.connect('bilibili_CH.db')
+    conn = db.get_connection()
     cursor = conn.cursor()
     
     # 验证用户名是否已存在
     cursor.execute("SELECT id FROM users WHERE username = ?", (user.username,))
     if cursor.fetchone():
-        conn.close()
         raise HTTPException(status_code=400, detail="用户名已存在")
     
     # 验证邮箱是否已存在
     cursor.execute("SELECT id FROM users WHERE email = ?", (user.email,))
     if cursor.fetchone():
-        conn.close()
         raise HTTPException(status_code=400, detail="邮箱已被注册")
     
     # 验证验证码
-    cursor.execute("SELECT code FROM verification_codes WHERE email = ? ORDER BY created_at DESC LIMIT 1", (user.email,))
+    cursor.execute(LATEST_CODE_QUERY, (user.email,))
     code_record = cursor.fetchone()
     
     if not code_record or code_record[0] != user.code:
-        conn.close()
         raise HTTPException(status_code=400, detail="验证码错误或已过期")
-    
-    # 创建用户
-    hashed_password = get_password_hash(user.password)
+
+# 保存新用户并删除已使用的验证码
+def _create_user(user: UserRegister, hashed_password: str):
+    conn = db.get_connection()
+    cursor = conn.cursor()
     
     cursor.execute(
         "INSERT INTO users (username, email, password, level, created_at) VALUES (?, ?, ?, ?, ?)",
         (user.username, user.email, hashed_password, 1, datetime.now())
     )
     
-    user_id = cursor.lastrowid
-    
     # 删除已使用的验证码
     cursor.execute("DELETE FROM verification_codes WHERE email = ?", (user.email,))
     
     conn.commit()
-    conn.close()
+    invalidate_user_cache(user.username)
+
+# 保存验证码（同一邮箱只保留最新的一个）
+def _store_verification_code(email: str, code: str):
+    # 清理过期验证码
+    clean_expired_codes()
+    
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    
+    # 删除旧的验证码
+    cursor.execute("DELETE FROM verification_codes WHERE email = ?", (email,))
+    
+    cursor.execute(
+        "INSERT INTO verification_codes (email, code, created_at) VALUES (?, ?, ?)",
+        (email, code, datetime.now())
+    )
+    
+    conn.commit()
+
+# API路由
+@router.post("/register", response_model=Token)
+async def register(user: UserRegister):
+    # 验证用户名格式
+    if not re.match(r'^[a-zA-Z0-9_]{3,20}$', user.username):
+        raise HTTPException(status_code=400, detail="用户名只能包含字母、数字和下划线，长度为3-20个字符")
+    
+    # 检查用户名、邮箱和验证码
+    await db.run(_check_registration, user)
+    
+    # 创建用户
+    hashed_password = await hash_password_async(user.password)
+    await db.run(_create_user, user, hashed_password)
     
     # 生成访问令牌
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -267,30 +446,13 @@ async def register(user: UserRegister):
 
 @router.post("/send_email_code")
 async def send_verification_code(email_data: EmailVerification):
-    # 清理过期验证码
-    clean_expired_codes()
-    
     # 检查邮箱格式
     if not re.match(r'^[\w\.-]+@([\w-]+\.)+[\w-]{2,4}$', email_data.email.lower()):
         raise HTTPException(status_code=400, detail="邮箱格式不正确")
     
-    # 生成验证码
+    # 生成并存储验证码
     code = generate_verification_code()
-    
-    # 存储验证码
-    conn = sqlite3.connect('bilibili_CH.db')
-    cursor = conn.cursor()
-    
-    # 删除旧的验证码
-    cursor.execute("DELETE FROM verification_codes WHERE email = ?", (email_data.email,))
-    
-    cursor.execute(
-        "INSERT INTO verification_codes (email, code, created_at) VALUES (?, ?, ?)",
-        (email_data.email, code, datetime.now())
-    )
-    
-    conn.commit()
-    conn.close()
+    await db.run(_store_verification_code, email_data.email, code)
     
     # 发送验证码邮件
     email_content = f"""
@@ -305,7 +467,7 @@ async def send_verification_code(email_data: EmailVerification):
     </div>
     """
     
-    success = send_email(
+    success = await send_email(
         to_email=email_data.email,
         subject="Bilibili评论爬虫 - 邮箱验证码",
         content=email_content
@@ -318,16 +480,10 @@ async def send_verification_code(email_data: EmailVerification):
 
 @router.post("/login", response_model=Token)
 async def login_for_access_token(form_data: UserLogin):
-    conn = sqlite3.connect('bilibili_CH.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
     # 查询用户（支持用户名或邮箱登录）
-    cursor.execute("SELECT * FROM users WHERE username = ? OR email = ?", (form_data.username, form_data.username))
-    user = cursor.fetchone()
-    conn.close()
+    user = await db.run(_find_user, "SELECT * FROM users WHERE username = ? OR email = ?", (form_data.username, form_data.username))
     
-    if not user or not verify_password(form_data.password, user["password"]):
+    if not user or not await verify_password_async(form_data.password, user["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
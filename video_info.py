@@ -0,0 +1,98 @@
+import re
+import time
+
+import db
+from crawler import http_get, fetch_json
+
+# 视频信息缓存配置
+VIDEO_CACHE_TTL = 24 * 3600  # 缓存有效期（秒），过期后重新请求
+VIDEO_CACHE_MAX_ENTRIES = 5000  # 缓存条目上限，超出时淘汰最久未使用的条目
+
+# 淘汰最久未使用的缓存条目，只保留最近使用的 VIDEO_CACHE_MAX_ENTRIES 条
+EVICT_QUERY = """
+DELETE FROM video_cache WHERE bv IN (
+    SELECT bv FROM video_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+)
+"""
+
+VIEW_API_URL = "https://api.bilibili.com/x/web-interface/view?bvid={bv}"
+VIDEO_PAGE_URL = "https://www.bilibili.com/video/{bv}/"
+
+_TITLE_RE = re.compile(r'<title data-vue-meta="true">(?P<title>.*?)</title>')
+
+# 视频信息缓存统计
+cache_stats = {"hits": 0, "misses": 0, "api": 0, "html": 0}
+
+# 通过BV号获取视频信息 {"oid", "title", "reply_count"}，优先使用缓存
+async def resolve_video(bv: str) -> dict:
+    info = await db.run(_read_cache, bv, time.time())
+    if info is not None:
+        cache_stats["hits"] += 1
+        return info
+
+    cache_stats["misses"] += 1
+    info = await _fetch_from_api(bv)
+    if info is None:
+        info = await _fetch_from_page(bv)
+    await db.run(_store_cache, bv, info, time.time())
+    return info
+
+# 读取未过期的缓存并更新最近使用时间，没有时返回None
+def _read_cache(bv: str, now: float):
+    conn = db.get_connection()
+    row = conn.execute(
+        "SELECT oid, title, reply_count, fetched_at FROM video_cache WHERE bv = ?", (bv,)
+    ).fetchone()
+    if row is None or now - row["fetched_at"] >= VIDEO_CACHE_TTL:
+        return None
+    with db.transaction(conn):
+        conn.execute("UPDATE video_cache SET last_used = ? WHERE bv = ?", (now, bv))
+    return {"oid": row["oid"], "title": row["title"], "reply_count": row["reply_count"]}
+
+# 保存视频信息，超出上限时淘汰最久未使用的条目
+def _store_cache(bv: str, info: dict, now: float):
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("""
+        INSERT OR REPLACE INTO video_cache (bv, oid, title, reply_count, fetched_at, last_used)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, (bv, info["oid"], info["title"], info["reply_count"], now, now))
+        conn.execute(EVICT_QUERY, (VIDEO_CACHE_MAX_ENTRIES,))
+
+# 使视频信息缓存失效（如视频标题变更）
+def invalidate_video(bv: str):
+    conn = db.get_connection()
+    with db.transaction(conn):
+        conn.execute("DELETE FROM video_cache WHERE bv = ?", (bv,))
+
+# 视频详情接口（JSON，体积小），失败时返回None（有页面备用方案，被限流时不重试）
+async def _fetch_from_api(bv: str):
+    try:
+        resp = await fetch_json(VIEW_API_URL.format(bv=bv), attempts=1)
+    except Exception as e:
+        print(f"视频详情接口请求失败（{bv}）：{e}")
+        return None
+    if resp.get("code") != 0 or not resp.get("data"):
+        return None
+    data = resp["data"]
+    cache_stats["api"] += 1
+    return {
+        "oid": str(data["aid"]),
+        "title": data.get("title") or "未识别",
+        "reply_count": (data.get("stat") or {}).get("reply"),
+    }
+
+# 备用方案：从视频页面HTML中提取oid和标题
+async def _fetch_from_page(bv: str):
+    resp = await http_get(VIDEO_PAGE_URL.format(bv=bv))
+    match = re.search(f'"aid":(?P<id>\\d+),"bvid":"{re.escape(bv)}"', resp.text)
+    if match is None:
+        raise ValueError(f"无法获取视频信息：{bv}")
+
+    title = _TITLE_RE.search(resp.text)
+    cache_stats["html"] += 1
+    return {
+        "oid": match.group("id"),
+        "title": title.group("title") if title else "未识别",
+        "reply_count": None,
+    }
@@ -0,0 +1,86 @@
+import time
+import hashlib
+import urllib.parse
+
+# WBI签名配置
+NAV_URL = "https://api.bilibili.com/x/web-interface/nav"
+WBI_KEY_TTL = 6 * 3600  # mixin key 的缓存时长（秒），到期后重新从nav接口获取
+WBI_MIN_REFRESH_INTERVAL = 30.0  # 签名被拒绝时强制刷新的最短间隔（秒）
+WBI_REJECTED_CODE = -352  # 签名校验失败时接口返回的code
+DEFAULT_MIXIN_KEY = "ea1db124af3c7062474693fa704f4ff8"  # nav接口不可用时使用的mixin key
+
+# 由 img_key + sub_key 重排得到 mixin key 的下标表
+MIXIN_KEY_ENC_TAB = [
+    46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
+    33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
+    61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
+    36, 20, 34, 44, 52,
+]
+
+# 签名前从参数值中去掉的字符
+_FILTERED_CHARS = str.maketrans("", "", "!'()*")
+
+# 当前使用的mixin key及获取时间
+_key_state = {"mixin_key": None, "fetched_at": 0.0, "expires_at": 0.0, "refreshes": 0, "failures": 0}
+
+# 由img_key和sub_key生成mixin key
+def get_mixin_key(img_key: str, sub_key: str) -> str:
+    raw = img_key + sub_key
+    return "".join(raw[i] for i in MIXIN_KEY_ENC_TAB if i < len(raw))[:32]
+
+# 从图片地址中取出key（文件名去掉扩展名）
+def _key_from_url(url: str) -> str:
+    return url.rsplit("/", 1)[-1].split(".", 1)[0]
+
+# 对参数签名：加入wts，按键排序、过滤特殊字符后编码，w_rid = md5(查询串 + mixin key)；返回带签名的参数
+def sign_params(params: dict, mixin_key: str, wts: int = None) -> dict:
+    signed = dict(params)
+    signed["wts"] = int(time.time()) if wts is None else wts
+    signed = {
+        key: str(signed[key]).translate(_FILTERED_CHARS)
+        for key in sorted(signed)
+    }
+    query = urllib.parse.urlencode(signed)
+    signed["w_rid"] = hashlib.md5((query + mixin_key).encode("utf-8")).hexdigest()
+    return signed
+
+# 生成带签名的请求地址
+def sign_url(base_url: str, params: dict, mixin_key: str, wts: int = None) -> str:
+    return base_url + "?" + urllib.parse.urlencode(sign_params(params, mixin_key, wts))
+
+# 获取当前的mixin key：缓存过期或force_refresh时通过nav接口刷新（fetch为发送请求并解析JSON的协程函数），
+# 刷新失败时继续使用旧key，从未成功获取过时使用默认key
+async def current_mixin_key(fetch, force_refresh: bool = False) -> str:
+    now = time.time()
+    fresh = now < _key_state["expires_at"]
+    if force_refresh and now - _key_state["fetched_at"] >= WBI_MIN_REFRESH_INTERVAL:
+        fresh = False
+    if _key_state["mixin_key"] and fresh:
+        return _key_state["mixin_key"]
+
+    try:
+        # 未登录时nav接口返回code -101，但仍包含wbi_img
+        wbi_img = (await fetch(NAV_URL))["data"]["wbi_img"]
+        mixin_key = get_mixin_key(_key_from_url(wbi_img["img_url"]), _key_from_url(wbi_img["sub_url"]))
+    except Exception as e:
+        _key_state["failures"] += 1
+        # 失败后间隔一段时间再重试，避免每个请求都去请求nav接口
+        _key_state["expires_at"] = now + WBI_MIN_REFRESH_INTERVAL
+        print(f"获取WBI签名密钥失败：{e}")
+        if not _key_state["mixin_key"]:
+            _key_state["mixin_key"] = DEFAULT_MIXIN_KEY
+        return _key_state["mixin_key"]
+
+    if mixin_key != _key_state["mixin_key"]:
+        print("WBI签名密钥已更新")
+    _key_state.update(mixin_key=mixin_key, fetched_at=now, expires_at=now + WBI_KEY_TTL)
+    _key_state["refreshes"] += 1
+    return mixin_key
+
+# 签名密钥状态
+def key_stats() -> dict:
+    return {
+        "refreshes": _key_state["refreshes"],
+        "failures": _key_state["failures"],
+        "key_age_seconds": round(time.time() - _key_state["fetched_at"], 1) if _key_state["fetched_at"] else None,
+    }
@@ -133,6 +133,48 @@ export const getCrawlRecordDetail = (id) => {
   return crawlApi.get(`/crawl_records/${id}`)
 }
 
+// 获取爬取记录的评论分布统计（服务端聚合）
+export const getCrawlRecordStats = (id, filters = {}) => {
+  const params = {}
+  
+  // 添加筛选参数，只有非空值才会被传递
+  if (filters.username) params.username = filters.username
+  if (filters.keyword) params.keyword = filters.keyword
+  if (filters.gender) params.gender = filters.gender
+  if (filters.minReplyCount !== undefined && filters.minReplyCount !== null) params.min_reply_count = filters.minReplyCount
+  if (filters.maxReplyCount !== undefined && filters.maxReplyCount !== null) params.max_reply_count = filters.maxReplyCount
+  if (filters.minLikeCount !== undefined && filters.minLikeCount !== null) params.min_like_count = filters.minLikeCount
+  if (filters.maxLikeCount !== undefined && filters.maxLikeCount !== null) params.max_like_count = filters.maxLikeCount
+  if (filters.showSecondLevel !== undefined && filters.showSecondLevel !== null) params.show_second_level = filters.showSecondLevel
+  if (filters.userLevel !== undefined && filters.userLevel !== null) params.user_level = filters.userLevel
+  if (filters.isVip) params.is_vip = filters.isVip
+  if (filters.startTime) params.start_time = filters.startTime
+  if (filters.endTime) params.end_time = filters.endTime
+  
+  return crawlApi.get(`/crawl_records/${id}/stats`, { params })
+}
+
+// 获取爬取记录的高回复/高点赞评论词云（服务端分词）
+export const getCrawlRecordKeywords = (id, filters = {}) => {
+  const params = {}
+  
+  // 添加筛选参数，只有非空值才会被传递
+  if (filters.username) params.username = filters.username
+  if (filters.keyword) params.keyword = filters.keyword
+  if (filters.gender) params.gender = filters.gender
+  if (filters.minReplyCount !== undefined && filters.minReplyCount !== null) params.min_reply_count = filters.minReplyCount
+  if (filters.maxReplyCount !== undefined && filters.maxReplyCount !== null) params.max_reply_count = filters.maxReplyCount
+  if (filters.minLikeCount !== undefined && filters.minLikeCount !== null) params.min_like_count = filters.minLikeCount
+  if (filters.maxLikeCount !== undefined && filters.maxLikeCount !== null) params.max_like_count = filters.maxLikeCount
+  if (filters.showSecondLevel !== undefined && filters.showSecondLevel !== null) params.show_second_level = filters.showSecondLevel
+  if (filters.userLevel !== undefined && filters.userLevel !== null) params.user_level = filters.userLevel
+  if (filters.isVip) params.is_vip = filters.isVip
+  if (filters.startTime) params.start_time = filters.startTime
+  if (filters.endTime) params.end_time = filters.endTime
+  
+  return crawlApi.get(`/crawl_records/${id}/keywords`, { params })
+}
+
 export const getComments = (crawlId, page = 1, pageSize = 30, filters = {}) => {
   const params = {
     page,
@@ -152,24 +194,55 @@ export const getComments = (crawlId, page = 1, pageSize = 30, filters = {}) => {
   if (filters.isVip) params.is_vip = filters.isVip
   if (filters.startTime) params.start_time = filters.startTime
   if (filters.endTime) params.end_time = filters.endTime
+  if (filters.orderBy) params.order_by = filters.orderBy
+  
+  // 游标分页：cursor为上一页返回的next_cursor（首页传空字符串），此时忽略page
+  if (filters.cursor !== undefined && filters.cursor !== null) {
+    delete params.page
+    params.cursor = filters.cursor
+    if (filters.withTotal) params.with_total = true
+  }
   
   return crawlApi.get(`/comments/${crawlId}`, { params })
 }
 
+// 跨爬取记录搜索评论
+export const searchComments = (keyword, page = 1, pageSize = 30, options = {}) => {
+  const params = {
+    keyword,
+    page,
+    page_size: pageSize
+  }
+  if (options.searchSignature) params.search_signature = true
+  if (options.orderBy) params.order_by = options.orderBy
+  
+  return crawlApi.get('/search/comments', { params })
+}
+
 // 删除爬取记录
 export const deleteCrawlRecord = (recordId) => {
   return crawlApi.delete(`/crawl_records/${recordId}`)
 }
 
-// 下载爬取记录 (CSV)
-export const downloadCrawlRecord = (recordId) => {
+// 从断点继续爬取
+export const resumeCrawlRecord = (recordId) => {
+  return crawlApi.post(`/crawl_records/${recordId}/resume`)
+}
+
+// 下载爬取记录（默认CSV，options.format可选 csv/jsonl/parquet/arrow，options.compression可选 gzip/zstd）
+export const downloadCrawlRecord = (recordId, options = {}) => {
+  const params = {}
+  if (options.format) params.format = options.format
+  if (options.compression) params.compression = options.compression
+  
   return crawlApi.get(`/crawl_records/${recordId}/download`, {
+    params,
     responseType: 'blob' // 重要：确保响应类型为 blob 以下载文件
   })
 }
 
-// 下载评论数据 (CSV)
-export const downloadComments = (crawlId, filters = {}) => {
+// 下载评论数据（默认CSV，格式和压缩方式同 downloadCrawlRecord）
+export const downloadComments = (crawlId, filters = {}, options = {}) => {
   const params = {}
   
   // 添加筛选参数，只有非空值才会被传递
@@ -185,6 +258,8 @@ export const downloadComments = (crawlId, filters = {}) => {
   if (filters.isVip) params.is_vip = filters.isVip
   if (filters.startTime) params.start_time = filters.startTime
   if (filters.endTime) params.end_time = filters.endTime
+  if (options.format) params.format = options.format
+  if (options.compression) params.compression = options.compression
   
   return crawlApi.get(`/comments/${crawlId}/download`, {
     params,
@@ -201,8 +276,12 @@ export default {
   crawlComments,
   getCrawlRecords,
   getCrawlRecordDetail,
+  getCrawlRecordStats,
+  getCrawlRecordKeywords,
   getComments,
+  searchComments,
   deleteCrawlRecord,
+  resumeCrawlRecord,
   downloadCrawlRecord,
   downloadComments
 }
\ No newline at end of file
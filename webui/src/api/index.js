@@ -10,8 +10,12 @@ export const {
   crawlComments,
   getCrawlRecords,
   getCrawlRecordDetail,
+  getCrawlRecordStats,
+  getCrawlRecordKeywords,
   getComments,
+  searchComments,
   deleteCrawlRecord,
+  resumeCrawlRecord,
   downloadCrawlRecord,
   downloadComments
 } = apiModule
@@ -126,6 +126,19 @@ export const useCrawlerStore = defineStore('crawler', {
       }
     },
 
+    // 从断点继续爬取
+    async resumeCrawlRecord(recordId) {
+      this.error = null
+      try {
+        const response = await api.resumeCrawlRecord(recordId)
+        await this.fetchCrawlRecords()
+        return response
+      } catch (error) {
+        this.error = error.response?.data?.detail || '继续爬取失败'
+        throw error
+      }
+    },
+
     // 下载爬取记录 (CSV)
     async downloadCrawlRecord(recordId) {
       this.error = null
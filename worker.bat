@@ -0,0 +1,3 @@
+call .venv\Scripts\activate
+python worker.py
+pause
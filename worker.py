@@ -0,0 +1,37 @@
+import sys
+import signal
+import asyncio
+
+import db
+import migrations
+import scheduler
+from crawler import close_http_client
+
+# 独立的爬取任务工作进程：从共享数据库按租约领取爬取任务并执行，可以同时启动多个，
+# 与API服务分开扩容（此时将 scheduler.EMBEDDED_WORKER 设为False，API进程只负责接收任务）
+# 用法：python worker.py [最大并发任务数]
+async def main(capacity: int):
+    migrations.migrate()
+    worker = scheduler.CrawlWorker(capacity)
+
+    # 收到停止信号时把运行中的任务放回队列再退出（Windows不支持信号处理，Ctrl+C时同样会执行清理）
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    await worker.start()
+    try:
+        await stop.wait()
+    finally:
+        print("正在停止工作进程，运行中的任务将放回队列")
+        await worker.stop()
+        await close_http_client()
+        db.shutdown_pool()
+        db.close_all()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else scheduler.MAX_CONCURRENT_CRAWLS))